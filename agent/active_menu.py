@@ -0,0 +1,98 @@
+"""Teks menu/PDF aktif yang disimpan di memori.
+
+``GET /pdf-text`` dipanggil di awal setiap panggilan suara, setiap pesan
+WhatsApp dan oleh dashboard. Teks aktif, body JSON-nya dan versi gzip-nya
+disiapkan sekali setiap kali PDF aktif berganti, lalu disajikan langsung
+dari memori dengan ETag. File ``pdf_text_cache.txt`` tetap ditulis supaya
+teks aktif bertahan setelah restart.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable
+
+logger = logging.getLogger("active-menu")
+
+
+class Snapshot:
+    """Satu versi teks aktif beserta body response yang sudah jadi."""
+
+    __slots__ = ("_gzip_body", "body", "etag", "source", "text", "updated_at", "version")
+
+    def __init__(self, text: str, version: int, source: str | None, updated_at: str):
+        self.text = text
+        self.version = version
+        self.source = source
+        self.updated_at = updated_at
+        self.etag = '"' + hashlib.sha256(text.encode("utf-8")).hexdigest()[:32] + '"'
+        self.body = json.dumps({"text": text, "version": version}, ensure_ascii=False).encode("utf-8")
+        self._gzip_body: bytes | None = None
+
+    @property
+    def gzip_body(self) -> bytes:
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body, compresslevel=6)
+        return self._gzip_body
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "etag": self.etag,
+            "length": len(self.text),
+            "source": self.source,
+            "updated_at": self.updated_at,
+        }
+
+
+class ActiveMenuText:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[Snapshot], None]] = []
+        self._snapshot = Snapshot("", 0, None, datetime.now().isoformat())
+
+    @property
+    def current(self) -> Snapshot:
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[Snapshot], None]) -> None:
+        """Callback yang dipanggil setiap kali teks aktif berganti."""
+        self._listeners.append(listener)
+
+    def load(self) -> None:
+        """Muat teks aktif terakhir dari disk (dipanggil saat startup)."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            text = f.read()
+        mtime = os.path.getmtime(self.path)
+        self._publish(Snapshot(text, int(mtime * 1000), None, datetime.fromtimestamp(mtime).isoformat()))
+
+    def set(self, text: str, source: str | None = None) -> Snapshot:
+        """Ganti teks aktif: tulis file secara atomik lalu naikkan versi."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+            # Versi berbasis waktu agar tetap naik setelah restart
+            version = max(int(time.time() * 1000), self._snapshot.version + 1)
+            snapshot = Snapshot(text, version, source, datetime.now().isoformat())
+            self._publish(snapshot)
+        logger.info(f"Active PDF text updated: version {version}, {len(text)} characters")
+        return snapshot
+
+    def _publish(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Active menu listener failed")
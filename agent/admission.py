@@ -0,0 +1,456 @@
+"""Admission control untuk session realtime voice agent.
+
+``AdmissionQueue`` berjalan di pdf_api dan memegang slot session realtime
+untuk seluruh deployment (``max_sessions``) sekaligus per worker
+(``max_per_worker``). Penelepon yang tidak kebagian slot masuk antrian FIFO
+dan mendapat posisi serta perkiraan waktu tunggu. Job voice agent memakai
+``AdmissionTicket``: minta slot lewat ``POST /admission/acquire`` (diulang
+setiap ``poll_interval`` selama menunggu), memperpanjang lease selama
+panggilan, dan melepasnya lewat ``POST /admission/release``.
+
+Slot adalah lease: worker yang mati tanpa release tidak menahan slot lebih
+dari ``lease_ttl`` detik, dan penelepon antri yang berhenti polling (sudah
+menutup telepon) dikeluarkan setelah ``wait_ttl`` detik.
+
+Perkiraan waktu tunggu memakai rata-rata durasi panggilan (EWMA dari
+panggilan yang selesai): sisa waktu setiap session aktif diurutkan, dan
+posisi ke-k mendapat slot ke-k yang diperkirakan lepas lebih dulu.
+
+Dengan ``export_metrics=True`` (instance milik pdf_api) kedalaman antrian,
+jumlah session aktif, waktu tunggu dan kejadian admission juga dicatat di
+registry Prometheus (``telemetry``) sehingga ikut di-scrape dari ``/metrics``.
+
+``simulate_burst`` menjalankan simulasi lonjakan panggilan terhadap model
+realtime tiruan, dengan dan tanpa admission; lihat ``python admission.py``.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Awaitable
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from telemetry import (
+    ADMISSION_ACTIVE_SESSIONS,
+    ADMISSION_EVENTS,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_WAIT_SECONDS,
+)
+
+logger = logging.getLogger("admission")
+
+# Sisa waktu minimum untuk session yang sudah melewati rata-rata durasi
+MIN_REMAINING = 5.0
+DURATION_ALPHA = 0.1
+
+
+@dataclass
+class _Waiting:
+    session_id: str
+    worker_id: str | None
+    enqueued_at: float
+    last_seen: float
+
+
+@dataclass
+class _Lease:
+    session_id: str
+    worker_id: str | None
+    admitted_at: float
+    expires_at: float
+
+
+def _percentile(values, point: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(point / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+class AdmissionQueue:
+    """Slot session realtime + antrian FIFO; ``max_sessions`` 0 berarti tanpa batas."""
+
+    def __init__(
+        self,
+        max_sessions: int,
+        max_per_worker: int = 0,
+        lease_ttl: float = 30.0,
+        wait_ttl: float = 15.0,
+        expected_call_seconds: float = 180.0,
+        history: int = 1000,
+        export_metrics: bool = False,
+    ):
+        self.max_sessions = max_sessions
+        self.max_per_worker = max_per_worker
+        self.lease_ttl = lease_ttl
+        self.wait_ttl = wait_ttl
+        self.avg_call_seconds = expected_call_seconds
+        self._lock = threading.Lock()
+        self._active: dict[str, _Lease] = {}
+        self._per_worker: dict[str, int] = {}
+        self._waiting: OrderedDict[str, _Waiting] = OrderedDict()
+        self._waits: deque[float] = deque(maxlen=history)
+        self.counters = {"admitted": 0, "queued": 0, "abandoned": 0, "expired": 0, "routed": 0}
+        self.export_metrics = export_metrics
+
+    # ---------------------------------------------------------------- slots
+
+    def acquire(self, session_id: str, worker_id: str | None = None, now: float | None = None) -> dict[str, Any]:
+        """Minta (atau perpanjang) slot; jika penuh, masuk/tetap di antrian."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            lease = self._active.get(session_id)
+            if lease is not None:
+                lease.expires_at = now + self.lease_ttl
+                return {"admitted": True, "lease_ttl": self.lease_ttl}
+            waiting = self._waiting.get(session_id)
+            if waiting is None:
+                waiting = _Waiting(session_id, worker_id, now, now)
+                self._waiting[session_id] = waiting
+                self._count("queued")
+            waiting.last_seen = now
+            self._promote(now)
+            self._publish()
+            if session_id in self._active:
+                return {
+                    "admitted": True,
+                    "lease_ttl": self.lease_ttl,
+                    "waited_seconds": round(now - waiting.enqueued_at, 3),
+                }
+            position = list(self._waiting).index(session_id) + 1
+            return {
+                "admitted": False,
+                "position": position,
+                "queue_depth": len(self._waiting),
+                "eta_seconds": round(self._eta(position, now), 1),
+            }
+
+    def release(self, session_id: str, routed: bool = False, now: float | None = None) -> str | None:
+        """Lepas slot atau keluar dari antrian; 'active'/'waiting', None jika tidak dikenal."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if routed:
+                self._count("routed")
+            lease = self._active.get(session_id)
+            if lease is not None:
+                self._drop_lease(lease)
+                duration = now - lease.admitted_at
+                self.avg_call_seconds += DURATION_ALPHA * (duration - self.avg_call_seconds)
+                self._promote(now)
+                self._publish()
+                return "active"
+            if self._waiting.pop(session_id, None) is not None:
+                if not routed:
+                    self._count("abandoned")
+                self._publish()
+                return "waiting"
+            return None
+
+    def _has_slot(self, worker_id: str | None) -> bool:
+        if self.max_sessions > 0 and len(self._active) >= self.max_sessions:
+            return False
+        if self.max_per_worker > 0 and worker_id is not None:
+            return self._per_worker.get(worker_id, 0) < self.max_per_worker
+        return True
+
+    def _promote(self, now: float) -> None:
+        # FIFO; entry yang worker-nya penuh dilewati tanpa kehilangan posisi
+        for waiting in list(self._waiting.values()):
+            if self.max_sessions > 0 and len(self._active) >= self.max_sessions:
+                break
+            if not self._has_slot(waiting.worker_id):
+                continue
+            del self._waiting[waiting.session_id]
+            self._active[waiting.session_id] = _Lease(waiting.session_id, waiting.worker_id, now, now + self.lease_ttl)
+            if waiting.worker_id is not None:
+                self._per_worker[waiting.worker_id] = self._per_worker.get(waiting.worker_id, 0) + 1
+            waited = now - waiting.enqueued_at
+            self._waits.append(waited)
+            self._count("admitted")
+            if self.export_metrics:
+                ADMISSION_WAIT_SECONDS.observe(waited)
+
+    def _drop_lease(self, lease: _Lease) -> None:
+        del self._active[lease.session_id]
+        if lease.worker_id is not None:
+            remaining = self._per_worker.get(lease.worker_id, 1) - 1
+            if remaining > 0:
+                self._per_worker[lease.worker_id] = remaining
+            else:
+                self._per_worker.pop(lease.worker_id, None)
+
+    def _expire(self, now: float) -> None:
+        expired = [lease for lease in self._active.values() if lease.expires_at <= now]
+        for lease in expired:
+            logger.warning(f"Admission lease for {lease.session_id} expired without release")
+            self._drop_lease(lease)
+            self._count("expired")
+        stale = [w.session_id for w in self._waiting.values() if now - w.last_seen > self.wait_ttl]
+        for session_id in stale:
+            del self._waiting[session_id]
+            self._count("abandoned")
+        if expired or stale:
+            self._promote(now)
+            self._publish()
+
+    def _count(self, event: str) -> None:
+        self.counters[event] += 1
+        if self.export_metrics:
+            ADMISSION_EVENTS.labels(event).inc()
+
+    def _publish(self) -> None:
+        if self.export_metrics:
+            ADMISSION_ACTIVE_SESSIONS.set(len(self._active))
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiting))
+
+    def _eta(self, position: int, now: float) -> float:
+        if self.max_sessions <= 0:
+            return 0.0
+        free = self.max_sessions - len(self._active)
+        if position <= free:
+            return 0.0
+        remaining = sorted(
+            max(self.avg_call_seconds - (now - lease.admitted_at), MIN_REMAINING) for lease in self._active.values()
+        )
+        k = position - max(free, 0) - 1
+        if not remaining:
+            return self.avg_call_seconds
+        return remaining[k % len(remaining)] + (k // len(remaining)) * self.avg_call_seconds
+
+    # ---------------------------------------------------------------- metrics
+
+    def metrics(self, now: float | None = None) -> dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            waits = list(self._waits)
+            oldest = next(iter(self._waiting.values()), None)
+            return {
+                "max_sessions": self.max_sessions,
+                "max_per_worker": self.max_per_worker,
+                "active": len(self._active),
+                "per_worker": dict(self._per_worker),
+                "queue_depth": len(self._waiting),
+                "oldest_wait_seconds": round(now - oldest.enqueued_at, 1) if oldest else 0.0,
+                "avg_call_seconds": round(self.avg_call_seconds, 1),
+                "wait_seconds": {
+                    "count": len(waits),
+                    "p50": _percentile(waits, 50),
+                    "p95": _percentile(waits, 95),
+                    "p99": _percentile(waits, 99),
+                },
+                **{f"{name}_total": count for name, count in self.counters.items()},
+            }
+
+
+# POST JSON ke pdf_api: (status, body); mis. ConversationLogger.post
+Post = Callable[[str, dict[str, Any]], Awaitable[tuple[int, Any]]]
+
+
+class AdmissionTicket:
+    """Slot admission satu panggilan, dipegang oleh job voice agent."""
+
+    def __init__(self, post: Post, session_id: str, worker_id: str | None = None, poll_interval: float = 1.0, renew_interval: float = 10.0):
+        self._post = post
+        self.session_id = session_id
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.renew_interval = renew_interval
+        self.waited = 0.0
+        self._renewal: asyncio.Task | None = None
+        self._released = False
+
+    def _payload(self, **fields: Any) -> dict[str, Any]:
+        # Field None tidak dikirim (model pydantic API tidak menerima null)
+        fields = {"session_id": self.session_id, "worker_id": self.worker_id, **fields}
+        return {key: value for key, value in fields.items() if value is not None}
+
+    async def wait(self, max_wait: float, on_wait: Callable[[dict[str, Any]], None] | None = None) -> bool:
+        """True jika mendapat slot; False jika penelepon sebaiknya dialihkan.
+
+        Dialihkan jika perkiraan waktu tunggu atau waktu yang sudah dilewati
+        melebihi ``max_wait``. Jika API admission tidak bisa dihubungi,
+        panggilan tetap diterima (fail-open).
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            try:
+                status, body = await self._post("/admission/acquire", self._payload())
+            except Exception as e:
+                logger.warning(f"Admission check failed, admitting {self.session_id}: {e}", exc_info=True)
+                return True
+            if status != 200:
+                logger.warning(f"Admission check returned {status}, admitting {self.session_id}")
+                return True
+            self.waited = loop.time() - started
+            if body["admitted"]:
+                self._renewal = asyncio.create_task(self._renew())
+                return True
+            if body["eta_seconds"] > max_wait or self.waited >= max_wait:
+                return False
+            if on_wait is not None:
+                on_wait(body)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self._post("/admission/acquire", self._payload())
+            except Exception as e:
+                logger.warning(f"Admission lease renewal failed for {self.session_id}: {e}", exc_info=True)
+
+    async def release(self, routed_to: str | None = None, caller_phone: str | None = None) -> None:
+        """Lepas slot/antrian; aman dipanggil lebih dari sekali."""
+        if self._released:
+            return
+        self._released = True
+        if self._renewal is not None:
+            self._renewal.cancel()
+            await asyncio.gather(self._renewal, return_exceptions=True)
+        try:
+            status, body = await self._post("/admission/release", self._payload(routed_to=routed_to, caller_phone=caller_phone))
+            if status != 200:
+                logger.warning(f"Admission release for {self.session_id} returned {status}: {body}")
+        except Exception as e:
+            logger.warning(f"Admission release failed for {self.session_id}: {e}", exc_info=True)
+
+
+# ---------------------------------------------------------------- simulasi
+
+
+def model_latency(
+    rng: random.Random, concurrent: int, base_latency: float = 0.6, knee: float = 20.0, rate_limit: int = 30
+) -> tuple[float, int]:
+    """Model tiruan: latensi naik kuadratik setelah ``knee``; di atas
+    ``rate_limit`` sebagian request kena 429 dan diulang dengan backoff."""
+    latency = base_latency * (1 + (max(0, concurrent - knee) / knee) ** 2) * rng.uniform(0.8, 1.2)
+    retries = 0
+    if concurrent > rate_limit:
+        p_limited = 1 - rate_limit / concurrent
+        while rng.random() < p_limited and retries < 6:
+            latency += min(2.0 * 2**retries, 16.0)
+            retries += 1
+    return latency, retries
+
+
+def simulate_burst(
+    max_sessions: int,
+    calls_per_minute: float = 20.0,
+    burst_minutes: float = 30.0,
+    max_wait: float = 120.0,
+    seed: int = 11,
+    **model: float,
+) -> dict[str, Any]:
+    """Simulasi event diskret satu lonjakan panggilan; ``max_sessions`` 0 = tanpa admission.
+
+    ``model`` diteruskan ke ``model_latency`` (base_latency, knee, rate_limit).
+    """
+    rng = random.Random(seed)
+    queue = AdmissionQueue(max_sessions, lease_ttl=math.inf, wait_ttl=math.inf)
+    events: list = []
+    seq = 0
+
+    def push(at: float, kind: str, call: dict[str, Any]) -> None:
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (at, seq, kind, call))
+
+    t = 0.0
+    calls = []
+    while True:
+        t += rng.expovariate(calls_per_minute / 60)
+        if t > burst_minutes * 60:
+            break
+        call = {"id": f"call-{len(calls)}", "arrived": t, "turns": rng.randint(6, 14)}
+        calls.append(call)
+        push(t, "poll", call)
+
+    active = peak = 0
+    turn_latencies, waits, rate_limited, routed = [], [], 0, 0
+    while events:
+        now, _, kind, call = heapq.heappop(events)
+        if kind == "poll":
+            result = queue.acquire(call["id"], now=now)
+            if result["admitted"]:
+                waits.append(now - call["arrived"])
+                active += 1
+                peak = max(peak, active)
+                push(now + rng.uniform(2, 6), "turn", call)
+            elif result["eta_seconds"] > max_wait or now - call["arrived"] >= max_wait:
+                queue.release(call["id"], routed=True, now=now)
+                routed += 1
+            else:
+                push(now + 1.0, "poll", call)
+        elif kind == "turn":
+            # User selesai bicara -> model merespon -> agent bicara -> user bicara lagi
+            latency, retries = model_latency(rng, active, **model)
+            turn_latencies.append(latency)
+            rate_limited += retries > 0
+            call["turns"] -= 1
+            if call["turns"] > 0:
+                push(now + latency + rng.uniform(3, 8) + rng.uniform(2, 6), "turn", call)
+            else:
+                push(now + latency + rng.uniform(3, 8), "end", call)
+        elif kind == "end":
+            active -= 1
+            queue.release(call["id"], now=now)
+
+    return {
+        "calls": len(calls),
+        "served": len(waits),
+        "routed": routed,
+        "peak_sessions": peak,
+        "turn_p50": _percentile(turn_latencies, 50),
+        "turn_p99": _percentile(turn_latencies, 99),
+        "rate_limited_turns": rate_limited,
+        "wait_p50": _percentile(waits, 50),
+        "wait_p99": _percentile(waits, 99),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulasi lonjakan panggilan dengan model realtime tiruan, dengan dan tanpa admission control")
+    parser.add_argument("--simulate", action="store_true", help="Jalankan simulasi (default jika tidak ada argumen lain)")
+    parser.add_argument("--calls-per-minute", type=float, default=20.0, help="Laju panggilan saat lonjakan")
+    parser.add_argument("--burst-minutes", type=float, default=30.0)
+    parser.add_argument("--max-sessions", type=int, default=25, help="Batas session realtime dengan admission")
+    parser.add_argument("--max-wait", type=float, default=120.0, help="Dialihkan ke WhatsApp jika antri lebih lama")
+    parser.add_argument("--rate-limit", type=int, default=30, help="Session serentak sebelum model mulai membalas 429")
+    parser.add_argument("--knee", type=float, default=20.0, help="Session serentak saat latensi model mulai naik")
+    parser.add_argument("--base-latency", type=float, default=0.6, help="Latensi respon model tanpa beban (detik)")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    print(
+        f"burst: {args.calls_per_minute:g} calls/min for {args.burst_minutes:g} min, "
+        f"model knee {args.knee:g} sessions, rate limit {args.rate_limit} sessions"
+    )
+    print(f"{'scenario':<22}{'calls':>7}{'served':>8}{'routed':>8}{'turn p50':>10}{'turn p99':>10}{'429 turns':>11}{'wait p50':>10}{'wait p99':>10}")
+    for name, limit in (("no admission", 0), (f"max_sessions={args.max_sessions}", args.max_sessions)):
+        r = simulate_burst(
+            limit,
+            calls_per_minute=args.calls_per_minute,
+            burst_minutes=args.burst_minutes,
+            max_wait=args.max_wait,
+            seed=args.seed,
+            base_latency=args.base_latency,
+            knee=args.knee,
+            rate_limit=args.rate_limit,
+        )
+        print(
+            f"{name:<22}{r['calls']:>7}{r['served']:>8}{r['routed']:>8}{r['turn_p50']:>9.2f}s{r['turn_p99']:>9.2f}s"
+            f"{r['rate_limited_turns']:>11}{r['wait_p50']:>9.1f}s{r['wait_p99']:>9.1f}s"
+        )
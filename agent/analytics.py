@@ -0,0 +1,370 @@
+"""Analytics panggilan dan pesanan di atas kolom NumPy.
+
+Setiap pesan dan session disimpan sebagai baris di array kolom (timestamp,
+tipe peserta, delay respon agent, durasi, outcome, total pesanan) yang
+diperbarui langsung dari listener ``CallLogStore``. ``GET /analytics``
+menghitung volume per bucket waktu, persentil delay respon dan tingkat
+konversi dengan operasi vektor (mask, ``bincount``, ``percentile``) tanpa
+membaca ulang file log.
+
+Pemakaian token (record ``usage`` voice agent dan ``usage`` pada pesan
+WhatsApp) dijumlahkan per session; latency tiap respon disimpan terpisah
+untuk membandingkan respon yang prefix prompt-nya kena cache dengan yang
+tidak. Session dari arsip hanya membawa total token (``session_stats``).
+
+Waktu disimpan sebagai detik "wall clock" sejak 1970-01-01 tanpa zona
+waktu, sama seperti timestamp yang ditulis agent (``datetime.now()``),
+sehingga bucket harian jatuh di tengah malam waktu lokal.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+
+from call_log_store import USAGE_FIELDS
+
+EPOCH = datetime(1970, 1, 1)
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+MAX_BUCKETS = 2000
+
+PARTICIPANT_TYPES = ("user", "agent", "staff", "system")
+OUTCOME_CLOSED = 1
+OUTCOME_TRANSFERRED = 2
+OUTCOME_ORDERED = 4
+
+
+def parse_time(timestamp: str | None) -> float:
+    """Detik wall clock dari timestamp ISO; NaN jika tidak bisa dibaca."""
+    if not timestamp:
+        return math.nan
+    try:
+        dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return math.nan
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return (dt - EPOCH).total_seconds()
+
+
+def format_time(seconds: float) -> str:
+    return str(np.datetime64(int(seconds), "s"))
+
+
+def response_delay(previous: dict[str, Any] | None, message: dict[str, Any]) -> float | None:
+    """Delay (detik) balasan agent pertama setelah pesan user; None jika bukan."""
+    if not previous or previous.get("type") != "user" or message.get("type") != "agent":
+        return None
+    delay = parse_time(message.get("timestamp")) - parse_time(previous.get("timestamp"))
+    return round(delay, 3) if delay >= 0 else None
+
+
+class _Columns:
+    """Sekumpulan array sejajar yang tumbuh dua kali lipat saat penuh."""
+
+    def __init__(self, dtypes: dict[str, Any], capacity: int = 1024):
+        self.size = 0
+        self._dtypes = dtypes
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, **values: Any) -> int:
+        capacity = len(next(iter(self._arrays.values())))
+        if self.size == capacity:
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity * 2, dtype=array.dtype)
+                grown[:capacity] = array
+                self._arrays[name] = grown
+        row = self.size
+        for name, array in self._arrays.items():
+            array[row] = values[name]
+        self.size += 1
+        return row
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._arrays[name][: self.size]
+
+    def set(self, name: str, row: int, value: Any) -> None:
+        self._arrays[name][row] = value
+
+    def clear(self) -> None:
+        self.size = 0
+
+
+def _percentiles(values: np.ndarray, points: Iterable[int]) -> dict[str, float | None]:
+    values = values[~np.isnan(values)]
+    stats: dict[str, float | None] = {"count": int(values.size)}
+    if not values.size:
+        stats["mean"] = None
+        stats.update({f"p{p}": None for p in points})
+        return stats
+    stats["mean"] = round(float(values.mean()), 3)
+    for p, value in zip(points, np.percentile(values, list(points))):
+        stats[f"p{p}"] = round(float(value), 3)
+    return stats
+
+
+class CallAnalytics:
+    """Kolom pesan dan session, diperbarui inkremental dari record call log."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = _Columns({"time": np.float64, "session": np.int32, "type": np.int8, "delay": np.float32})
+        self._sessions = _Columns(
+            {
+                "start": np.float64,
+                "last": np.float64,
+                "messages": np.int32,
+                "outcome": np.int8,
+                "order_total": np.float64,
+                "responses": np.int32,
+                "input_tokens": np.int64,
+                "cached_tokens": np.int64,
+                "output_tokens": np.int64,
+            }
+        )
+        self._responses = _Columns({"time": np.float64, "cached": np.bool_, "latency": np.float32})
+        self._rows: dict[str, int] = {}
+        # Pesan user yang belum dibalas per session (untuk menghitung delay respon)
+        self._last_message: dict[str, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return self._sessions.size
+
+    # ---------------------------------------------------------------- updates
+
+    def rebuild(self, sessions: Iterable[tuple[str, Iterable[dict[str, Any]]]]) -> None:
+        """Bangun ulang dari pasangan (session_id, record) log aktif dan arsip."""
+        with self._lock:
+            self._messages.clear()
+            self._sessions.clear()
+            self._responses.clear()
+            self._rows.clear()
+            self._last_message.clear()
+        for session_id, records in sessions:
+            self.apply(session_id, records)
+
+    def apply(self, session_id: str, records: Iterable[dict[str, Any]]) -> None:
+        """Listener ``CallLogStore``."""
+        with self._lock:
+            for record in records:
+                self._apply_record(session_id, record)
+
+    def _apply_record(self, session_id: str, record: dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "header":
+            start = parse_time(record.get("start_time"))
+            self._rows[session_id] = self._sessions.append(
+                start=start,
+                last=start,
+                messages=0,
+                outcome=0,
+                order_total=math.nan,
+                responses=0,
+                input_tokens=0,
+                cached_tokens=0,
+                output_tokens=0,
+            )
+            self._last_message.pop(session_id, None)
+            return
+        row = self._rows.get(session_id)
+        if row is None:
+            return
+        if op == "message":
+            delay = response_delay(self._last_message.get(session_id), record)
+            if record.get("type") == "user":
+                self._last_message[session_id] = {"type": "user", "timestamp": record.get("timestamp")}
+            else:
+                self._last_message.pop(session_id, None)
+            kind = record.get("type")
+            timestamp = parse_time(record.get("timestamp"))
+            self._messages.append(
+                time=timestamp,
+                session=row,
+                type=PARTICIPANT_TYPES.index(kind) if kind in PARTICIPANT_TYPES else -1,
+                delay=math.nan if delay is None else delay,
+            )
+            self._sessions.set("messages", row, self._sessions["messages"][row] + 1)
+            if not math.isnan(timestamp):
+                self._sessions.set("last", row, max(self._sessions["last"][row], timestamp))
+            if record.get("usage"):
+                self._apply_usage(row, record["usage"], timestamp)
+        elif op == "usage":
+            self._apply_usage(row, record, parse_time(record.get("timestamp")))
+        elif op == "delay":
+            # Delay yang diukur client (mis. akhir ucapan -> audio pertama) menggantikan
+            # delay dari timestamp; record delay selalu tepat setelah pesannya
+            last = self._messages.size - 1
+            if last >= 0 and self._messages["session"][last] == row:
+                self._messages.set("delay", last, record["seconds"])
+        elif op == "set":
+            # Log lama memakai order_status juga untuk status dapur (completed =
+            # pesanan selesai; sekarang di kitchen_status), jadi tutup/transfer
+            # panggilan tetap dibaca dari record keyword
+            fields = record["fields"]
+            details = fields.get("order_details")
+            if fields.get("order_status") == "confirmed" or isinstance(details, dict):
+                self._sessions.set("outcome", row, self._sessions["outcome"][row] | OUTCOME_ORDERED)
+            if isinstance(details, dict) and details.get("total_amount") is not None:
+                self._sessions.set("order_total", row, float(details["total_amount"]))
+            # Session arsip: total token dibawa utuh di session_stats
+            totals = (fields.get("session_stats") or {}).get("token_usage")
+            if totals:
+                for name in ("responses", *USAGE_FIELDS):
+                    self._sessions.set(name, row, totals.get(name) or 0)
+        elif op == "keyword":
+            if record.get("keyword") == "CLOSE_CALL_CONFIRMED":
+                self._sessions.set("outcome", row, self._sessions["outcome"][row] | OUTCOME_CLOSED)
+            elif record.get("keyword") == "TRANSFER_TO_HUMAN":
+                self._sessions.set("outcome", row, self._sessions["outcome"][row] | OUTCOME_TRANSFERRED)
+
+    def _apply_usage(self, row: int, usage: dict[str, Any], timestamp: float) -> None:
+        self._sessions.set("responses", row, self._sessions["responses"][row] + 1)
+        for name in USAGE_FIELDS:
+            self._sessions.set(name, row, self._sessions[name][row] + (usage.get(name) or 0))
+        latency = usage.get("latency_ms")
+        self._responses.append(
+            time=timestamp,
+            cached=(usage.get("cached_tokens") or 0) > 0,
+            latency=math.nan if latency is None else latency,
+        )
+
+    # ---------------------------------------------------------------- queries
+
+    def summary(self, start_from: str | None = None, start_to: str | None = None, bucket: str = "day") -> dict[str, Any]:
+        """Agregat untuk rentang ``start_from <= waktu < start_to``.
+
+        Pesan dipilih berdasarkan timestamp-nya, session dan pesanan
+        berdasarkan waktu mulai session. ValueError jika bucket tidak dikenal
+        atau rentang menghasilkan terlalu banyak bucket.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket harus salah satu dari {', '.join(BUCKETS)}")
+        width = BUCKETS[bucket]
+        lo = parse_time(start_from) if start_from else -math.inf
+        hi = parse_time(start_to) if start_to else math.inf
+        if math.isnan(lo) or math.isnan(hi):
+            raise ValueError("start_from/start_to harus timestamp ISO")
+
+        with self._lock:
+            message_time = self._messages["time"].copy()
+            message_type = self._messages["type"].copy()
+            delays = self._messages["delay"].astype(np.float64)
+            start = self._sessions["start"].copy()
+            last = self._sessions["last"].copy()
+            outcome = self._sessions["outcome"].copy()
+            order_total = self._sessions["order_total"].copy()
+            tokens = {name: self._sessions[name].copy() for name in ("responses", *USAGE_FIELDS)}
+            response_time = self._responses["time"].copy()
+            response_cached = self._responses["cached"].copy()
+            response_latency = self._responses["latency"].astype(np.float64)
+
+        in_messages = (message_time >= lo) & (message_time < hi)
+        in_sessions = (start >= lo) & (start < hi)
+        message_time, message_type, delays = message_time[in_messages], message_type[in_messages], delays[in_messages]
+        start, last, outcome, order_total = start[in_sessions], last[in_sessions], outcome[in_sessions], order_total[in_sessions]
+        tokens = {name: int(values[in_sessions].sum()) for name, values in tokens.items()}
+        in_responses = (response_time >= lo) & (response_time < hi)
+        response_cached, response_latency = response_cached[in_responses], response_latency[in_responses]
+        ordered = (outcome & OUTCOME_ORDERED) != 0
+
+        volume: list[dict[str, Any]] = []
+        times = np.concatenate([message_time, start])
+        if times.size:
+            origin = math.floor(times.min() / width) * width
+            buckets = int((times.max() - origin) // width) + 1
+            if buckets > MAX_BUCKETS:
+                raise ValueError(f"Rentang terlalu panjang untuk bucket '{bucket}' ({buckets} bucket)")
+            calls = np.bincount(((start - origin) // width).astype(np.int64), minlength=buckets)
+            messages = np.bincount(((message_time - origin) // width).astype(np.int64), minlength=buckets)
+            orders = np.bincount(((start[ordered] - origin) // width).astype(np.int64), minlength=buckets)
+            revenue = np.bincount(
+                ((start[ordered] - origin) // width).astype(np.int64),
+                weights=np.nan_to_num(order_total[ordered]),
+                minlength=buckets,
+            )
+            volume = [
+                {
+                    "start": format_time(origin + i * width),
+                    "calls": int(calls[i]),
+                    "messages": int(messages[i]),
+                    "orders": int(orders[i]),
+                    "revenue": float(revenue[i]),
+                }
+                for i in range(buckets)
+            ]
+
+        calls_total = int(start.size)
+        counts = {
+            "ordered": int(ordered.sum()),
+            "transferred": int(((outcome & OUTCOME_TRANSFERRED) != 0).sum()),
+            "closed": int(((outcome & OUTCOME_CLOSED) != 0).sum()),
+        }
+        totals = order_total[ordered & ~np.isnan(order_total)]
+        return {
+            "bucket": bucket,
+            "volume": volume,
+            "messages_by_type": {
+                kind: int((message_type == i).sum()) for i, kind in enumerate(PARTICIPANT_TYPES)
+            },
+            "response_delay": _percentiles(delays, (50, 95, 99)),
+            "session_duration": _percentiles(last - start, (50, 95, 99)),
+            "outcomes": {
+                "calls": calls_total,
+                **counts,
+                **{
+                    f"{name}_rate": round(count / calls_total, 4) if calls_total else None
+                    for name, count in counts.items()
+                },
+            },
+            "orders": {
+                "count": int(totals.size),
+                "revenue": float(totals.sum()),
+                "average": round(float(totals.mean()), 2) if totals.size else None,
+            },
+            "tokens": {
+                **tokens,
+                "cache_hit_rate": (
+                    round(tokens["cached_tokens"] / tokens["input_tokens"], 4) if tokens["input_tokens"] else None
+                ),
+                "latency_ms": {
+                    "cache_hit": _percentiles(response_latency[response_cached], (50, 95)),
+                    "cache_miss": _percentiles(response_latency[~response_cached], (50, 95)),
+                },
+            },
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import os
+    import time
+
+    from call_log_archive import ARCHIVE_DIR, CallLogArchive
+    from call_log_store import CallLogStore
+
+    parser = argparse.ArgumentParser(description="Ringkasan analytics dari call_logs/")
+    parser.add_argument("--call-logs", default="call_logs")
+    parser.add_argument("--bucket", default="day", choices=sorted(BUCKETS))
+    parser.add_argument("--start-from")
+    parser.add_argument("--start-to")
+    args = parser.parse_args()
+
+    store = CallLogStore(args.call_logs, fsync_interval=0)
+    archive = CallLogArchive(os.path.join(args.call_logs, ARCHIVE_DIR))
+    archive.load()
+    analytics = CallAnalytics()
+    began = time.perf_counter()
+    analytics.rebuild(
+        [(sid, store.iter_records(sid)) for sid in store.session_ids()]
+        + [(entry["session_id"], archive.iter_records(entry["session_id"])) for entry in archive.summaries()]
+    )
+    loaded = time.perf_counter()
+    result = analytics.summary(args.start_from, args.start_to, args.bucket)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"sessions={len(analytics)} load={loaded - began:.3f}s query={(time.perf_counter() - loaded) * 1000:.2f}ms")
+    store.close()
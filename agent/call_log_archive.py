@@ -0,0 +1,236 @@
+"""Retensi dan arsip terkompresi untuk call log.
+
+Session yang sudah ``completed`` dan tidak aktif lebih lama dari
+``retention_days`` dipadatkan (record diputar ulang menjadi header, pesan,
+keyword dan satu ``set``; edit sudah dilebur) lalu dipindahkan dari
+``call_logs/`` ke ``call_logs/archive/``:
+
+- ``<YYYY-MM-DD>.jsonl.gz``: satu gzip member per session, dipartisi per
+  tanggal ``start_time``. File gzip yang berisi beberapa member tetap file
+  gzip yang valid.
+- ``<YYYY-MM-DD>.idx``: satu baris JSON per session berisi offset dan
+  panjang member plus ringkasan untuk listing. Baris yang lebih akhir
+  menggantikan baris sebelumnya untuk session yang sama.
+
+Membaca satu session arsip cukup ``seek`` ke offset dan mendekompresi satu
+member. Ringkasan di index dimuat ke ``SessionIndex`` saat startup sehingga
+``GET /call-logs`` tetap menampilkan riwayat tanpa membuka file arsip.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from typing import Any
+
+from call_log_store import apply_record, legacy_records
+
+logger = logging.getLogger("call-log-archive")
+
+ARCHIVE_DIR = "archive"
+DATA_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx"
+ARCHIVE_STATUSES = ("completed",)
+
+
+def _dumps(record: dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def partition_for(start_time: str) -> str:
+    day = (start_time or "")[:10]
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return "unknown"
+    return day
+
+
+class CallLogArchive:
+    """Arsip session per hari dengan index offset di memori."""
+
+    def __init__(self, directory: str, compresslevel: int = 6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        # session_id -> {"day", "offset", "length", "summary"}
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def _path(self, day: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{day}{suffix}")
+
+    def load(self) -> int:
+        """Baca semua file index; dipanggil sekali saat startup."""
+        entries: dict[str, dict[str, Any]] = {}
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(INDEX_SUFFIX):
+                    continue
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Baris terakhir bisa terpotong; member datanya diabaikan
+                            logger.warning(f"Skipping corrupt archive index line in {filename}")
+                            continue
+                        entries[entry["session_id"]] = entry
+        with self._lock:
+            self._entries = entries
+        return len(entries)
+
+    def summaries(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [entry["summary"] for entry in self._entries.values()]
+
+    def add(self, session_id: str, view: dict[str, Any], summary: dict[str, Any]) -> dict[str, Any]:
+        """Tulis satu session (sudah dipadatkan) ke arsip harinya.
+
+        Data di-fsync sebelum baris index ditulis, jadi crash di tengah jalan
+        paling buruk menyisakan member yang tidak direferensikan.
+        """
+        records = list(legacy_records(session_id, view))
+        payload = "".join(_dumps(record) + "\n" for record in records)
+        member = gzip.compress(payload.encode("utf-8"), compresslevel=self.compresslevel)
+        day = partition_for(view.get("start_time", ""))
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(day, DATA_SUFFIX), "ab") as f:
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = {"session_id": session_id, "day": day, "offset": offset, "length": len(member), "summary": summary}
+            with open(self._path(day, INDEX_SUFFIX), "a", encoding="utf-8") as f:
+                f.write(_dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[session_id] = entry
+        return entry
+
+    def iter_records(self, session_id: str) -> Iterator[dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        with open(self._path(entry["day"], DATA_SUFFIX), "rb") as f:
+            f.seek(entry["offset"])
+            member = f.read(entry["length"])
+        for line in gzip.decompress(member).decode("utf-8").splitlines():
+            if line:
+                yield json.loads(line)
+
+    def load_view(self, session_id: str) -> dict[str, Any] | None:
+        """Session view arsip dalam format yang sama dengan ``CallLogStore.load``."""
+        view = None
+        for record in self.iter_records(session_id):
+            view = apply_record(view, record)
+        return view
+
+
+def archive_sessions(store, index, archive: CallLogArchive, retention_days: float, now: datetime | None = None, limit: int | None = None) -> list[str]:
+    """Pindahkan session selesai yang lebih tua dari ``retention_days`` ke arsip.
+
+    File aktif hanya dihapus jika tidak ada record baru sejak diekspor;
+    jika ada, session tetap aktif dan akan dicoba lagi pada putaran berikutnya.
+    """
+    cutoff = ((now or datetime.now()) - timedelta(days=retention_days)).isoformat()
+    candidates = [
+        summary
+        for status in ARCHIVE_STATUSES
+        for summary in index.with_status(status)
+        if not summary.archived and summary.last_activity < cutoff
+    ]
+    candidates.sort(key=lambda summary: summary.last_activity)
+    archived = []
+    for summary in candidates[:limit]:
+        exported = store.export(summary.session_id)
+        if exported is None:
+            continue
+        size, view = exported
+        archive.add(summary.session_id, view, summary.to_archive_entry())
+        if store.remove(summary.session_id, expected_size=size):
+            index.mark_archived(summary.session_id)
+            archived.append(summary.session_id)
+    if archived:
+        logger.info(f"Archived {len(archived)} call logs older than {retention_days} days")
+    return archived
+
+
+class CallLogArchiver:
+    """Task background yang menjalankan ``archive_sessions`` secara berkala."""
+
+    def __init__(self, store, index, archive: CallLogArchive, retention_days: float, interval: float = 3600, batch_size: int = 500):
+        self.store = store
+        self.index = index
+        self.archive = archive
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.retention_days > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(
+                    archive_sessions, self.store, self.index, self.archive, self.retention_days, None, self.batch_size
+                )
+            except Exception:
+                logger.exception("Call log archival failed")
+            await asyncio.sleep(self.interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from call_log_store import CallLogStore
+    from session_index import SessionIndex
+
+    parser = argparse.ArgumentParser(description="Arsipkan call log lama ke call_logs/archive/ (jalankan saat pdf_api mati)")
+    parser.add_argument("--call-logs", default="call_logs")
+    parser.add_argument("--days", type=float, default=float(os.getenv("CALL_LOG_RETENTION_DAYS", "30")))
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Hanya tampilkan session yang akan diarsipkan")
+    parser.add_argument("--get", metavar="SESSION_ID", help="Cetak view JSON satu session dari arsip")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    archive = CallLogArchive(os.path.join(args.call_logs, ARCHIVE_DIR))
+    archive.load()
+    if args.get:
+        print(json.dumps(archive.load_view(args.get), ensure_ascii=False, indent=2))
+        raise SystemExit(0)
+
+    store = CallLogStore(args.call_logs, fsync_interval=0)
+    index = SessionIndex()
+    index.rebuild(store)
+    if args.dry_run:
+        cutoff = (datetime.now() - timedelta(days=args.days)).isoformat()
+        for status in ARCHIVE_STATUSES:
+            for summary in index.with_status(status):
+                if summary.last_activity < cutoff:
+                    print(f"{summary.session_id}  {summary.start_time}  {summary.last_activity}")
+    else:
+        archived = archive_sessions(store, index, archive, args.days, limit=args.limit)
+        print(f"Archived {len(archived)} sessions ({len(archive)} total in archive)")
+    store.close()
@@ -0,0 +1,490 @@
+"""Append-only call log store.
+
+Setiap session disimpan sebagai ``call_logs/<session_id>.jsonl``: satu record
+JSON per baris. Baris pertama adalah record ``header``; sisanya adalah
+``message`` (pesan transcript), ``set`` (update field session seperti status,
+result, order_details), ``keyword`` (keyword yang terdeteksi), ``delay``
+(delay respon agent dalam detik), ``edit`` (revisi teks sebuah pesan) dan
+``usage`` (pemakaian token satu respon model). Pesan agent WhatsApp membawa
+``usage``-nya langsung di record ``message``; keduanya dijumlahkan di
+``session_stats["token_usage"]``.
+
+Setiap pesan mendapat ``seq`` (urutan per session, mulai 1) dan ``id`` unik
+saat ditulis. Edit tidak mengubah record pesan; record ``edit`` membawa nomor
+revisi dan teks lama tetap tercatat di ``revisions`` pada view pesan.
+
+Menulis hanya menambah baris di akhir file (O(1) per pesan) dan fsync
+digabung oleh thread background setiap ``fsync_interval`` detik. Membaca
+session berarti memutar ulang record untuk membangun view yang sama dengan
+format JSON lama; view session yang sering dibaca disimpan di cache LRU dan
+diperbarui langsung saat record ditulis.
+"""
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from typing import Any, Callable
+
+from telemetry import CALL_LOG_APPEND_SECONDS
+
+logger = logging.getLogger("call-log-store")
+
+LOG_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+LEGACY_DIR = "legacy"
+
+# Dipanggil setelah record ditulis: listener(session_id, records)
+Listener = Callable[[str, list[dict[str, Any]]], None]
+# Dipanggil di dalam lock store sebelum record ditulis; raise untuk membatalkan
+BeforeWrite = Callable[[str], None]
+
+
+class StaleRevision(Exception):
+    """Edit ditolak karena pesan sudah direvisi oleh penulis lain."""
+
+    def __init__(self, current: int):
+        super().__init__(f"Revisi pesan sekarang {current}")
+        self.current = current
+
+
+def _dumps(record: dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def new_view(session_id: str, start_time: str) -> dict[str, Any]:
+    """Session view kosong, sama dengan dokumen yang dulu dibuat log_conversation."""
+    return {
+        "session_id": session_id,
+        "start_time": start_time,
+        "messages": [],
+        "order_status": "none",
+        "session_stats": {
+            "total_messages": 0,
+            "response_delays": [],
+            "keywords_detected": [],
+        },
+    }
+
+
+USAGE_FIELDS = ("input_tokens", "cached_tokens", "output_tokens")
+
+
+def _add_usage(stats: dict[str, Any], usage: dict[str, Any]) -> None:
+    totals = stats.setdefault("token_usage", {"responses": 0, **{field: 0 for field in USAGE_FIELDS}})
+    totals["responses"] += 1
+    for field in USAGE_FIELDS:
+        totals[field] += usage.get(field) or 0
+    if usage.get("prompt_version"):
+        totals["prompt_version"] = usage["prompt_version"]
+
+
+def apply_record(view: dict[str, Any] | None, record: dict[str, Any]) -> dict[str, Any] | None:
+    """Terapkan satu record ke session view dan kembalikan view tersebut."""
+    op = record.get("op")
+    if op == "header":
+        return new_view(record["session_id"], record["start_time"])
+    if view is None:
+        return None
+    if op == "message":
+        message = {k: v for k, v in record.items() if k != "op"}
+        view["messages"].append(message)
+        view["session_stats"]["total_messages"] += 1
+        if message.get("usage"):
+            _add_usage(view["session_stats"], message["usage"])
+    elif op == "set":
+        view.update(record["fields"])
+    elif op == "keyword":
+        view["session_stats"]["keywords_detected"].append(record["keyword"])
+    elif op == "delay":
+        view["session_stats"]["response_delays"].append(record["seconds"])
+    elif op == "usage":
+        _add_usage(view["session_stats"], record)
+    elif op == "edit":
+        message = view["messages"][record["position"]]
+        revision = record.get("revision", message.get("revision", 0) + 1)
+        message.setdefault("revisions", []).append(
+            {
+                "revision": revision,
+                "previous": message["message"],
+                "edited_at": record["edited_at"],
+                "editor": record.get("editor"),
+            }
+        )
+        message["message"] = record["message"]
+        message["revision"] = revision
+        message["edited"] = True
+        message["edited_at"] = record["edited_at"]
+    return view
+
+
+def message_records(
+    message: dict[str, Any],
+    fields: dict[str, Any] | None = None,
+    keywords: Iterable[str] = (),
+    response_delay: float | None = None,
+) -> list[dict[str, Any]]:
+    """Record untuk satu pesan beserta delay, keyword dan update field-nya."""
+    records: list[dict[str, Any]] = [{"op": "message", **message}]
+    if response_delay is not None:
+        records.append({"op": "delay", "seconds": response_delay})
+    records.extend({"op": "keyword", "keyword": keyword} for keyword in keywords)
+    if fields:
+        records.append({"op": "set", "fields": fields})
+    return records
+
+
+class CallLogStore:
+    """Per-session append-only record log di atas satu direktori."""
+
+    def __init__(self, directory: str, fsync_interval: float = 0.5, max_open_files: int = 256, view_cache_size: int = 256):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.max_open_files = max_open_files
+        self.view_cache_size = view_cache_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._handles: OrderedDict[str, Any] = OrderedDict()
+        self._dirty: set = set()
+        self._views: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # Jumlah pesan per session, untuk memberi seq tanpa membaca view
+        self._message_counts: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self._listeners: list[Listener] = []
+
+    def add_listener(self, listener: Listener) -> None:
+        """Daftarkan callback yang menerima setiap batch record yang ditulis.
+
+        Listener dipanggil di dalam lock store sehingga urutan record per
+        session selalu sama dengan urutan di file; listener harus cepat.
+        """
+        self._listeners.append(listener)
+
+    # ------------------------------------------------------------------ paths
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}{LOG_SUFFIX}")
+
+    def exists(self, session_id: str) -> bool:
+        return session_id in self._handles or os.path.exists(self.path(session_id))
+
+    def session_ids(self) -> list[str]:
+        return [
+            filename[: -len(LOG_SUFFIX)]
+            for filename in os.listdir(self.directory)
+            if filename.endswith(LOG_SUFFIX)
+        ]
+
+    # ---------------------------------------------------------------- writing
+
+    def start(self) -> None:
+        """Jalankan thread yang melakukan fsync gabungan."""
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="call-log-fsync", daemon=True)
+            self._flusher.start()
+
+    def _handle(self, session_id: str):
+        handle = self._handles.get(session_id)
+        if handle is not None:
+            self._handles.move_to_end(session_id)
+            return handle
+        # Handle tetap terbuka di cache LRU dan ditutup oleh _close_handle
+        handle = open(self.path(session_id), "a", encoding="utf-8")  # noqa: SIM115
+        self._handles[session_id] = handle
+        while len(self._handles) > self.max_open_files:
+            old_id, old_handle = self._handles.popitem(last=False)
+            self._dirty.discard(old_id)
+            self._close_handle(old_handle)
+        return handle
+
+    @staticmethod
+    def _close_handle(handle) -> None:
+        try:
+            handle.flush()
+            os.fsync(handle.fileno())
+        except (OSError, ValueError):
+            pass
+        handle.close()
+
+    def _message_count(self, session_id: str) -> int:
+        # Harus dipanggil dengan self._lock dipegang
+        count = self._message_counts.get(session_id)
+        if count is None:
+            view = self._views.get(session_id)
+            if view is not None:
+                count = len(view["messages"])
+            else:
+                count = sum(1 for record in self.iter_records(session_id) if record.get("op") == "message")
+            self._message_counts[session_id] = count
+        return count
+
+    def append(
+        self,
+        session_id: str,
+        records: Iterable[dict[str, Any]],
+        start_time: str | None = None,
+        before_write: BeforeWrite | None = None,
+    ) -> list[dict[str, Any]]:
+        """Tambahkan record ke log session; buat header jika session baru.
+
+        Semua record ditulis dalam satu ``write`` sehingga satu request tidak
+        pernah tercampur dengan request lain. Record ``message`` tanpa ``id``
+        diberi ``id`` dan ``seq``. ``before_write`` dijalankan di dalam lock
+        (misalnya untuk cek revisi); exception darinya membatalkan penulisan.
+        Mengembalikan record yang benar-benar ditulis (termasuk header bila ada).
+        """
+        records = list(records)
+        started = time.perf_counter()
+        with self._lock:
+            if not self.exists(session_id):
+                if start_time is None:
+                    raise KeyError(session_id)
+                records.insert(0, {"op": "header", "session_id": session_id, "start_time": start_time})
+                self._message_counts[session_id] = 0
+            if before_write is not None:
+                before_write(session_id)
+            for i, record in enumerate(records):
+                if record.get("op") != "message":
+                    continue
+                seq = self._message_count(session_id) + 1
+                self._message_counts[session_id] = seq
+                fields = {k: v for k, v in record.items() if k not in ("op", "id", "seq")}
+                records[i] = {"op": "message", "id": record.get("id") or uuid.uuid4().hex, "seq": seq, **fields}
+            handle = self._handle(session_id)
+            handle.write("".join(_dumps(record) + "\n" for record in records))
+            handle.flush()
+            self._dirty.add(session_id)
+            view = self._views.get(session_id)
+            for record in records:
+                view = apply_record(view, record)
+            if session_id in self._views or records[0].get("op") == "header":
+                self._cache_view(session_id, view)
+            for listener in self._listeners:
+                try:
+                    listener(session_id, records)
+                except Exception:
+                    logger.exception(f"Call log listener failed for {session_id}")
+        if self.fsync_interval <= 0:
+            self.flush()
+        CALL_LOG_APPEND_SECONDS.observe(time.perf_counter() - started)
+        return records
+
+    def append_message(
+        self,
+        session_id: str,
+        message: dict[str, Any],
+        fields: dict[str, Any] | None = None,
+        keywords: Iterable[str] = (),
+        start_time: str | None = None,
+        response_delay: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """Shortcut: satu pesan, keyword terdeteksi dan update field sekaligus."""
+        records = message_records(message, fields=fields, keywords=keywords, response_delay=response_delay)
+        return self.append(session_id, records, start_time=start_time)
+
+    def set_fields(self, session_id: str, fields: dict[str, Any], start_time: str | None = None) -> list[dict[str, Any]]:
+        return self.append(session_id, [{"op": "set", "fields": fields}], start_time=start_time)
+
+    def flush(self) -> None:
+        """fsync semua file yang ditulis sejak flush terakhir."""
+        with self._lock:
+            handles = [self._handles[sid] for sid in self._dirty if sid in self._handles]
+            self._dirty.clear()
+        for handle in handles:
+            try:
+                os.fsync(handle.fileno())
+            except (OSError, ValueError):
+                # File sudah ditutup (dan di-fsync) oleh eviction LRU
+                pass
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        with self._lock:
+            for handle in self._handles.values():
+                self._close_handle(handle)
+            self._handles.clear()
+            self._dirty.clear()
+            self._views.clear()
+
+    # ---------------------------------------------------------------- reading
+
+    def iter_records(self, session_id: str) -> Iterator[dict[str, Any]]:
+        path = self.path(session_id)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Baris terakhir bisa terpotong jika proses mati saat menulis
+                    logger.warning(f"Skipping corrupt record {session_id}:{line_no}")
+
+    def _replay(self, session_id: str) -> dict[str, Any] | None:
+        view = None
+        for record in self.iter_records(session_id):
+            view = apply_record(view, record)
+        return view
+
+    def _cache_view(self, session_id: str, view: dict[str, Any] | None) -> None:
+        if view is None or self.view_cache_size <= 0:
+            return
+        self._views[session_id] = view
+        self._views.move_to_end(session_id)
+        while len(self._views) > self.view_cache_size:
+            self._views.popitem(last=False)
+
+    def _view(self, session_id: str) -> dict[str, Any] | None:
+        # Harus dipanggil dengan self._lock dipegang
+        view = self._views.get(session_id)
+        if view is not None:
+            self._views.move_to_end(session_id)
+            return view
+        view = self._replay(session_id)
+        self._cache_view(session_id, view)
+        return view
+
+    def load(self, session_id: str) -> dict[str, Any] | None:
+        """Session view lengkap (salinan; aman diubah oleh pemanggil)."""
+        with self._lock:
+            return copy.deepcopy(self._view(session_id))
+
+    def load_since(self, session_id: str, after: int) -> dict[str, Any] | None:
+        """Field session tanpa pesan, plus salinan pesan mulai posisi ``after``.
+
+        Hanya pesan baru yang disalin sehingga biaya sebanding dengan jumlah
+        pesan baru, bukan panjang transcript.
+        """
+        with self._lock:
+            view = self._view(session_id)
+            if view is None:
+                return None
+            result = {k: copy.deepcopy(v) for k, v in view.items() if k != "messages"}
+            result["messages"] = copy.deepcopy(view["messages"][after:])
+            result["message_count"] = len(view["messages"])
+            return result
+
+    # -------------------------------------------------------------- retention
+
+    def export(self, session_id: str) -> tuple[int, dict[str, Any]] | None:
+        """(ukuran file, salinan view) untuk diarsipkan; None jika tidak ada."""
+        with self._lock:
+            handle = self._handles.get(session_id)
+            if handle is not None:
+                handle.flush()
+            try:
+                size = os.path.getsize(self.path(session_id))
+            except OSError:
+                return None
+            view = self._view(session_id)
+            return (size, copy.deepcopy(view)) if view is not None else None
+
+    def remove(self, session_id: str, expected_size: int | None = None) -> bool:
+        """Hapus log aktif session (setelah diarsipkan).
+
+        Dengan ``expected_size`` file hanya dihapus jika tidak ada record
+        yang ditulis sejak ``export``.
+        """
+        with self._lock:
+            path = self.path(session_id)
+            try:
+                if expected_size is not None and os.path.getsize(path) != expected_size:
+                    return False
+            except OSError:
+                return False
+            handle = self._handles.pop(session_id, None)
+            if handle is not None:
+                self._close_handle(handle)
+            self._dirty.discard(session_id)
+            self._views.pop(session_id, None)
+            self._message_counts.pop(session_id, None)
+            os.remove(path)
+            return True
+
+    # -------------------------------------------------------------- migration
+
+    def migrate_legacy(self) -> int:
+        """Konversi ``call_logs/*.json`` lama ke format ``.jsonl``.
+
+        File asli dipindahkan ke ``call_logs/legacy/`` setelah konversi
+        berhasil, sehingga migrasi aman dijalankan berulang kali.
+        """
+        migrated = 0
+        legacy_dir = os.path.join(self.directory, LEGACY_DIR)
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(LEGACY_SUFFIX):
+                continue
+            legacy_path = os.path.join(self.directory, filename)
+            try:
+                with open(legacy_path, encoding="utf-8") as f:
+                    log_data = json.load(f)
+                session_id = log_data.get("session_id") or filename[: -len(LEGACY_SUFFIX)]
+                target = self.path(session_id)
+                if not os.path.exists(target):
+                    tmp_path = target + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.writelines(_dumps(record) + "\n" for record in legacy_records(session_id, log_data))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, target)
+                    with self._lock:
+                        self._message_counts.pop(session_id, None)
+                        self._views.pop(session_id, None)
+                os.makedirs(legacy_dir, exist_ok=True)
+                shutil.move(legacy_path, os.path.join(legacy_dir, filename))
+                migrated += 1
+            except (OSError, ValueError, AttributeError) as e:
+                # File rusak/bukan dict: lewati, file lain tetap dimigrasi
+                logger.error(f"Failed to migrate legacy log {filename}: {e}")
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy call logs to {LOG_SUFFIX}")
+        return migrated
+
+
+def legacy_records(session_id: str, log_data: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Record log yang menghasilkan view sama dengan dokumen JSON lama.
+
+    Pesan tanpa ``seq``/``id`` (dokumen sebelum format ``.jsonl``) diberi
+    nomor urut dan id baru, sama seperti ``append``, supaya ``after_seq`` dan
+    edit per id juga berlaku untuk session hasil migrasi. ``session_stats``
+    lama (``response_delays``, ``token_usage`` dsb.) dibawa utuh.
+    """
+    messages = log_data.get("messages", [])
+    start_time = log_data.get("start_time") or (messages[0]["timestamp"] if messages else "")
+    yield {"op": "header", "session_id": session_id, "start_time": start_time}
+    for seq, message in enumerate(messages, start=1):
+        fields = {k: v for k, v in message.items() if k not in ("id", "seq")}
+        yield {"op": "message", "id": message.get("id") or uuid.uuid4().hex, "seq": message.get("seq") or seq, **fields}
+    stats = log_data.get("session_stats") or {}
+    for keyword in stats.get("keywords_detected", []):
+        yield {"op": "keyword", "keyword": keyword}
+    fields = {
+        k: v
+        for k, v in log_data.items()
+        if k not in ("session_id", "start_time", "messages", "session_stats")
+    }
+    if stats:
+        # Statistik tidak bisa dihitung ulang dari pesan saja (delay dan usage punya record sendiri)
+        fields["session_stats"] = {**stats, "total_messages": len(messages)}
+    if fields:
+        yield {"op": "set", "fields": fields}
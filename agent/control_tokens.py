@@ -0,0 +1,338 @@
+"""Deteksi token kontrol agent (ORDER_CONFIRMED, CLOSE_CALL_CONFIRMED,
+TRANSFER_TO_HUMAN) dalam satu kali lewat.
+
+Semua token dicocokkan sekaligus dengan automaton Aho-Corasick, sehingga
+teks cukup dibaca sekali berapa pun jumlah token. ``ControlTokenStream``
+memproses transcript agent per delta: aksi dijalankan begitu token (dan
+payload pesanan) lengkap, tanpa menunggu pesan selesai, dan teks kontrol
+tidak ikut diteruskan ke transcript yang ditampilkan ke pelanggan. Hanya
+karakter yang masih mungkin menjadi awal token yang ditahan sementara.
+
+Payload ORDER_CONFIRMED berformat
+``NAMA|TELEPON|EMAIL|ALAMAT|ITEM1,ITEM2|TOTAL|CATATAN``. Model sering tidak
+menutupnya dengan ``|`` dan langsung melanjutkan bicara, jadi payload juga
+berakhir saat field terakhir selesai: di field TOTAL begitu kata pertama
+setelah angka muncul (tanpa CATATAN), di field CATATAN setelah tanda akhir
+kalimat (``.``, ``!``, ``?``) yang diikuti spasi. Baris baru, ``|`` ketujuh
+dan akhir pesan juga menutup payload. Teks sesudahnya kembali diteruskan ke
+transcript.
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+ORDER_CONFIRMED = "ORDER_CONFIRMED"
+CLOSE_CALL_CONFIRMED = "CLOSE_CALL_CONFIRMED"
+TRANSFER_TO_HUMAN = "TRANSFER_TO_HUMAN"
+CONTROL_TOKENS = (ORDER_CONFIRMED, CLOSE_CALL_CONFIRMED, TRANSFER_TO_HUMAN)
+
+ORDER_FIELDS = 7
+TOTAL_FIELD = 5
+# Prefix mata uang beserta titik/spasinya ("Rp. ", "IDR ")
+CURRENCY_RE = re.compile(r"^\s*(?:rp|idr)\.?\s*", re.IGNORECASE)
+NUMBER_RE = re.compile(r"\d[\d.,]*")
+SENTENCE_END = ".!?"
+
+
+class AhoCorasick:
+    """Automaton pencocokan banyak pola; tidak peka huruf besar/kecil."""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._depth: list[int] = [0]
+        self._output: list[list[str]] = [[]]
+        for pattern in self.patterns:
+            node = 0
+            for ch in pattern.lower():
+                if ch not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._depth.append(self._depth[node] + 1)
+                    self._output.append([])
+                    self._goto[node][ch] = len(self._goto) - 1
+                node = self._goto[node][ch]
+            self._output[node].append(pattern)
+        # BFS untuk fungsi gagal; output node mewarisi output node gagalnya
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def start_chars(self) -> str:
+        """Karakter yang bisa memulai pola (huruf kecil)."""
+        return "".join(self._goto[0])
+
+    def step(self, state: int, ch: str) -> int:
+        ch = ch.lower()
+        while state and ch not in self._goto[state]:
+            state = self._fail[state]
+        return self._goto[state].get(ch, 0)
+
+    def depth(self, state: int) -> int:
+        """Panjang akhiran teks yang masih merupakan awalan salah satu pola."""
+        return self._depth[state]
+
+    def output(self, state: int) -> list[str]:
+        return self._output[state]
+
+    def find_all(self, text: str) -> list[tuple[int, str]]:
+        """(offset awal, pola) untuk semua kemunculan pola di ``text``."""
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            state = self.step(state, ch)
+            for pattern in self._output[state]:
+                matches.append((i - len(pattern) + 1, pattern))
+        return matches
+
+
+DETECTOR = AhoCorasick(CONTROL_TOKENS)
+
+
+def find_tokens(text: str) -> list[str]:
+    """Token kontrol yang muncul di ``text`` (urut kemunculan, tanpa duplikat)."""
+    found: list[str] = []
+    for _, token in DETECTOR.find_all(text):
+        if token not in found:
+            found.append(token)
+    return found
+
+
+def parse_amount(text: str) -> float | None:
+    """'Rp. 45.000' / 'Rp 45.000' / '45,000' -> 45000.0; None jika ada lebih dari satu angka."""
+    numbers = NUMBER_RE.findall(CURRENCY_RE.sub("", text or ""))
+    if len(numbers) != 1:
+        # '45000 tiba dalam 30 menit' bukan 4500030
+        return None
+    digits = numbers[0].rstrip(".,")
+    digits = re.sub(r"[.,](?=\d{3}(?:\D|$))", "", digits)
+    try:
+        return float(digits.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_order_payload(payload: str) -> dict[str, Any] | None:
+    """Field pesanan dari payload ORDER_CONFIRMED; None jika kurang dari 6 field."""
+    # "ORDER_CONFIRMED: Budi|..." -> pemisah setelah token bukan bagian nama
+    parts = [part.strip() for part in payload.strip().lstrip(":").strip("|").split("|")]
+    if len(parts) < ORDER_FIELDS - 1:
+        return None
+    total = parse_amount(parts[5])
+    if total is None:
+        return None
+    return {
+        "customer_name": parts[0],
+        "customer_phone": parts[1],
+        "customer_email": parts[2] or None,
+        "delivery_address": parts[3],
+        "order_items": [item.strip() for item in parts[4].split(",") if item.strip()],
+        "total_amount": total,
+        "notes": "|".join(parts[6:]).strip() or None,
+    }
+
+
+@dataclass
+class ControlEvent:
+    token: str
+    # Offset karakter (dalam pesan) saat event siap dijalankan
+    offset: int
+    payload: dict[str, Any] | None = None
+    raw_payload: str = ""
+
+
+class ControlTokenStream:
+    """Detector streaming untuk satu pesan agent.
+
+    ``feed(delta)`` mengembalikan (teks yang aman ditampilkan/diucapkan,
+    event yang siap dijalankan); ``finish()`` dipanggil di akhir pesan.
+    """
+
+    def __init__(self, automaton: AhoCorasick = DETECTOR):
+        self.automaton = automaton
+        # Dari state awal, lompati langsung ke karakter yang bisa memulai token
+        self._start_re = re.compile(f"[{re.escape(automaton.start_chars())}]", re.IGNORECASE)
+        self._state = 0
+        self._held: list[str] = []
+        self._payload: list[str] | None = None
+        self._pipes = 0
+        # Posisi awal field payload yang sedang dibaca
+        self._field_start = 0
+        self._offset = 0
+
+    @property
+    def in_payload(self) -> bool:
+        return self._payload is not None
+
+    def feed(self, delta: str) -> tuple[str, list[ControlEvent]]:
+        out: list[str] = []
+        events: list[ControlEvent] = []
+        i = 0
+        while i < len(delta):
+            if self._state == 0 and self._payload is None:
+                match = self._start_re.search(delta, i)
+                end = match.start() if match else len(delta)
+                out.append(delta[i:end])
+                self._offset += end - i
+                i = end
+                if match is None:
+                    break
+            ch = delta[i]
+            i += 1
+            self._offset += 1
+            if self._payload is not None:
+                if ch == "\n" and self._pipes >= ORDER_FIELDS - 2:
+                    events.append(self._order_event())
+                    continue
+                if self._payload_ends_before(ch):
+                    # Karakter ini sudah ucapan berikutnya: proses ulang sebagai teks biasa
+                    events.append(self._order_event())
+                    i -= 1
+                    self._offset -= 1
+                    continue
+                self._payload.append(ch)
+                if ch == "|":
+                    self._pipes += 1
+                    self._field_start = len(self._payload)
+                    if self._pipes == ORDER_FIELDS:
+                        events.append(self._order_event())
+                continue
+            self._state = self.automaton.step(self._state, ch)
+            self._held.append(ch)
+            matched = self.automaton.output(self._state)
+            if matched:
+                token = matched[0]
+                out.extend(self._held[: -len(token)])
+                self._held = []
+                self._state = 0
+                if token == ORDER_CONFIRMED:
+                    self._payload = []
+                    self._pipes = 0
+                    self._field_start = 0
+                else:
+                    events.append(ControlEvent(token, self._offset))
+                continue
+            keep = self.automaton.depth(self._state)
+            if len(self._held) > keep:
+                out.extend(self._held[: len(self._held) - keep])
+                self._held = self._held[len(self._held) - keep :]
+        return "".join(out), events
+
+    def _payload_ends_before(self, ch: str) -> bool:
+        field = self._payload[self._field_start :]
+        if not field or ch == "|":
+            return False
+        if self._pipes == TOTAL_FIELD:
+            # Kata setelah angka total: tidak ada CATATAN, model sudah lanjut bicara
+            return ch.isalpha() and field[-1].isspace() and any(c.isdigit() for c in field)
+        if self._pipes == ORDER_FIELDS - 1:
+            return ch.isspace() and field[-1] in SENTENCE_END
+        return False
+
+    def finish(self) -> tuple[str, list[ControlEvent]]:
+        events = [self._order_event()] if self._payload is not None else []
+        out = "".join(self._held)
+        self._held = []
+        self._state = 0
+        return out, events
+
+    def _order_event(self) -> ControlEvent:
+        raw = "".join(self._payload or [])
+        self._payload = None
+        self._pipes = 0
+        self._field_start = 0
+        return ControlEvent(ORDER_CONFIRMED, self._offset, parse_order_payload(raw), raw.strip())
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark deteksi token kontrol streaming vs cek substring setelah pesan selesai")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--chars-per-second", type=float, default=15.0, help="Kecepatan transcript audio (karakter/detik)")
+    parser.add_argument("--log-roundtrip-ms", type=float, default=40.0, help="Waktu POST /log-conversation pada jalur lama")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    filler = (
+        "Baik kak, pesanan sudah saya catat. Terima kasih sudah memesan, "
+        "makanan akan segera kami siapkan dan dikirim ke alamat kakak. "
+    )
+    samples = []
+    for _ in range(args.messages):
+        kind = rng.choice(CONTROL_TOKENS)
+        tail = rng.choice(["", " Sampai jumpa lagi ya kak, semoga harinya menyenangkan!"])
+        if kind == ORDER_CONFIRMED:
+            # Dengan dan tanpa "|" penutup; tanpa penutup payload berakhir di akhir kalimat CATATAN
+            end = rng.choice(["|", "."])
+            control = f" ORDER_CONFIRMED Budi Santoso|081234567890||Jl. Melati No. 12|2x Mie Ayam,Es Teh|Rp 45.000|Tanpa sambal{end}"
+        else:
+            control = f" {kind}"
+        message = filler[: rng.randint(40, len(filler))] + control + tail
+        deltas, i = [], 0
+        while i < len(message):
+            size = rng.randint(2, 9)
+            deltas.append(message[i : i + size])
+            i += size
+        samples.append((kind, message, deltas))
+
+    earlier_ms = []
+    leaked = 0
+    began = time.perf_counter()
+    for kind, message, deltas in samples:
+        stream = ControlTokenStream()
+        fired_at = None
+        shown = []
+        for delta in deltas:
+            text, events = stream.feed(delta)
+            shown.append(text)
+            if events and fired_at is None:
+                fired_at = events[0].offset
+        text, events = stream.finish()
+        shown.append(text)
+        if events and fired_at is None:
+            fired_at = events[0].offset
+        if any(token in "".join(shown) for token in CONTROL_TOKENS):
+            leaked += 1
+        # Jalur lama: aksi setelah seluruh pesan diucapkan + satu round-trip log
+        baseline_ms = len(message) / args.chars_per_second * 1000 + args.log_roundtrip_ms
+        streaming_ms = fired_at / args.chars_per_second * 1000
+        earlier_ms.append(baseline_ms - streaming_ms)
+    streaming_s = time.perf_counter() - began
+
+    # Alternatif naif: cek substring di buffer yang terus bertambah setiap delta
+    began = time.perf_counter()
+    for _, message, deltas in samples:
+        buffer = ""
+        for delta in deltas:
+            buffer += delta
+            any(token in buffer for token in CONTROL_TOKENS)
+    naive_s = time.perf_counter() - began
+
+    total_chars = sum(len(message) for _, message, _ in samples)
+    earlier_ms.sort()
+    print(f"messages={len(samples)} chars={total_chars}")
+    print(
+        f"action fires earlier by: mean {sum(earlier_ms) / len(earlier_ms):.0f} ms, median {earlier_ms[len(earlier_ms) // 2]:.0f} ms, "
+        f"p10 {earlier_ms[len(earlier_ms) // 10]:.0f} ms, p90 {earlier_ms[len(earlier_ms) * 9 // 10]:.0f} ms"
+    )
+    print(f"control text leaked to transcript: {leaked}")
+    print(
+        f"streaming detector: {streaming_s * 1e6 / total_chars:.2f} us/char, "
+        f"naive rescan per delta: {naive_s * 1e6 / total_chars:.2f} us/char"
+    )
@@ -0,0 +1,207 @@
+"""Pengiriman log percakapan voice agent tanpa memblokir event loop.
+
+``ConversationLogger.log`` hanya menaruh entry di antrian memori; satu task
+background mengirimnya ke ``POST /log-conversation/batch`` lewat satu
+``aiohttp.ClientSession`` (koneksi ke API dipakai ulang). Batch dikirim
+begitu berisi ``batch_size`` entry atau ``flush_interval`` detik setelah
+entry pertama masuk, mana yang lebih dulu.
+
+Backpressure: antrian dibatasi ``max_pending`` entry. Jika API lambat atau
+mati dan antrian penuh, entry tertua dibuang (dihitung di ``dropped``);
+audio tidak pernah menunggu log. Batch yang gagal dikirim ulang dengan
+backoff. Setiap entry membawa ``id`` sehingga server melewati entry yang
+sudah tercatat. ``stop()`` mengirim sisa antrian (dibatasi
+``close_timeout``) sebelum session HTTP ditutup, jadi pesan terakhir tidak
+hilang saat penelepon menutup telepon.
+
+Pemakaian token per respon model (``log_usage``) ikut dikirim di field
+``usage`` batch berikutnya dan dicatat sebagai record ``usage``.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any
+
+import aiohttp
+
+from telemetry import CONVERSATION_LOG_SEND_SECONDS
+
+logger = logging.getLogger("conversation-log")
+
+RETRY_BACKOFF = 0.25
+MAX_BACKOFF = 5.0
+
+
+class ConversationLogger:
+    """Antrian log satu session voice agent, dikirim per batch."""
+
+    def __init__(
+        self,
+        api_base_url: str,
+        session_id: str,
+        batch_size: int = 20,
+        flush_interval: float = 0.5,
+        max_pending: int = 1000,
+        max_retries: int = 5,
+        request_timeout: float = 5.0,
+        close_timeout: float = 10.0,
+        http: aiohttp.ClientSession | None = None,
+    ):
+        self.api_base_url = api_base_url.rstrip("/")
+        self.session_id = session_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.request_timeout = request_timeout
+        self.close_timeout = close_timeout
+        self.sent = 0
+        self.dropped = 0
+        self._http = http
+        self._owns_http = http is None
+        self._pending: deque[dict[str, Any]] = deque()
+        self._usage: list[dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._urgent = False
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._usage)
+
+    def start(self) -> None:
+        if self._http is None:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Kirim sisa antrian lalu tutup; aman dipanggil lebih dari sekali."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), self.close_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Log flush for {self.session_id} timed out, {len(self)} entries not sent")
+            self.dropped += len(self)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._owns_http and self._http is not None:
+            await self._http.close()
+        logger.info(f"Conversation log {self.session_id} closed: sent={self.sent} dropped={self.dropped}")
+
+    def log(
+        self,
+        participant_type: str,
+        message: str,
+        status: str | None = None,
+        result: str | None = None,
+        response_delay: float | None = None,
+    ) -> None:
+        """Antrikan satu pesan; timestamp diambil saat dipanggil, bukan saat dikirim."""
+        entry: dict[str, Any] = {
+            "id": uuid.uuid4().hex,
+            "participant_type": participant_type,
+            "message": message,
+            "timestamp": datetime.now().isoformat(),
+        }
+        if status:
+            entry["status"] = status
+        if result:
+            entry["result"] = result
+        if response_delay is not None:
+            entry["response_delay"] = round(response_delay, 3)
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Log queue for {self.session_id} full, dropped {self.dropped} oldest entries")
+        self._pending.append(entry)
+        self._idle.clear()
+        self._wakeup.set()
+
+    def log_usage(self, usage: dict[str, Any]) -> None:
+        """Antrikan pemakaian token satu respon model (lihat ``prompts.usage_from_realtime``)."""
+        if len(self._usage) >= self.max_pending:
+            self._usage.pop(0)
+            self.dropped += 1
+        self._usage.append({"timestamp": datetime.now().isoformat(), **usage})
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Tunggu sampai semua entry yang sudah diantrikan terkirim (atau dibuang)."""
+        if self._task is None:
+            return
+        self._urgent = True
+        self._wakeup.set()
+        await self._idle.wait()
+
+    async def post(self, path: str, payload: dict[str, Any]) -> tuple[int, Any]:
+        """POST JSON ke API lewat koneksi yang sama; (status, body)."""
+        async with self._http.post(f"{self.api_base_url}{path}", json=payload) as response:
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = await response.text()
+            return response.status, body
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending and not self._usage:
+                self._urgent = False
+                self._idle.set()
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Kumpulkan sampai batch penuh, flush_interval habis, atau flush/stop
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size and not (self._urgent or self._closing):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            usage, self._usage = self._usage, []
+            await self._send(batch, usage)
+
+    async def _send(self, batch: list[dict[str, Any]], usage: list[dict[str, Any]]) -> None:
+        payload: dict[str, Any] = {"session_id": self.session_id, "entries": batch}
+        if usage:
+            payload["usage"] = [{k: v for k, v in item.items() if v is not None} for item in usage]
+        error = ""
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, body = await self.post("/log-conversation/batch", payload)
+                if status == 200:
+                    self.sent += len(batch) + len(usage)
+                    CONVERSATION_LOG_SEND_SECONDS.labels("sent").observe(time.perf_counter() - started)
+                    return
+                error = f"HTTP {status}: {body}"
+                if 400 <= status < 500:
+                    # Ditolak server; mengirim ulang tidak akan berhasil
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.max_retries:
+                await asyncio.sleep(min(RETRY_BACKOFF * 2**attempt, MAX_BACKOFF))
+        CONVERSATION_LOG_SEND_SECONDS.labels("dropped").observe(time.perf_counter() - started)
+        self.dropped += len(batch) + len(usage)
+        logger.error(f"Dropping {len(batch) + len(usage)} log entries for {self.session_id}: {error}")
@@ -0,0 +1,133 @@
+"""Server-push event stream (Server-Sent Events) untuk dashboard.
+
+``EventBroker`` menyimpan event terakhir di ring buffer sehingga client yang
+reconnect dengan ``Last-Event-ID`` bisa melanjutkan tanpa kehilangan event.
+``publish`` aman dipanggil dari thread mana pun (misalnya dari listener
+``CallLogStore``); pengiriman ke subscriber selalu lewat event loop
+subscriber tersebut.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+logger = logging.getLogger("event-stream")
+
+HEARTBEAT_INTERVAL = 15.0
+
+
+class Event:
+    __slots__ = ("data", "id", "session_id", "type")
+
+    def __init__(self, id: int, type: str, session_id: str | None, data: dict[str, Any]):
+        self.id = id
+        self.type = type
+        self.session_id = session_id
+        self.data = data
+
+    def encode(self) -> str:
+        """Format wire SSE."""
+        payload = json.dumps({"session_id": self.session_id, **self.data}, ensure_ascii=False)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, session_id: str | None, max_queue: int):
+        self.session_id = session_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[Event | None] = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def wants(self, event: Event) -> bool:
+        return self.session_id is None or event.session_id == self.session_id
+
+    def deliver(self, event: Event) -> None:
+        # Dijalankan di event loop subscriber
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client terlalu lambat: putuskan, client akan reconnect dengan Last-Event-ID
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """Fan-out event ke semua subscriber SSE dengan replay dari ring buffer."""
+
+    def __init__(self, buffer_size: int = 1000, max_queue: int = 500):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._buffer: deque[Event] = deque(maxlen=buffer_size)
+        self._subscribers: list[_Subscriber] = []
+        # Id berbasis waktu agar tetap naik setelah restart server
+        self._next_id = int(time.time() * 1000)
+
+    def publish(self, type: str, data: dict[str, Any], session_id: str | None = None) -> Event:
+        with self._lock:
+            self._next_id += 1
+            event = Event(self._next_id, type, session_id, data)
+            self._buffer.append(event)
+            subscribers = [sub for sub in self._subscribers if sub.wants(event)]
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.deliver, event)
+            except RuntimeError:
+                # Loop subscriber sudah ditutup
+                pass
+        return event
+
+    def _replay(self, sub: _Subscriber, last_event_id: int | None) -> list[Event] | None:
+        """Event yang terlewat sejak ``last_event_id``; None jika buffer sudah lewat."""
+        if last_event_id is None:
+            return []
+        if self._buffer and self._buffer[0].id > last_event_id + 1:
+            return None
+        return [event for event in self._buffer if event.id > last_event_id and sub.wants(event)]
+
+    async def stream(self, session_id: str | None = None, last_event_id: int | None = None) -> AsyncIterator[str]:
+        """Generator SSE: replay event terlewat, lalu event live + heartbeat."""
+        sub = _Subscriber(session_id, self.max_queue)
+        with self._lock:
+            missed = self._replay(sub, last_event_id)
+            self._subscribers.append(sub)
+        try:
+            yield "retry: 3000\n\n"
+            if missed is None:
+                # Terlalu lama terputus: minta client ambil ulang state lengkap
+                yield Event(self._next_id, "reset", session_id, {}).encode()
+            else:
+                for event in missed:
+                    yield event.encode()
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    logger.warning(f"Dropping slow event subscriber (session={session_id})")
+                    break
+                yield event.encode()
+        finally:
+            with self._lock:
+                self._subscribers.remove(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+def parse_last_event_id(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,132 @@
+"""Antrian job ingest PDF (ekstraksi teks + OCR) di background.
+
+Upload cukup mendaftarkan job lalu langsung membalas dengan job id; worker
+asyncio dengan konkurensi terbatas menjalankan pipeline ekstraksi. File
+yang sama (hash konten sama) yang diupload lagi selama job-nya masih
+berjalan menempel ke job yang sudah ada, bukan memulai OCR kedua.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable
+
+logger = logging.getLogger("ingest-jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+@dataclass
+class IngestJob:
+    id: str
+    pdf_path: str
+    content_hash: str
+    status: str = QUEUED
+    pages_done: int = 0
+    pages_total: int | None = None
+    text_length: int | None = None
+    error: str | None = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: str | None = None
+    finished_at: str | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+# Pipeline yang dijalankan worker; mengembalikan panjang teks akhir
+JobProcessor = Callable[[IngestJob], Awaitable[int]]
+# Dipanggil setiap status/progress job berubah
+JobListener = Callable[[IngestJob], None]
+
+
+class IngestJobQueue:
+    def __init__(
+        self,
+        process: JobProcessor,
+        concurrency: int = 2,
+        on_update: JobListener | None = None,
+        max_finished_jobs: int = 500,
+    ):
+        self.process = process
+        self.concurrency = concurrency
+        self.on_update = on_update
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._in_flight: dict[str, IngestJob] = {}
+        self._queue: asyncio.Queue | None = None
+        self._workers = []
+
+    def get(self, job_id: str) -> IngestJob | None:
+        return self._jobs.get(job_id)
+
+    def notify(self, job: IngestJob) -> None:
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception:
+                logger.exception("Ingest job listener failed")
+
+    def find_in_flight(self, content_hash: str) -> IngestJob | None:
+        return self._in_flight.get(content_hash)
+
+    def submit(self, pdf_path: str, content_hash: str) -> tuple[IngestJob, bool]:
+        """Daftarkan job; (job, False) jika file yang sama sedang diproses."""
+        existing = self._in_flight.get(content_hash)
+        if existing is not None:
+            logger.info(f"Attaching upload to in-flight ingest job {existing.id}")
+            return existing, False
+        job = IngestJob(id=str(uuid.uuid4()), pdf_path=pdf_path, content_hash=content_hash)
+        self._jobs[job.id] = job
+        self._in_flight[content_hash] = job
+        self._queue.put_nowait(job)
+        self._prune()
+        self.notify(job)
+        return job, True
+
+    def _prune(self) -> None:
+        # Simpan riwayat job selesai secukupnya
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            job.started_at = datetime.now().isoformat()
+            self.notify(job)
+            try:
+                job.text_length = await self.process(job)
+                job.status = COMPLETED
+            except Exception as e:
+                logger.exception(f"Ingest job {job.id} failed")
+                job.status = FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                self._in_flight.pop(job.content_hash, None)
+                self._queue.task_done()
+            self.notify(job)
@@ -3,21 +3,41 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import time
 import uuid
-import requests
+import aiohttp
+from collections.abc import AsyncIterable
 from dataclasses import asdict, dataclass
-from typing import Any, Dict
+from typing import Any
 
 from livekit.agents import (
+    NOT_GIVEN,
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     WorkerType,
     cli,
 )
-from livekit.agents import AgentSession, Agent
+from livekit.agents import AgentSession, Agent, ModelSettings, RunContext, function_tool
+from livekit.agents import BackgroundAudioPlayer, BuiltinAudioClip
+from livekit.agents.metrics import RealtimeModelMetrics
 from livekit.plugins import openai
 
+from admission import AdmissionTicket
+from conversation_log import ConversationLogger
+from menu_cache import MenuCache
+from telemetry import VOICE_RESPONSE_SECONDS
+from prompts import MENU_TOOL_NOTE, VOICE_POLICY, PromptPrefix, build_prefix, usage_from_realtime
+from worker_load import WorkerLoad
+from control_tokens import (
+    CLOSE_CALL_CONFIRMED,
+    ORDER_CONFIRMED,
+    TRANSFER_TO_HUMAN,
+    ControlEvent,
+    ControlTokenStream,
+)
+
 from dotenv import load_dotenv
 import os
 
@@ -26,6 +46,198 @@ load_dotenv(dotenv_path=".env.local")
 logger = logging.getLogger("my-worker")
 logger.setLevel(logging.INFO)
 
+API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8002")
+# Menu sependek ini ditempel utuh di instructions; yang lebih panjang dicari lewat tool
+MENU_INLINE_CHARS = int(os.getenv("MENU_INLINE_CHARS", "3000"))
+RETRIEVE_TOP_K = int(os.getenv("RETRIEVE_TOP_K", "4"))
+# Log percakapan dikirim per batch ke POST /log-conversation/batch
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "20"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_MAX_PENDING = int(os.getenv("LOG_MAX_PENDING", "1000"))
+LOG_FLUSH_TIMEOUT = float(os.getenv("LOG_FLUSH_TIMEOUT", "5"))
+# Panggilan ditutup jika penelepon dan agent sama-sama diam selama ini (detik, 0 = nonaktif)
+CALLER_AWAY_TIMEOUT = float(os.getenv("CALLER_AWAY_TIMEOUT", "60"))
+# Worker dianggap penuh saat session aktif atau CPU mencapai batas ini
+MAX_CALLS_PER_WORKER = int(os.getenv("MAX_CALLS_PER_WORKER", "20"))
+WORKER_CPU_LIMIT = float(os.getenv("WORKER_CPU_LIMIT", "0.8"))
+# Penelepon yang antri lebih lama dari ini dialihkan ke WhatsApp
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "120"))
+HOLD_ANNOUNCE_INTERVAL = float(os.getenv("HOLD_ANNOUNCE_INTERVAL", "45"))
+WHATSAPP_BUSINESS_NUMBER = os.getenv("WHATSAPP_BUSINESS_NUMBER", "")
+# Metrik Prometheus worker di :PROMETHEUS_PORT/metrics (kosong = nonaktif); job berjalan di
+# proses anak, jadi nilai histogram dikumpulkan lewat direktori multiprocess
+PROMETHEUS_PORT = os.getenv("PROMETHEUS_PORT", "9100")
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/call-agent-prometheus")
+
+@function_tool
+async def cari_menu(context: RunContext, query: str) -> str:
+    """Cari bagian menu/dokumen yang relevan, misalnya nama makanan, kategori atau harga.
+
+    Args:
+        query: Kata kunci dari pertanyaan pelanggan, misalnya "sate ayam" atau "minuman dingin"
+    """
+    state: CallState = context.userdata
+    try:
+        async with state.http.get(f"{state.api_base_url}/retrieve", params={"q": query, "k": RETRIEVE_TOP_K}) as response:
+            chunks = (await response.json()).get("chunks", []) if response.status == 200 else []
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.error(f"Error retrieving menu: {e}")
+        return "Menu sedang tidak bisa diakses."
+    if not chunks:
+        return "Tidak ada item menu yang cocok."
+    return "\n...\n".join(chunk["text"] for chunk in sorted(chunks, key=lambda c: c["position"]))
+
+class CallAgent(Agent):
+    """Agent yang menjalankan token kontrol langsung dari transcript streaming.
+
+    Audio realtime disintesis di server OpenAI, jadi teks kontrol tidak bisa
+    dipotong dari audionya; begitu token terdeteksi, ucapan yang sedang
+    berjalan dihentikan supaya payload tidak terbaca ke pelanggan, dan token
+    beserta payload tidak ikut ke transcript yang ditampilkan.
+
+    Interrupt membatalkan task yang membaca generator ini, jadi aksi token
+    dijalankan sebagai task terpisah (dimulai sebelum interrupt) dan pesan
+    agent dicatat di ``finally``, termasuk ucapan yang dipotong penelepon.
+    """
+
+    def __init__(self, *, on_control, on_message, **kwargs):
+        super().__init__(**kwargs)
+        self._on_control = on_control
+        self._on_message = on_message
+        self._actions: set[asyncio.Task] = set()
+
+    def _start_action(self, event: ControlEvent) -> None:
+        task = asyncio.create_task(self._on_control(event), name=f"control_{event.token}")
+        self._actions.add(task)
+        task.add_done_callback(self._action_done)
+
+    def _action_done(self, task: asyncio.Task) -> None:
+        self._actions.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Control action {task.get_name()} failed: {task.exception()}")
+
+    async def wait_for_actions(self, timeout: float) -> None:
+        """Tunggu aksi token yang masih berjalan (mis. POST /confirm-order) sebelum klien ditutup."""
+        if not self._actions:
+            return
+        _, pending = await asyncio.wait(set(self._actions), timeout=timeout)
+        for task in pending:
+            logger.warning(f"Control action {task.get_name()} still running at call end, cancelling")
+            task.cancel()
+
+    async def transcription_node(self, text: AsyncIterable[str], model_settings: ModelSettings) -> AsyncIterable[str]:
+        stream = ControlTokenStream()
+        raw = []
+        try:
+            async for delta in text:
+                raw.append(delta)
+                speakable, events = stream.feed(delta)
+                for event in events:
+                    self._start_action(event)
+                    self.session.interrupt()
+                if speakable:
+                    yield speakable
+            speakable, events = stream.finish()
+            for event in events:
+                self._start_action(event)
+            if speakable:
+                yield speakable
+        finally:
+            # Pesan utuh (termasuk token) tetap dicatat untuk audit dan keyword,
+            # juga jika generator dibatalkan oleh interrupt
+            if raw:
+                self._on_message("".join(raw))
+
+class HoldLine:
+    """Pesan tunggu dan musik untuk penelepon yang antri, tanpa session realtime.
+
+    Pesan disintesis dengan TTS biasa, jadi penelepon yang antri tidak ikut
+    memakai kuota model realtime.
+    """
+
+    def __init__(self, room, api_key: str, announce_interval: float):
+        self._room = room
+        self._api_key = api_key
+        self._announce_interval = announce_interval
+        self._tts = None
+        self._player = BackgroundAudioPlayer()
+        self._started = False
+        self._music = None
+        self._speech = None
+        self._last_announce = None
+
+    def update(self, status: dict[str, Any]):
+        """Callback ``AdmissionTicket.wait``: umumkan posisi dan ETA, lalu ulangi berkala"""
+        now = time.monotonic()
+        if self._last_announce is not None and now - self._last_announce < self._announce_interval:
+            return
+        if self._speech is not None and not self._speech.done():
+            return
+        self._last_announce = now
+        minutes = max(1, round(status["eta_seconds"] / 60))
+        text = (
+            "Mohon maaf, semua agent kami sedang melayani pelanggan lain. "
+            f"Anda berada di antrian nomor {status['position']}, perkiraan waktu tunggu sekitar {minutes} menit. "
+            "Mohon tetap di saluran."
+        )
+        self._speech = asyncio.create_task(self.say(text))
+
+    async def say(self, text: str, music: bool = True):
+        if not self._started:
+            await self._player.start(room=self._room)
+            self._started = True
+        if self._music is not None:
+            self._music.stop()
+            self._music = None
+        try:
+            await self._player.play(self._frames(text))
+        except Exception:
+            logger.exception("Error playing hold message")
+        if music:
+            self._music = self._player.play(BuiltinAudioClip.HOLD_MUSIC, loop=True)
+
+    async def _frames(self, text: str):
+        if self._tts is None:
+            self._tts = openai.TTS(api_key=self._api_key)
+        async with self._tts.synthesize(text) as stream:
+            async for audio in stream:
+                yield audio.frame
+
+    async def aclose(self):
+        if self._speech is not None:
+            self._speech.cancel()
+            await asyncio.gather(self._speech, return_exceptions=True)
+        if self._started:
+            await self._player.aclose()
+            self._started = False
+
+class SharedHttp:
+    """Satu ``aiohttp.ClientSession`` per proses worker, dibuat di ``prewarm``.
+
+    ``prewarm`` berjalan sebelum proses job punya event loop, sedangkan
+    ClientSession terikat ke loop yang memakainya; session dibuka saat pertama
+    dipakai di loop job dan koneksi keep-alive-nya dipakai semua request proses.
+    """
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    def get(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+@dataclass
+class CallState:
+    """Userdata AgentSession: klien HTTP bersama untuk tool dan aksi"""
+    http: aiohttp.ClientSession
+    api_base_url: str
+
 @dataclass
 class SessionConfig:
     openai_api_key: str
@@ -38,7 +250,7 @@ class SessionConfig:
     def to_dict(self):
         return {k: v for k, v in asdict(self).items() if k != "openai_api_key"}
 
-def parse_session_config(data: Dict[str, Any]) -> SessionConfig:
+def parse_session_config(data: dict[str, Any]) -> SessionConfig:
     return SessionConfig(
         openai_api_key=os.getenv("OPENAI_API_KEY"),
         instructions=data.get("instructions", "Anda adalah Interactive Call Agent AI."),
@@ -48,102 +260,215 @@ def parse_session_config(data: Dict[str, Any]) -> SessionConfig:
         modalities=["text", "audio"],
     )
 
-async def entrypoint(ctx: JobContext):
-    logger.info(f"connecting to room {ctx.room.name}")
-    await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+def build_instructions(pdf_text: str, menu_version: int | None = None) -> PromptPrefix:
+    # Instructions tidak berisi data panggilan, jadi seluruhnya adalah prefix statis
+    return build_prefix(
+        "voice",
+        VOICE_POLICY,
+        pdf_text,
+        menu_version=menu_version,
+        menu_chars=MENU_INLINE_CHARS,
+        tool_note=MENU_TOOL_NOTE,
+    )
+
+def prewarm(proc: JobProcess):
+    """Dijalankan sekali per proses worker, sebelum proses menerima panggilan"""
+    menu = MenuCache(API_BASE_URL, build_instructions)
+    menu.load()
+    proc.userdata["menu"] = menu
+    proc.userdata["http"] = SharedHttp()
 
-    participant = await ctx.wait_for_participant()
+async def entrypoint(ctx: JobContext):
+    started = time.perf_counter()
+    timings: dict[str, int] = {}
+    
+    def mark(step: str):
+        timings[step] = round((time.perf_counter() - started) * 1000)
+    
+    api_base_url = API_BASE_URL
+    menu = ctx.proc.userdata.get("menu") or MenuCache(api_base_url, build_instructions)
+    # Koneksi HTTP (keep-alive) proses ini untuk cek menu, tool, log dan aksi
+    shared_http = ctx.proc.userdata.get("http") or SharedHttp()
+    http = shared_http.get()
+    
+    # Setup session
+    session_id = str(uuid.uuid4())
+    # Di-set oleh event pertama yang mengakhiri panggilan (lihat end_call)
+    call_ended = asyncio.Event()
+    end_reason = None
+    
+    def end_call(reason: str):
+        nonlocal end_reason
+        if not call_ended.is_set():
+            end_reason = reason
+            call_ended.set()
+    
+    # Log dan aksi ke API lewat antrian batch + koneksi aiohttp bersama
+    conversation_log = ConversationLogger(
+        api_base_url,
+        session_id,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        max_pending=LOG_MAX_PENDING,
+        http=http,
+    )
+    conversation_log.start()
+    ticket = AdmissionTicket(conversation_log.post, session_id, worker_id=ctx.worker_id)
+    
+    async def close_clients():
+        await ticket.release()
+        await conversation_log.stop()
+        # Proses job berakhir bersama panggilannya, jadi session ditutup di sini
+        await shared_http.aclose()
+    
+    # Sisa log tetap dikirim walaupun job dimatikan karena penelepon menutup telepon
+    ctx.add_shutdown_callback(close_clients)
+    
+    async def connect_caller():
+        logger.info(f"connecting to room {ctx.room.name}")
+        await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+        mark("connected")
+        participant = await ctx.wait_for_participant()
+        mark("participant")
+        return participant
+    
+    async def refresh_menu():
+        await menu.refresh(http)
+        mark("menu")
+    
+    # Koneksi room dan cek versi menu tidak saling bergantung
+    participant, _ = await asyncio.gather(connect_caller(), refresh_menu())
     metadata = json.loads(participant.metadata) if participant.metadata else {}
     config = parse_session_config(metadata)
 
     if not config.openai_api_key:
-        print(config.openai_api_key)
-        raise Exception("OpenAI API Key is required")
-
-    # Get PDF text from backend API
-    pdf_text = ""
-    api_base_url = os.getenv("API_BASE_URL", "http://127.0.0.1:8002")
-    try:
-        response = requests.get(f"{api_base_url}/pdf-text")
-        if response.status_code == 200:
-            pdf_data = response.json()
-            pdf_text = pdf_data.get("text", "")
-    except Exception as e:
-        logger.error(f"Error fetching PDF text: {e}")
-
-    # Build instructions
-    instructions = "Anda adalah Interactive Call Agent AI yang membantu pelanggan. Jangan menyebutkan nama bisnis kecuali diminta."
-    instructions += "\n\nFITUR PEMESANAN: Bantu pelanggan memesan makanan dari menu yang tersedia."
-    instructions += "\n\nKONFIRMASI PESANAN: Setelah pelanggan konfirmasi pesanan, tanyakan nama, nomor telepon, email (opsional), dan alamat pengiriman. Lalu katakan 'ORDER_CONFIRMED' diikuti detail dalam format: NAMA|TELEPON|EMAIL|ALAMAT|ITEM1,ITEM2|TOTAL|CATATAN"
-    instructions += "\n\nAUTO CALL CLOSURE: Katakan 'CLOSE_CALL_CONFIRMED' untuk menutup panggilan."
-    instructions += "\n\nHUMAN TAKEOVER: Katakan 'TRANSFER_TO_HUMAN' untuk transfer ke staff."
+        raise ValueError("OpenAI API Key is required")
+    
+    @ctx.room.on("participant_disconnected")
+    def on_participant_disconnected(remote):
+        if remote.identity == participant.identity:
+            end_call("caller disconnected")
+    
+    @ctx.room.on("disconnected")
+    def on_room_disconnected(reason):
+        end_call("room disconnected")
     
-    if pdf_text:
-        instructions += f"\n\nMENU MAKANAN:\n{pdf_text[:5000]}"
+    # Penelepon bisa sudah keluar sebelum handler terpasang
+    if participant.identity not in ctx.room.remote_participants:
+        end_call("caller disconnected")
+    
+    # Admission: tunggu slot session realtime sebelum model dibuat
+    hold = HoldLine(ctx.room, config.openai_api_key, HOLD_ANNOUNCE_INTERVAL)
+    waiting = asyncio.create_task(ticket.wait(ADMISSION_MAX_WAIT, on_wait=hold.update))
+    hung_up = asyncio.create_task(call_ended.wait())
+    await asyncio.wait({waiting, hung_up}, return_when=asyncio.FIRST_COMPLETED)
+    hung_up.cancel()
+    if not waiting.done():
+        # Penelepon menutup telepon saat antri
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await hold.aclose()
+        await close_clients()
+        ctx.shutdown(reason=end_reason)
+        return
+    mark("admitted")
+    if not waiting.result():
+        caller_phone = participant.attributes.get("sip.phoneNumber") or metadata.get("phone")
+        text = "Mohon maaf, antrian panggilan sedang panjang."
+        if caller_phone:
+            text += " Kami sudah mengirim pesan WhatsApp ke nomor Anda, silakan lanjutkan pesanan lewat chat."
+        elif WHATSAPP_BUSINESS_NUMBER:
+            text += f" Silakan pesan lewat WhatsApp kami di nomor {' '.join(WHATSAPP_BUSINESS_NUMBER)}."
+        text += " Terima kasih."
+        await ticket.release(routed_to="whatsapp", caller_phone=caller_phone)
+        await hold.say(text, music=False)
+        await hold.aclose()
+        note = f"Caller routed to WhatsApp after {ticket.waited:.0f}s in admission queue"
+        conversation_log.log("system", note, status="completed")
+        logger.info(f"{session_id}: {note}")
+        await close_clients()
+        ctx.shutdown(reason="routed to whatsapp")
+        return
+    await hold.aclose()
+    if ticket.waited >= 1:
+        logger.info(f"{session_id} admitted after {ticket.waited:.0f}s in admission queue")
 
-    # Setup session
-    session_id = str(uuid.uuid4())
-    call_ended = False
+    instructions = menu.instructions
+    prompt_version = menu.prefix.version
+    # Akhir ucapan penelepon yang belum dijawab, dan delay respon untuk pesan agent berikutnya
+    speech_ended_at = None
+    pending_delay = None
+    
+    def log_message(participant_type: str, message: str, status: str | None = None, response_delay: float | None = None):
+        conversation_log.log(participant_type, message, status=status, response_delay=response_delay)
     
-    def log_message(participant_type: str, message: str, status: str = "active"):
+    async def post_action(path: str, payload: dict[str, Any]):
+        # Log yang sudah diantrikan ditulis dulu supaya urutan di call log tetap benar
         try:
-            from datetime import datetime
-            api_base_url = os.getenv("API_BASE_URL", "http://127.0.0.1:8002")
-            requests.post(f"{api_base_url}/log-conversation", json={
+            await asyncio.wait_for(conversation_log.flush(), LOG_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Log flush before {path} timed out")
+        return await conversation_log.post(path, payload)
+    
+    async def process_order_confirmation(order: dict[str, Any]):
+        """Kirim pesanan yang sudah di-parse dari payload ORDER_CONFIRMED"""
+        try:
+            status, result = await post_action("/confirm-order", {"session_id": session_id, **order})
+            if status == 200:
+                logger.info(f"Order confirmed and notifications sent: {result}")
+            else:
+                logger.error(f"Error confirming order: {result}")
+                
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error processing order confirmation: {e}")
+    
+    async def request_transfer():
+        try:
+            await post_action("/request-staff-takeover", {
                 "session_id": session_id,
-                "participant_type": participant_type,
-                "message": message,
-                "timestamp": datetime.now().isoformat(),
-                "status": status
+                "message": "Agent meminta transfer ke staff"
             })
-            
-            # Deteksi konfirmasi pesanan
-            if "ORDER_CONFIRMED" in message and participant_type == "agent":
-                process_order_confirmation(message)
-                
-        except Exception as e:
-            logger.error(f"Error logging: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error requesting transfer: {e}")
     
-    def process_order_confirmation(message: str):
-        """Proses konfirmasi pesanan dan kirim notifikasi"""
+    async def close_call():
         try:
-            # Parse detail pesanan dari format: ORDER_CONFIRMED NAMA|TELEPON|EMAIL|ALAMAT|ITEM1,ITEM2|TOTAL|CATATAN
-            if "ORDER_CONFIRMED" in message:
-                parts = message.split("ORDER_CONFIRMED")[1].strip().split("|")
-                if len(parts) >= 6:
-                    customer_name = parts[0].strip()
-                    customer_phone = parts[1].strip()
-                    customer_email = parts[2].strip() if parts[2].strip() else None
-                    delivery_address = parts[3].strip()
-                    order_items = [item.strip() for item in parts[4].split(",")]
-                    total_amount = float(parts[5].strip().replace("Rp", "").replace(".", "").replace(",", ""))
-                    notes = parts[6].strip() if len(parts) > 6 else None
-                    
-                    # Kirim ke endpoint konfirmasi pesanan
-                    order_data = {
-                        "session_id": session_id,
-                        "customer_name": customer_name,
-                        "customer_phone": customer_phone,
-                        "customer_email": customer_email,
-                        "delivery_address": delivery_address,
-                        "order_items": order_items,
-                        "total_amount": total_amount,
-                        "notes": notes
-                    }
-                    
-                    api_base_url = os.getenv("API_BASE_URL", "http://127.0.0.1:8002")
-                    response = requests.post(f"{api_base_url}/confirm-order", json=order_data)
-                    if response.status_code == 200:
-                        result = response.json()
-                        logger.info(f"Order confirmed and notifications sent: {result}")
-                    else:
-                        logger.error(f"Error confirming order: {response.text}")
-                        
-        except Exception as e:
-            logger.error(f"Error processing order confirmation: {e}")
+            from datetime import datetime
+            await post_action("/close-call", {
+                "session_id": session_id,
+                "participant_type": "system",
+                "message": "Call closed by agent",
+                "timestamp": datetime.now().isoformat()
+            })
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error closing call: {e}")
+    
+    async def handle_control(event: ControlEvent):
+        """Jalankan aksi token kontrol begitu terdeteksi di transcript"""
+        logger.info(f"Control token {event.token} detected at char {event.offset}")
+        if event.token == ORDER_CONFIRMED:
+            if event.payload is None:
+                logger.error(f"Invalid ORDER_CONFIRMED payload: {event.raw_payload}")
+                return
+            await process_order_confirmation(event.payload)
+        elif event.token == TRANSFER_TO_HUMAN:
+            await request_transfer()
+        elif event.token == CLOSE_CALL_CONFIRMED:
+            await close_call()
+            end_call("call closed by agent")
+    
+    def log_agent_message(message: str):
+        nonlocal pending_delay
+        log_message("agent", message, response_delay=pending_delay)
+        pending_delay = None
 
     # Create agent
-    agent = Agent(instructions=instructions)
+    agent = CallAgent(
+        instructions=instructions,
+        tools=[cari_menu],
+        on_control=handle_control,
+        on_message=log_agent_message,
+    )
     
     try:
         realtime_model = openai.realtime.RealtimeModel(
@@ -153,30 +478,84 @@ async def entrypoint(ctx: JobContext):
             modalities=config.modalities,
         )
         
-        session = AgentSession(llm=realtime_model)
+        session = AgentSession(
+            llm=realtime_model,
+            userdata=CallState(http=http, api_base_url=api_base_url),
+            user_away_timeout=CALLER_AWAY_TIMEOUT if CALLER_AWAY_TIMEOUT > 0 else None,
+        )
         
-        await session.start(agent=agent, room=ctx.room)
-        log_message("system", "Session started")
+        @session.on("agent_state_changed")
+        def on_agent_state_changed(event):
+            nonlocal speech_ended_at, pending_delay
+            if event.new_state == "speaking" and speech_ended_at is not None:
+                pending_delay = max(0.0, event.created_at - speech_ended_at)
+                speech_ended_at = None
+                VOICE_RESPONSE_SECONDS.observe(pending_delay)
+            if event.new_state == "speaking" and "first_audio" not in timings:
+                mark("first_audio")
+                logger.info(
+                    f"Time to first agent audio for {session_id}: {timings['first_audio']} ms since job start, "
+                    f"{timings['first_audio'] - timings['participant']} ms since caller joined"
+                )
         
-        # Monitor session dan pesan
-        async def message_handler(message):
-            if hasattr(message, 'content'):
-                log_message("agent", message.content)
+        @session.on("metrics_collected")
+        def on_metrics_collected(event):
+            # Token input/cached/output per respon realtime untuk call log dan analytics
+            if isinstance(event.metrics, RealtimeModelMetrics):
+                conversation_log.log_usage(usage_from_realtime(event.metrics, prompt_version))
+        
+        @session.on("user_state_changed")
+        def on_user_state_changed(event):
+            nonlocal speech_ended_at
+            if event.old_state == "speaking" and event.new_state == "listening":
+                speech_ended_at = event.created_at
+            if event.new_state == "away":
+                end_call("caller away")
+        
+        @session.on("conversation_item_added")
+        def on_conversation_item_added(event):
+            # Pesan agent sudah dicatat utuh (dengan token) di CallAgent.transcription_node
+            if event.item.role == "user" and event.item.text_content:
+                log_message("user", event.item.text_content)
+        
+        @session.on("close")
+        def on_session_close(event):
+            if event.error:
+                logger.error(f"Session {session_id} closed with error: {event.error}")
+            end_call(f"session closed ({event.reason})")
+        
+        await session.start(agent=agent, room=ctx.room)
+        mark("session_started")
+        logger.info(f"Call setup for {session_id} (ms since job start): {timings}")
+        log_message("system", "Session started", "active")
         
-        # Monitor session
-        while not call_ended:
-            await asyncio.sleep(2)
+        await call_ended.wait()
+        logger.info(f"Ending call {session_id}: {end_reason}")
+        if end_reason != "call closed by agent":
+            log_message("system", f"Call ended: {end_reason}", "completed")
+        await session.aclose()
             
     except Exception as e:
         logger.error(f"Error: {e}")
         log_message("system", f"Error: {str(e)}", "error")
         raise
+    finally:
+        # Aksi token (konfirmasi pesanan dsb.) memakai koneksi HTTP yang sama
+        await agent.wait_for_actions(LOG_FLUSH_TIMEOUT)
+        await close_clients()
 
-    logger.info(f"Agent started for session {session_id}")
+    logger.info(f"Agent finished for session {session_id}")
+    # Lepas job (dan proses worker-nya) segera, tanpa menunggu room kosong
+    ctx.shutdown(reason=end_reason)
 
 if __name__ == "__main__":
     cli.run_app(WorkerOptions(
         entrypoint_fnc=entrypoint, 
+        prewarm_fnc=prewarm,
+        load_fnc=WorkerLoad(MAX_CALLS_PER_WORKER, WORKER_CPU_LIMIT),
+        load_threshold=1.0,
+        prometheus_port=int(PROMETHEUS_PORT) if PROMETHEUS_PORT else NOT_GIVEN,
+        prometheus_multiproc_dir=PROMETHEUS_MULTIPROC_DIR if PROMETHEUS_PORT else None,
         worker_type=WorkerType.ROOM,
         ws_url=os.getenv("LIVEKIT_URL"),
         api_key=os.getenv("LIVEKIT_API_KEY"),
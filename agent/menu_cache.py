@@ -0,0 +1,80 @@
+"""Cache teks menu dan instructions agent per proses worker.
+
+Diisi sekali saat prewarm (sebelum ada panggilan) dan diperbarui di awal
+setiap panggilan dengan ``GET /pdf-text`` bersyarat: ``If-None-Match``
+berisi ETag versi yang dipegang, sehingga selama menu tidak berubah API
+cukup membalas 304 tanpa body dan instructions tidak dibangun ulang. Jika
+API tidak bisa dihubungi, versi terakhir tetap dipakai.
+
+Instructions disimpan sebagai ``PromptPrefix`` yang hanya berubah bersama
+versi menu, sehingga semua panggilan di worker memakai prefix yang sama
+persis dan prompt cache OpenAI bisa kena.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable
+
+import aiohttp
+import requests
+
+from prompts import PromptPrefix
+
+logger = logging.getLogger("menu-cache")
+
+
+class MenuCache:
+    def __init__(self, api_base_url: str, build_instructions: Callable[[str, int | None], PromptPrefix]):
+        self.api_base_url = api_base_url.rstrip("/")
+        self.build_instructions = build_instructions
+        self.text = ""
+        self.version: int | None = None
+        self.etag: str | None = None
+        self.prefix = build_instructions("", None)
+        self.checked_at: float | None = None
+
+    @property
+    def instructions(self) -> str:
+        return self.prefix.text
+
+    def _headers(self) -> dict:
+        return {"If-None-Match": self.etag} if self.etag else {}
+
+    def _apply(self, etag: str | None, data: dict) -> None:
+        self.text = data.get("text", "")
+        self.version = data.get("version")
+        self.etag = etag
+        self.prefix = self.build_instructions(self.text, self.version)
+        logger.info(f"Menu cache updated to version {self.version} ({len(self.text)} chars, prompt {self.prefix.version})")
+
+    def load(self, timeout: float = 5.0) -> bool:
+        """Versi blocking untuk prewarm; True jika menu berubah."""
+        try:
+            response = requests.get(f"{self.api_base_url}/pdf-text", headers=self._headers(), timeout=timeout)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching PDF text: {e}")
+            return False
+        self.checked_at = time.monotonic()
+        if response.status_code != 200:
+            return False
+        self._apply(response.headers.get("ETag"), response.json())
+        return True
+
+    async def refresh(self, http: aiohttp.ClientSession, timeout: float = 2.0) -> bool:
+        """Cek versi menu di awal panggilan; True jika menu berubah."""
+        try:
+            async with http.get(
+                f"{self.api_base_url}/pdf-text",
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as response:
+                self.checked_at = time.monotonic()
+                if response.status != 200:
+                    return False
+                self._apply(response.headers.get("ETag"), await response.json())
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Menu refresh failed, using cached version {self.version}: {e}")
+            return False
@@ -0,0 +1,257 @@
+"""Index menu terstruktur yang di-parse dari teks PDF/OCR.
+
+Teks menu diubah menjadi item (nama, kategori, harga, varian, deskripsi)
+sehingga agent bisa mengambil hanya item yang ditanyakan pelanggan lewat
+``GET /menu/search`` dan ``GET /menu/items/{id}``, bukan menempelkan
+seluruh teks menu ke prompt.
+
+Parser mengenali dua pola yang umum di menu kita:
+
+* satu baris per item: ``• Mie Ayam: IDR 29,000`` / ``Nasi Uduk Rp. 11.000``
+* nama di satu baris, deskripsi di baris berikutnya dan harga menempel di
+  akhir deskripsi: ``Sate Ayam`` / ``Chicken satay ...Rp. 38.000``
+"""
+from __future__ import annotations
+
+import difflib
+import hashlib
+import re
+import threading
+from collections import defaultdict
+from typing import Any
+
+# "Rp 25.000", "Rp. 7.000", "IDR 32,000", "Rp25rb", "25k", "25 ribu"
+PRICE_RE = re.compile(
+    r"(?:(?:Rp\.?|IDR)\s*(?P<amount>\d{1,3}(?:[.,]\d{3})+|\d+)(?:,-|\.-)?(?:\s*(?P<suffix>k|rb|ribu)\b)?"
+    r"|\b(?P<short>\d+(?:[.,]\d+)?)\s*(?P<short_suffix>k|rb|ribu)\b)",
+    re.IGNORECASE,
+)
+BULLET_RE = re.compile(r"^\s*(?:[•●▪◦*\-–·]|\d+[.)])\s*")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Glyph ikon (private use area) dari PDF hasil cetak halaman web
+ICON_RE = re.compile(r"[\ue000-\uf8ff]")
+# Header/footer cetakan browser: URL dan tanggal cetak "9/2/25, 8:54 PM"
+NOISE_RE = re.compile(r"https?://|\b\d{1,2}/\d{1,2}/\d{2,4},\s*\d{1,2}:\d{2}")
+CATEGORY_WORDS = {
+    "menu", "appetizer", "appetizers", "makanan", "minuman", "beverage", "beverages",
+    "drinks", "snack", "snacks", "dessert", "desserts", "paket", "package", "side",
+    "sides", "lauk", "sayur", "main", "course", "hidangan", "special", "spesial",
+}
+MAX_PENDING_LINES = 6
+MAX_NAME_LENGTH = 80
+
+
+def normalize(text: str) -> str:
+    return " ".join(TOKEN_RE.findall(text.lower()))
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_price(match: re.Match[str]) -> int:
+    """Harga dalam rupiah dari satu match ``PRICE_RE``."""
+    if match.group("amount"):
+        amount = int(re.sub(r"[.,]", "", match.group("amount")))
+        suffix = match.group("suffix")
+    else:
+        amount = float(match.group("short").replace(",", "."))
+        suffix = match.group("short_suffix")
+    if suffix:
+        amount *= 1000
+    return int(amount)
+
+
+def is_category_line(line: str) -> bool:
+    words = tokenize(line)
+    if not words or len(line) > 40:
+        return False
+    if line.endswith(":"):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) > 2 and all(c.isupper() for c in letters):
+        return True
+    return any(word in CATEGORY_WORDS for word in words)
+
+
+def is_name_line(line: str) -> bool:
+    """Nama item: pendek, diawali huruf kapital dan bukan potongan kalimat."""
+    return len(line) <= 40 and line[:1].isupper() and not line.endswith((",", ".")) and len(line.split()) <= 6
+
+
+def split_variants(name: str) -> tuple[str, list[str]]:
+    """``Fish & Chips (Nasi/French Fries)`` -> ("Fish & Chips", ["Nasi", "French Fries"])."""
+    match = re.search(r"\(([^)]*[/,][^)]*)\)", name)
+    if match:
+        variants = [v.strip() for v in re.split(r"[/,]", match.group(1)) if v.strip()]
+        base = (name[: match.start()] + name[match.end():]).strip()
+        return re.sub(r"\s+", " ", base), variants
+    words = name.split()
+    if words and "/" in words[-1]:
+        variants = [v for v in words[-1].split("/") if v]
+        if len(variants) > 1:
+            return " ".join(words[:-1]) or name, variants
+    return name, []
+
+
+def item_id(category: str | None, name: str) -> str:
+    return hashlib.sha1(f"{normalize(category or '')}|{normalize(name)}".encode()).hexdigest()[:12]
+
+
+def parse_menu(text: str) -> list[dict[str, Any]]:
+    """Parse teks menu menjadi list item berurutan sesuai dokumen."""
+    items: list[dict[str, Any]] = []
+    category: str | None = None
+    pending: list[str] = []
+
+    for raw_line in text.splitlines():
+        bullet = bool(BULLET_RE.match(raw_line))
+        line = BULLET_RE.sub("", ICON_RE.sub("", raw_line)).strip()
+        if not line or NOISE_RE.search(line) and not PRICE_RE.search(NOISE_RE.split(line)[0]):
+            continue
+        prices = list(PRICE_RE.finditer(line))
+        if not prices:
+            if is_category_line(line):
+                category = line.rstrip(":").strip()
+                pending = []
+            else:
+                pending = (pending + [line])[-MAX_PENDING_LINES:]
+            continue
+
+        first = prices[0]
+        before = line[: first.start()].strip(" :-–\t")
+        glued = first.start() > 0 and line[first.start() - 1].isalpha()
+        description = ""
+        continuation = not before or glued or not before[:1].isupper()
+        if pending and continuation and not bullet:
+            # Nama di baris sebelumnya, harga menempel di akhir deskripsi.
+            # Baris sebelum nama adalah sisa deskripsi item sebelumnya.
+            start = next((i for i, text in enumerate(pending) if is_name_line(text)), 0)
+            if start and items and not items[-1]["description"]:
+                items[-1]["description"] = " ".join(pending[:start])
+            name = pending[start]
+            description = " ".join(pending[start + 1:] + [before]).strip()
+        else:
+            if pending and is_name_line(pending[-1]):
+                # Baris tanpa harga sebelum item satu-baris dianggap judul kategori
+                category = pending[-1].rstrip(":").strip()
+            name = before
+        pending = []
+        name = re.sub(r"\s+", " ", name).strip()
+        if not name or len(name) > MAX_NAME_LENGTH:
+            continue
+
+        base_name, variant_names = split_variants(name)
+        variants = [{"name": v, "price": parse_price(first)} for v in variant_names]
+        if len(prices) > 1:
+            # "Small Rp 10.000 / Large Rp 15.000": harga per varian
+            variants = []
+            label_start = 0
+            for match in prices:
+                label = line[label_start: match.start()].strip(" /|:-–\t")
+                if label_start == 0:
+                    label = ""
+                variants.append({"name": label or base_name, "price": parse_price(match)})
+                label_start = match.end()
+
+        items.append({
+            "id": item_id(category, base_name),
+            "name": base_name,
+            "category": category,
+            "price": min(v["price"] for v in variants) if variants else parse_price(first),
+            "price_text": first.group(0).strip(),
+            "variants": variants,
+            "description": description,
+        })
+    return items
+
+
+class MenuIndex:
+    """Index item menu untuk lookup exact dan fuzzy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.items: list[dict[str, Any]] = []
+        self._by_id: dict[str, dict[str, Any]] = {}
+        self._by_name: dict[str, list[str]] = {}
+        self._by_token: dict[str, set[str]] = {}
+        self._vocabulary: list[str] = []
+
+    def rebuild(self, text: str, version: int = 0) -> None:
+        items = parse_menu(text)
+        by_id: dict[str, dict[str, Any]] = {}
+        by_name: dict[str, list[str]] = defaultdict(list)
+        by_token: dict[str, set[str]] = defaultdict(set)
+        for item in items:
+            # Nama sama dalam kategori sama: beri suffix agar id tetap unik
+            base_id, n = item["id"], 1
+            while item["id"] in by_id:
+                n += 1
+                item["id"] = f"{base_id}-{n}"
+            by_id[item["id"]] = item
+            by_name[normalize(item["name"])].append(item["id"])
+            searchable = " ".join([item["name"], item["category"] or ""] + [v["name"] for v in item["variants"]])
+            for token in tokenize(searchable):
+                by_token[token].add(item["id"])
+        with self._lock:
+            self.items = items
+            self.version = version
+            self._by_id = by_id
+            self._by_name = dict(by_name)
+            self._by_token = dict(by_token)
+            self._vocabulary = sorted(by_token)
+
+    def get(self, item_id: str) -> dict[str, Any] | None:
+        return self._by_id.get(item_id)
+
+    def categories(self) -> list[dict[str, Any]]:
+        counts: dict[str, int] = {}
+        for item in self.items:
+            key = item["category"] or ""
+            counts[key] = counts.get(key, 0) + 1
+        return [{"name": name or None, "item_count": count} for name, count in counts.items()]
+
+    def search(self, query: str, limit: int = 10, category: str | None = None) -> list[dict[str, Any]]:
+        """Exact match dulu, lalu fuzzy (token + kemiripan ejaan) berdasarkan skor."""
+        with self._lock:
+            by_id, by_name, by_token, vocabulary = self._by_id, self._by_name, self._by_token, self._vocabulary
+        normalized = normalize(query)
+        if not normalized:
+            return []
+
+        scores: dict[str, float] = {}
+        for exact_id in by_name.get(normalized, []):
+            scores[exact_id] = 2.0
+
+        query_tokens = tokenize(query)
+        candidates: set[str] = set()
+        for token in query_tokens:
+            matches = [token] if token in by_token else []
+            # Prefix ("ayam" -> "ayam", "bak" -> "bakso") dan salah ketik
+            matches += [v for v in vocabulary if v.startswith(token) and v != token][:20]
+            matches += difflib.get_close_matches(token, vocabulary, n=5, cutoff=0.8)
+            for match in matches:
+                candidates |= by_token.get(match, set())
+
+        for candidate in candidates:
+            if candidate in scores:
+                continue
+            item = by_id[candidate]
+            name_tokens = set(tokenize(item["name"]) + tokenize(item["category"] or ""))
+            matched = sum(
+                1 for token in query_tokens
+                if any(t == token or t.startswith(token) or difflib.SequenceMatcher(None, t, token).ratio() >= 0.8 for t in name_tokens)
+            )
+            similarity = difflib.SequenceMatcher(None, normalize(item["name"]), normalized).ratio()
+            scores[candidate] = matched / len(query_tokens) + 0.5 * similarity
+
+        results = []
+        for candidate, score in sorted(scores.items(), key=lambda kv: -kv[1]):
+            item = by_id[candidate]
+            if category and normalize(item["category"] or "") != normalize(category):
+                continue
+            results.append({**item, "score": round(score, 3)})
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,397 @@
+"""Outbox notifikasi pesanan (email/WhatsApp) dengan dispatcher di background.
+
+Notifikasi ditulis ke tabel ``notifications`` di ``orders.db`` dalam
+transaksi yang sama dengan pesanannya, lalu endpoint langsung membalas.
+Dispatcher asyncio mengambil notifikasi yang jatuh tempo, mengirimnya
+dengan konkurensi terbatas dan mencoba ulang kegagalan dengan backoff
+eksponensial. Koneksi SMTP dipakai ulang lewat ``SmtpPool`` alih-alih
+connect/STARTTLS/login untuk setiap email.
+
+Status notifikasi: ``pending`` -> ``sending`` -> ``sent`` atau ``failed``
+(setelah ``max_attempts`` atau kegagalan permanen). Notifikasi yang
+tertinggal di ``sending`` saat proses mati dikembalikan ke ``pending`` saat
+start.
+
+Pemakaian ulang koneksi dan retry/backoff diuji terhadap server aiosmtpd
+lokal di ``tests/test_notification_outbox.py``. Uji manual dengan SMTP
+stand-in::
+
+    python -m aiosmtpd -n -l localhost:8025
+    SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 uvicorn pdf_api:app --port 8002
+"""
+from __future__ import annotations
+
+import asyncio
+import builtins
+import contextlib
+import logging
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Any, Callable
+
+from order_store import OrderStore
+
+logger = logging.getLogger("notification-outbox")
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    session_id TEXT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at REAL NOT NULL,
+    created_at TEXT NOT NULL,
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_order ON notifications (order_id);
+"""
+
+
+class PermanentError(Exception):
+    """Kegagalan yang tidak akan berhasil jika dicoba ulang (alamat ditolak, belum dikonfigurasi)."""
+
+
+# Pengirim per channel: menerima baris notifikasi, raise jika gagal
+Sender = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class SmtpPool:
+    """Pool koneksi SMTP persisten (smtplib, dipakai dari thread worker)."""
+
+    def __init__(
+        self,
+        host: str | None,
+        port: int = 587,
+        user: str | None = None,
+        password: str | None = None,
+        starttls: bool = True,
+        size: int = 2,
+        timeout: float = 30.0,
+        idle_check: float = 60.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._idle: list[tuple] = []  # (koneksi, terakhir dipakai)
+        self._created = 0
+        self._cond = threading.Condition()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.starttls:
+            conn.starttls()
+            conn.ehlo()
+        if self.user:
+            conn.login(self.user, self.password or "")
+        logger.info(f"SMTP connection opened to {self.host}:{self.port}")
+        return conn
+
+    def _acquire(self) -> smtplib.SMTP | None:
+        """Koneksi idle, atau None jika boleh membuka koneksi baru."""
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size:
+                    self._cond.wait()
+                if not self._idle:
+                    self._created += 1
+                    return None
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used <= self.idle_check:
+                return conn
+            # Server bisa menutup koneksi idle; cek dulu sebelum dipakai
+            try:
+                conn.noop()
+                return conn
+            except (smtplib.SMTPException, OSError):
+                with self._cond:
+                    self._discard(conn)
+                    self._cond.notify()
+
+    def _discard(self, conn: smtplib.SMTP) -> None:
+        with contextlib.suppress(OSError):
+            conn.close()
+        self._created -= 1
+
+    def _release(self, conn: smtplib.SMTP | None) -> None:
+        with self._cond:
+            if conn is None:
+                self._created -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def send(self, message: EmailMessage) -> None:
+        """Kirim satu email; koneksi putus dicoba sekali dengan koneksi baru. Blocking."""
+        if not self.configured:
+            raise PermanentError("SMTP_HOST belum dikonfigurasi")
+        conn = self._acquire()
+        try:
+            for attempt in range(2):
+                if conn is None:
+                    conn = self._connect()
+                try:
+                    conn.send_message(message)
+                    return
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    conn.close()
+                    conn = None
+                    if attempt:
+                        raise
+                except smtplib.SMTPRecipientsRefused as e:
+                    raise PermanentError(f"Penerima ditolak: {e.recipients}") from e
+                except smtplib.SMTPResponseException as e:
+                    if 500 <= e.smtp_code < 600:
+                        raise PermanentError(f"SMTP {e.smtp_code}: {e.smtp_error!r}") from e
+                    raise
+        except smtplib.SMTPAuthenticationError as e:
+            raise PermanentError(f"Login SMTP gagal: {e.smtp_code}") from e
+        except PermanentError:
+            raise
+        except Exception:
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                try:
+                    conn.quit()
+                except (smtplib.SMTPException, OSError):
+                    conn.close()
+                self._created -= 1
+
+
+def email_sender(pool: SmtpPool, from_address: str) -> Sender:
+    async def send(notification: dict[str, Any]) -> None:
+        message = EmailMessage()
+        message["From"] = from_address
+        message["To"] = notification["recipient"]
+        message["Subject"] = notification["subject"] or ""
+        message.set_content(notification["body"])
+        await asyncio.to_thread(pool.send, message)
+    return send
+
+
+def whatsapp_file_sender(path: str) -> Sender:
+    """Catat pesan WhatsApp ke file untuk dikirim manual (belum ada API pengirim)."""
+    def append(notification: dict[str, Any]) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"\n{datetime.now().isoformat()}\n{notification['body']}\n{'=' * 50}\n")
+
+    async def send(notification: dict[str, Any]) -> None:
+        await asyncio.to_thread(append, notification)
+    return send
+
+
+class NotificationOutbox:
+    def __init__(
+        self,
+        store: OrderStore,
+        senders: dict[str, Sender],
+        concurrency: int = 4,
+        max_attempts: int = 6,
+        base_delay: float = 10.0,
+        max_delay: float = 900.0,
+        poll_interval: float = 30.0,
+        on_update: Callable[[dict[str, Any]], None] | None = None,
+    ):
+        self.store = store
+        self.senders = senders
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.on_update = on_update
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        store.execute_script(SCHEMA)
+
+    @staticmethod
+    def enqueue(
+        conn: sqlite3.Connection,
+        channel: str,
+        recipient: str,
+        body: str,
+        subject: str | None = None,
+        order_id: str | None = None,
+        session_id: str | None = None,
+    ) -> int:
+        """Tambah notifikasi di dalam transaksi pemanggil (lihat ``OrderStore.transaction``)."""
+        cursor = conn.execute(
+            """INSERT INTO notifications (order_id, session_id, channel, recipient, subject, body,
+               status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (order_id, session_id, channel, recipient, subject, body, PENDING, time.time(), datetime.now().isoformat()),
+        )
+        return cursor.lastrowid
+
+    def wake(self) -> None:
+        """Bangunkan dispatcher setelah notifikasi baru di-commit. Thread-safe."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def get(self, notification_id: int) -> dict[str, Any] | None:
+        rows = self.store.fetch("SELECT * FROM notifications WHERE id = ?", (notification_id,))
+        return dict(rows[0]) if rows else None
+
+    def list(self, order_id: str | None = None, status: str | None = None, limit: int = 100) -> builtins.list[dict[str, Any]]:
+        clauses, params = [], []
+        if order_id:
+            clauses.append("order_id = ?")
+            params.append(order_id)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.store.fetch(f"SELECT * FROM notifications {where} ORDER BY id DESC LIMIT ?", params + [limit])
+        return [dict(row) for row in rows]
+
+    def counts_by_status(self) -> dict[str, int]:
+        rows = self.store.fetch("SELECT status, COUNT(*) AS n FROM notifications GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def retry(self, notification_id: int) -> bool:
+        """Jadwalkan ulang notifikasi yang ``failed``."""
+        with self.store.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE notifications SET status = ?, attempts = 0, next_attempt_at = ? WHERE id = ? AND status = ?",
+                (PENDING, time.time(), notification_id, FAILED),
+            ).rowcount
+        if updated:
+            self.wake()
+        return bool(updated)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        with self.store.transaction() as conn:
+            recovered = conn.execute(
+                "UPDATE notifications SET status = ? WHERE status = ?", (PENDING, SENDING)
+            ).rowcount
+        if recovered:
+            logger.info(f"Re-queued {recovered} notifications left in sending state")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _claim(self, limit: int) -> builtins.list[dict[str, Any]]:
+        now = time.time()
+        with self.store.transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM notifications WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, limit),
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE notifications SET status = ?, attempts = attempts + 1 WHERE id = ?", (SENDING, row["id"])
+                )
+        return [{**dict(row), "status": SENDING, "attempts": row["attempts"] + 1} for row in rows]
+
+    def _next_due_in(self) -> float:
+        rows = self.store.fetch("SELECT MIN(next_attempt_at) AS due FROM notifications WHERE status = ?", (PENDING,))
+        due = rows[0]["due"] if rows else None
+        if due is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, due - time.time()))
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def dispatch(notification):
+            async with semaphore:
+                await self._dispatch(notification)
+
+        while True:
+            try:
+                batch = await asyncio.to_thread(self._claim, self.concurrency * 2)
+                if batch:
+                    await asyncio.gather(*(dispatch(n) for n in batch))
+                    continue
+                self._wakeup.clear()
+                timeout = await asyncio.to_thread(self._next_due_in)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification dispatcher error")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _dispatch(self, notification: dict[str, Any]) -> None:
+        sender = self.senders.get(notification["channel"])
+        started = time.perf_counter()
+        try:
+            if sender is None:
+                raise PermanentError(f"Channel tidak dikenal: {notification['channel']}")
+            await sender(notification)
+        except Exception as e:
+            permanent = isinstance(e, PermanentError) or notification["attempts"] >= self.max_attempts
+            if permanent:
+                status, next_attempt = FAILED, notification["next_attempt_at"]
+                logger.exception(f"Notification {notification['id']} ({notification['channel']}) failed")
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (notification["attempts"] - 1))
+                status, next_attempt = PENDING, time.time() + delay * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Notification {notification['id']} attempt {notification['attempts']} failed, "
+                    f"retrying in {next_attempt - time.time():.0f}s: {e}"
+                )
+            await asyncio.to_thread(self._finish, notification["id"], status, str(e), next_attempt, None)
+        else:
+            logger.info(
+                f"Notification {notification['id']} ({notification['channel']}) sent to "
+                f"{notification['recipient']} in {time.perf_counter() - started:.2f}s"
+            )
+            await asyncio.to_thread(self._finish, notification["id"], SENT, None, notification["next_attempt_at"], datetime.now().isoformat())
+
+    def _finish(self, notification_id: int, status: str, error: str | None, next_attempt: float, sent_at: str | None) -> None:
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE notifications SET status = ?, last_error = ?, next_attempt_at = ?, sent_at = ? WHERE id = ?",
+                (status, error, next_attempt, sent_at, notification_id),
+            )
+        if self.on_update:
+            try:
+                self.on_update(self.get(notification_id))
+            except Exception:
+                logger.exception("Notification listener failed")
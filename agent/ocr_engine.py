@@ -0,0 +1,148 @@
+"""OCR PDF paralel per halaman di process pool.
+
+Setiap halaman dirasterisasi (pdf2image) dan di-OCR (Tesseract) di proses
+worker terpisah, jadi event loop FastAPI tidak pernah terblokir dan semua
+core terpakai. Pool dibagi oleh semua request sehingga total proses OCR
+tetap dibatasi ``OCR_WORKERS``.
+
+Benchmark::
+
+    python ocr_engine.py "uploaded_pdfs/<file>.pdf" --workers 1,2,4
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError
+from PyPDF2 import PdfReader
+
+from telemetry import OCR_PAGE_SECONDS
+
+logger = logging.getLogger("ocr-engine")
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+
+# progress(selesai, total, nomor_halaman, teks_halaman atau None jika gagal)
+ProgressCallback = Callable[[int, int, int, Optional[str]], None]
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _init_worker() -> None:
+    # Satu thread Tesseract per proses; paralelisme datang dari jumlah proses
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=_init_worker)
+        logger.info(f"OCR process pool started with {OCR_WORKERS} workers")
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def page_count(pdf_path: str) -> int:
+    try:
+        return int(pdfinfo_from_path(pdf_path)["Pages"])
+    except (PDFInfoNotInstalledError, PDFPageCountError, KeyError):
+        # pdfinfo (poppler) tidak tersedia: hitung lewat PyPDF2
+        return len(PdfReader(pdf_path).pages)
+
+
+def ocr_page(pdf_path: str, page_number: int, lang: str = OCR_LANG, dpi: int = OCR_DPI) -> str:
+    """Rasterisasi dan OCR satu halaman (nomor mulai dari 1). Dijalankan di worker."""
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return "\n".join(pytesseract.image_to_string(img, lang=lang) for img in images)
+
+
+def _ocr_page_timed(pdf_path: str, page_number: int, lang: str) -> tuple[str, float]:
+    # Diukur di worker supaya durasi tidak termasuk waktu antri di pool
+    started = time.perf_counter()
+    text = ocr_page(pdf_path, page_number, lang)
+    return text, time.perf_counter() - started
+
+
+async def ocr_pdf(
+    pdf_path: str,
+    pages: Iterable[int] | None = None,
+    progress: ProgressCallback | None = None,
+    lang: str = OCR_LANG,
+    executor: ProcessPoolExecutor | None = None,
+) -> list[str | None]:
+    """OCR halaman-halaman PDF secara paralel; hasil berurutan sesuai ``pages``.
+
+    Halaman yang gagal di-OCR menghasilkan ``None`` (dengan warning) supaya
+    satu halaman rusak tidak menggagalkan seluruh dokumen dan pemanggil bisa
+    membedakannya dari halaman yang memang kosong.
+    """
+    loop = asyncio.get_running_loop()
+    if pages is None:
+        total_pages = await loop.run_in_executor(None, page_count, pdf_path)
+        pages = range(1, total_pages + 1)
+    pages = list(pages)
+    if not pages:
+        return []
+    pool = executor or get_pool()
+
+    async def run(page_number: int):
+        started = time.perf_counter()
+        try:
+            text, duration = await loop.run_in_executor(pool, _ocr_page_timed, pdf_path, page_number, lang)
+            OCR_PAGE_SECONDS.observe(duration)
+        except Exception as e:
+            logger.warning(f"OCR page {page_number} failed: {e}", exc_info=True)
+            text = None
+        return page_number, text, time.perf_counter() - started
+
+    results = {}
+    for done, task in enumerate(asyncio.as_completed([run(p) for p in pages]), 1):
+        page_number, text, elapsed = await task
+        results[page_number] = text
+        logger.info(f"OCR page {page_number} ({done}/{len(pages)}): {len(text or '')} characters in {elapsed:.2f}s")
+        if progress:
+            progress(done, len(pages), page_number, text)
+    return [results[p] for p in pages]
+
+
+def benchmark(pdf_path: str, worker_counts: Iterable[int]) -> None:
+    """Cetak halaman/detik untuk beberapa ukuran pool."""
+    total_pages = page_count(pdf_path)
+    print(f"{pdf_path}: {total_pages} pages")
+    for workers in worker_counts:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            started = time.perf_counter()
+            asyncio.run(ocr_pdf(pdf_path, executor=pool))
+            elapsed = time.perf_counter() - started
+        print(f"workers={workers:>3}  {elapsed:7.2f}s  {total_pages / elapsed:6.2f} pages/s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark OCR paralel")
+    parser.add_argument("pdf", help="PDF multi-halaman, misalnya menu di uploaded_pdfs/")
+    parser.add_argument(
+        "--workers",
+        default=f"1,2,4,{os.cpu_count() or 1}",
+        help="Daftar ukuran pool dipisah koma (default: 1,2,4,N)",
+    )
+    args = parser.parse_args()
+    counts = sorted({int(n) for n in args.workers.split(",") if n.strip()})
+    benchmark(args.pdf, counts)
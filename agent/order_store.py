@@ -0,0 +1,350 @@
+"""Penyimpanan pesanan makanan di SQLite (mode WAL).
+
+Sebelumnya satu-satunya salinan pesanan adalah ``order_details`` di dalam
+log panggilan. Sekarang setiap pesanan punya baris sendiri di
+``orders.db`` dengan index pada status, waktu dibuat dan nomor telepon,
+sehingga antrian dapur (pesanan yang masih terbuka) dan update status
+adalah query ber-index, bukan scan semua transcript.
+
+Perubahan status divalidasi terhadap ``TRANSITIONS`` dan dicatat di
+tabel ``order_status_history``.
+"""
+from __future__ import annotations
+
+import builtins
+import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable
+
+logger = logging.getLogger("order-store")
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+PREPARING = "preparing"
+DELIVERING = "delivering"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+TRANSITIONS = {
+    PENDING: {CONFIRMED, PREPARING, CANCELLED},
+    CONFIRMED: {PREPARING, CANCELLED},
+    PREPARING: {DELIVERING, COMPLETED, CANCELLED},
+    DELIVERING: {COMPLETED, CANCELLED},
+    COMPLETED: set(),
+    CANCELLED: set(),
+}
+OPEN_STATUSES = (PENDING, CONFIRMED, PREPARING, DELIVERING)
+# order_status log lama yang hanya bisa berasal dari update status dapur;
+# "completed" di sana juga berarti panggilan ditutup, jadi tidak dipakai
+LEGACY_KITCHEN_STATUSES = (PENDING, PREPARING, DELIVERING, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    session_id TEXT,
+    source TEXT NOT NULL,
+    customer_name TEXT,
+    customer_phone TEXT,
+    customer_email TEXT,
+    delivery_address TEXT,
+    delivery_time TEXT,
+    items TEXT NOT NULL,
+    total_amount REAL NOT NULL DEFAULT 0,
+    notes TEXT,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_phone ON orders (customer_phone, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_session ON orders (session_id) WHERE session_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS order_status_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL REFERENCES orders (order_id),
+    status TEXT NOT NULL,
+    message TEXT,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_history_order ON order_status_history (order_id, id);
+"""
+
+ITEM_QUANTITY_RE = re.compile(r"^\s*(?:(\d+)\s*[xX×]\s+(.+)|(.+?)\s+[xX×]\s*(\d+))\s*$")
+
+
+# Hook (koneksi, order_id) yang dijalankan di dalam transaksi sebelum COMMIT
+BeforeCommit = Callable[[sqlite3.Connection, str], None]
+
+
+class OrderNotFound(KeyError):
+    pass
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def normalize_phone(phone: str | None) -> str | None:
+    """Format 62xxxx seperti nomor WhatsApp supaya pencarian per nomor konsisten."""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", phone)
+    if digits.startswith("0"):
+        digits = "62" + digits[1:]
+    return digits or None
+
+
+def normalize_items(items: Iterable[Any]) -> list[dict[str, Any]]:
+    """Item dari agent ("2x Mie Ayam", "Es Teh x3") atau dict menjadi {name, quantity, price}."""
+    normalized = []
+    for item in items or []:
+        if isinstance(item, dict):
+            normalized.append({
+                "name": str(item.get("name", "")).strip(),
+                "quantity": int(item.get("quantity") or item.get("qty") or 1),
+                "price": float(item.get("price") or 0),
+            })
+            continue
+        text = str(item).strip()
+        if not text:
+            continue
+        match = ITEM_QUANTITY_RE.match(text)
+        if match:
+            quantity, name = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+            normalized.append({"name": name.strip(), "quantity": int(quantity), "price": 0.0})
+        else:
+            normalized.append({"name": text, "quantity": 1, "price": 0.0})
+    return normalized
+
+
+def legacy_kitchen_status(order_status: str | None) -> str | None:
+    """Status dapur dari ``order_status`` log lama; None jika statusnya status panggilan."""
+    return order_status if order_status in LEGACY_KITCHEN_STATUSES else None
+
+
+class OrderStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def fetch(self, sql: str, params: Iterable[Any] = ()) -> builtins.list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def execute_script(self, script: str) -> None:
+        """Buat tabel tambahan di ``orders.db`` (misalnya outbox notifikasi)."""
+        with self._lock:
+            self._conn.executescript(script)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transaksi tulis; dipakai juga oleh modul lain yang berbagi ``orders.db``."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict[str, Any]:
+        # Bentuk yang dipakai food-order-manager.tsx
+        return {
+            "order_id": row["order_id"],
+            "session_id": row["session_id"],
+            "source": row["source"],
+            "customer": {
+                "name": row["customer_name"],
+                "email": row["customer_email"],
+                "phone": row["customer_phone"],
+            },
+            "items": json.loads(row["items"]),
+            "total_amount": row["total_amount"],
+            "delivery_time": row["delivery_time"],
+            "delivery_address": row["delivery_address"],
+            "notes": row["notes"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def get(self, order_id: str) -> dict[str, Any] | None:
+        rows = self.fetch("SELECT * FROM orders WHERE order_id = ?", (order_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def get_by_session(self, session_id: str) -> dict[str, Any] | None:
+        rows = self.fetch("SELECT * FROM orders WHERE session_id = ?", (session_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def upsert_from_session(
+        self,
+        session_id: str,
+        details: dict[str, Any],
+        status: str = CONFIRMED,
+        source: str = "call",
+        created_at: str | None = None,
+        before_commit: BeforeCommit | None = None,
+    ) -> dict[str, Any]:
+        """Buat atau perbarui pesanan milik satu sesi (satu pesanan per sesi).
+
+        Detail pesanan yang dikonfirmasi ulang dalam sesi yang sama menimpa
+        detail sebelumnya, sama seperti ``order_details`` di log panggilan;
+        status yang sudah berjalan di dapur tidak diubah. ``before_commit``
+        dijalankan di dalam transaksi yang sama (misalnya mengisi outbox
+        notifikasi) sehingga pesanan dan efek sampingnya tersimpan bersama.
+        """
+        now = datetime.now().isoformat()
+        created_at = created_at or details.get("order_time") or now
+        values = (
+            details.get("customer_name"),
+            normalize_phone(details.get("customer_phone")),
+            details.get("customer_email"),
+            details.get("delivery_address"),
+            details.get("delivery_time"),
+            json.dumps(normalize_items(details.get("order_items") or details.get("items") or []), ensure_ascii=False),
+            float(details.get("total_amount") or 0),
+            details.get("notes"),
+        )
+        with self.transaction() as conn:
+            row = conn.execute("SELECT order_id FROM orders WHERE session_id = ?", (session_id,)).fetchone()
+            if row:
+                order_id = row["order_id"]
+                conn.execute(
+                    """UPDATE orders SET customer_name = ?, customer_phone = ?, customer_email = ?,
+                       delivery_address = ?, delivery_time = ?, items = ?, total_amount = ?, notes = ?,
+                       updated_at = ? WHERE order_id = ?""",
+                    values + (now, order_id),
+                )
+            else:
+                order_id = uuid.uuid4().hex
+                conn.execute(
+                    """INSERT INTO orders (order_id, session_id, source, customer_name, customer_phone,
+                       customer_email, delivery_address, delivery_time, items, total_amount, notes,
+                       status, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (order_id, session_id, source) + values + (status, created_at, now),
+                )
+                conn.execute(
+                    "INSERT INTO order_status_history (order_id, status, message, changed_at) VALUES (?, ?, ?, ?)",
+                    (order_id, status, None, created_at),
+                )
+            if before_commit:
+                before_commit(conn, order_id)
+        return self.get(order_id)
+
+    def update_status(
+        self,
+        order_id: str,
+        status: str,
+        message: str | None = None,
+        before_commit: BeforeCommit | None = None,
+    ) -> dict[str, Any]:
+        """Ubah status pesanan; ``InvalidTransition`` jika tidak diizinkan."""
+        if status not in TRANSITIONS:
+            raise InvalidTransition(f"Status tidak dikenal: {status}")
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+            if row is None:
+                raise OrderNotFound(order_id)
+            current = row["status"]
+            if status not in TRANSITIONS[current]:
+                raise InvalidTransition(f"Status {current} tidak bisa diubah menjadi {status}")
+            conn.execute("UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?", (status, now, order_id))
+            conn.execute(
+                "INSERT INTO order_status_history (order_id, status, message, changed_at) VALUES (?, ?, ?, ?)",
+                (order_id, status, message, now),
+            )
+            if before_commit:
+                before_commit(conn, order_id)
+        return self.get(order_id)
+
+    def history(self, order_id: str) -> builtins.list[dict[str, Any]]:
+        rows = self.fetch(
+            "SELECT status, message, changed_at FROM order_status_history WHERE order_id = ? ORDER BY id",
+            (order_id,),
+        )
+        return [dict(row) for row in rows]
+
+    def list(
+        self,
+        statuses: Iterable[str] | None = None,
+        phone: str | None = None,
+        limit: int = 100,
+        oldest_first: bool = False,
+    ) -> builtins.list[dict[str, Any]]:
+        """Pesanan terbaru (atau terlama untuk antrian dapur) dengan filter ber-index."""
+        clauses, params = [], []
+        statuses = list(statuses or [])
+        if statuses:
+            clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if phone:
+            clauses.append("customer_phone = ?")
+            params.append(normalize_phone(phone))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "ASC" if oldest_first else "DESC"
+        rows = self.fetch(f"SELECT * FROM orders {where} ORDER BY created_at {order} LIMIT ?", params + [limit])
+        return [self._to_dict(row) for row in rows]
+
+    def counts_by_status(self) -> dict[str, int]:
+        rows = self.fetch("SELECT status, COUNT(*) AS n FROM orders GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def import_call_logs(self, store, session_ids: Iterable[str] | None = None) -> int:
+        """Impor ``order_details`` dari log panggilan yang belum punya baris pesanan."""
+        imported = 0
+        for session_id in session_ids if session_ids is not None else store.session_ids():
+            view = store.load(session_id)
+            details = view.get("order_details") if view else None
+            if not details or self.get_by_session(session_id):
+                continue
+            status = view.get("kitchen_status") or legacy_kitchen_status(view.get("order_status"))
+            self.upsert_from_session(
+                session_id,
+                details,
+                status=status if status in TRANSITIONS else CONFIRMED,
+                created_at=details.get("order_time") or view.get("start_time"),
+            )
+            imported += 1
+        if imported:
+            logger.info(f"Imported {imported} orders from call logs")
+        return imported
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from call_log_store import CallLogStore
+
+    parser = argparse.ArgumentParser(description="Impor order_details dari call_logs/ ke orders.db")
+    parser.add_argument("--call-logs", default="call_logs")
+    parser.add_argument("--db", default="orders.db")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    call_logs = CallLogStore(args.call_logs)
+    call_logs.migrate_legacy()
+    orders = OrderStore(args.db)
+    print(f"Imported {orders.import_call_logs(call_logs)} orders; status counts: {orders.counts_by_status()}")
+    call_logs.close()
+    orders.close()
@@ -1,20 +1,40 @@
+from __future__ import annotations
+
 import os
 import uuid
+import asyncio
+import hashlib
 import logging
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+import time
+from fastapi import FastAPI, UploadFile, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import json
 from fastapi.middleware.cors import CORSMiddleware
 import requests
 from datetime import datetime, timedelta
 import os
-from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
-import pytesseract
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from call_log_store import CallLogStore, StaleRevision, message_records
+from call_log_archive import CallLogArchive, CallLogArchiver, ARCHIVE_DIR
+from session_index import SessionIndex, encode_cursor, decode_cursor
+from analytics import CallAnalytics, response_delay
+from transcript_search import TranscriptIndex
+from control_tokens import CLOSE_CALL_CONFIRMED, TRANSFER_TO_HUMAN, find_tokens
+from admission import AdmissionQueue
+from telemetry import instrument
+from event_stream import EventBroker, parse_last_event_id
+import ocr_engine
+from pdf_cache import PdfTextCache
+from ingest_jobs import IngestJobQueue
+from active_menu import ActiveMenuText
+from menu_index import MenuIndex
+from retrieval import BM25Index
+from order_store import OrderStore, OrderNotFound, InvalidTransition, OPEN_STATUSES, normalize_items
+from notification_outbox import NotificationOutbox, SmtpPool, email_sender, whatsapp_file_sender
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.local")
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -30,56 +50,218 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latency handler HTTP dan GET /metrics (Prometheus)
+instrument(app, "pdf_api")
+
+def etag_matches(if_none_match, etag):
+    """Cek header If-None-Match (bisa berisi beberapa ETag atau *)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def accepts_gzip(accept_encoding):
+    """Cek header Accept-Encoding dengan q-value (gzip;q=0 berarti menolak gzip)"""
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    q = weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0)))
+    return q > 0
+
 PDF_TEXT_PATH = "pdf_text_cache.txt"
+# Teks PDF aktif disajikan dari memori; file hanya untuk persistensi
+active_pdf_text = ActiveMenuText(PDF_TEXT_PATH)
+# Menu terstruktur (item, kategori, harga, varian) dibangun ulang setiap teks aktif berganti
+menu_index = MenuIndex()
+active_pdf_text.add_listener(lambda snapshot: menu_index.rebuild(snapshot.text, snapshot.version))
+# Index BM25 per chunk untuk grounding prompt; hanya chunk yang berubah di-index ulang
+retrieval_index = BM25Index()
+
+def update_retrieval_index(snapshot):
+    stats = retrieval_index.update(snapshot.text, snapshot.version)
+    logger.info(f"Retrieval index updated: {stats['chunks']} chunks ({stats['added']} added, {stats['removed']} removed)")
+
+active_pdf_text.add_listener(update_retrieval_index)
 PDF_STORAGE_DIR = "uploaded_pdfs"
 os.makedirs(PDF_STORAGE_DIR, exist_ok=True)
+# Cache teks per halaman berdasarkan hash konten PDF
+PDF_CACHE_DIR = "pdf_extract_cache"
+pdf_extract_cache = PdfTextCache(PDF_CACHE_DIR)
+# Batas upload; file ditulis ke disk per chunk sehingga memori per upload tetap kecil
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "200"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def ingest_pdf(job):
+    """Pipeline job ingest: ekstrak teks + OCR lalu jadikan PDF aktif"""
+    def on_progress(done, total, page_number, page_text):
+        job.pages_done, job.pages_total = done, total
+        ingest_queue.notify(job)
+    
+    try:
+        # Ekstrak teks langsung dari PDF + OCR untuk gambar (halaman yang
+        # OCR-nya gagal di-skip)
+        pages = await pdf_extract_cache.extract(job.pdf_path, progress=on_progress)
+        job.pages_total = job.pages_done = len(pages)
+        text = "\n".join(page["text"] for page in pages)
+        logger.info(f"Extracted text from PDF: {len(text)} characters")
+        ocr_text = "".join((page["ocr"] or "") + "\n" for page in pages)
+        logger.info(f"OCR text extracted: {len(ocr_text)} characters")
+        
+        full_text = text + "\n" + ocr_text
+        active_pdf_text.set(full_text, source=os.path.basename(job.pdf_path))
+        logger.info("PDF processed successfully")
+        return len(full_text)
+    except Exception:
+        if os.path.exists(job.pdf_path):
+            os.remove(job.pdf_path)
+        raise
+
+def publish_ingest_event(job):
+    event_broker.publish("ingest_job", job.to_dict())
+
+ingest_queue = IngestJobQueue(
+    ingest_pdf,
+    concurrency=int(os.getenv("INGEST_CONCURRENCY", "2")),
+    on_update=publish_ingest_event,
+)
+
+@app.on_event("startup")
+def load_active_pdf_text():
+    active_pdf_text.load()
+
+@app.on_event("startup")
+def start_ingest_queue():
+    ingest_queue.start()
 
-@app.post("/upload-pdf-ocr")
-async def upload_pdf_ocr(file: UploadFile = File(...)):
+@app.on_event("shutdown")
+async def stop_ingest_queue():
+    await ingest_queue.stop()
+
+@app.post("/upload-pdf-ocr", status_code=202)
+async def upload_pdf_ocr(file: UploadFile):
+    """Upload PDF lalu proses (ekstraksi + OCR) di background
+    
+    Langsung membalas dengan job_id; status dan progress bisa dicek lewat
+    GET /ingest-jobs/{job_id} atau event "ingest_job" di /events.
+    """
     if file.content_type != "application/pdf":
         return JSONResponse(status_code=400, content={"error": "File harus PDF"})
-    contents = await file.read()
-    # Simpan file PDF ke folder database
-    unique_name = f"{uuid.uuid4()}_{file.filename}"
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        return JSONResponse(status_code=413, content={"error": f"File lebih dari {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB"})
+    
+    # Tulis ke file sementara per chunk sambil menghitung hash
+    unique_name = f"{uuid.uuid4()}_{os.path.basename(file.filename or 'upload.pdf')}"
     pdf_path = os.path.join(PDF_STORAGE_DIR, unique_name)
-    with open(pdf_path, "wb") as f:
-        f.write(contents)
-    temp_path = pdf_path
+    temp_path = f"{pdf_path}.part"
+    digest = hashlib.sha256()
+    size = 0
     try:
-        # Ekstrak teks langsung dari PDF
-        reader = PdfReader(pdf_path)
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
-        logger.info(f"Extracted text from PDF: {len(text)} characters")
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        with f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if size == 0 and not chunk.startswith(b"%PDF-"):
+                    return JSONResponse(status_code=400, content={"error": "File harus PDF"})
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    return JSONResponse(status_code=413, content={"error": f"File lebih dari {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB"})
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
         
-        # OCR untuk gambar di PDF (optional, bisa di-skip jika error)
-        ocr_text = ""
-        try:
-            images = convert_from_path(pdf_path)
-            for img in images:
-                ocr_text += pytesseract.image_to_string(img, lang="eng") + "\n"
-            logger.info(f"OCR text extracted: {len(ocr_text)} characters")
-        except Exception as ocr_error:
-            logger.warning(f"OCR failed, skipping: {ocr_error}")
+        page_count = await asyncio.to_thread(ocr_engine.page_count, temp_path)
+        if page_count > MAX_PDF_PAGES:
+            return JSONResponse(status_code=413, content={"error": f"PDF lebih dari {MAX_PDF_PAGES} halaman"})
         
-        full_text = text + "\n" + ocr_text
-        with open(PDF_TEXT_PATH, "w", encoding="utf-8") as f:
-            f.write(full_text)
-        logger.info("PDF processed successfully")
+        content_hash = digest.hexdigest()
+        job = ingest_queue.find_in_flight(content_hash)
+        if job is None:
+            # Simpan file PDF ke folder database (rename atomik)
+            os.replace(temp_path, pdf_path)
+            pdf_extract_cache.remember_hash(pdf_path, content_hash)
+            job, _ = ingest_queue.submit(pdf_path, content_hash)
     except Exception as e:
-        logger.error(f"PDF processing error: {e}", exc_info=True)
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        logger.exception("Upload error")
+        return JSONResponse(status_code=400, content={"error": f"PDF tidak valid: {e}"})
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
     # File PDF tetap disimpan di database
-    return {"success": True, "pdf_path": pdf_path}
+    return {"success": True, "pdf_path": job.pdf_path, "job_id": job.id, "status": job.status}
+
+@app.get("/ingest-jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    """Status, progress dan hasil job ingest PDF"""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job tidak ditemukan"})
+    return job.to_dict()
 
 @app.get("/pdf-text")
-def get_pdf_text():
-    if not os.path.exists(PDF_TEXT_PATH):
-        return {"text": ""}
-    with open(PDF_TEXT_PATH, "r", encoding="utf-8") as f:
-        text = f.read()
-    return {"text": text}
+def get_pdf_text(request: Request):
+    """Teks PDF aktif dari memori (ETag/304, gzip jika diminta)"""
+    snapshot = active_pdf_text.current
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip(request.headers.get("accept-encoding")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/pdf-text/version")
+def get_pdf_text_version():
+    """Versi teks PDF aktif, untuk cek perubahan tanpa download teks"""
+    return active_pdf_text.current.info()
+
+@app.get("/retrieve")
+def retrieve(q: str, k: int = 5):
+    """Top-k chunk teks aktif yang paling relevan dengan query (BM25)"""
+    started = time.perf_counter()
+    chunks = retrieval_index.search(q, k=max(1, min(k, 20)))
+    return {
+        "query": q,
+        "version": retrieval_index.version,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "chunks": chunks,
+    }
+
+@app.get("/menu")
+def get_menu(category: str | None = None):
+    """Menu terstruktur dari PDF aktif, bisa difilter per kategori"""
+    items = menu_index.items
+    if category:
+        items = [item for item in items if (item["category"] or "").lower() == category.lower()]
+    return {
+        "version": menu_index.version,
+        "categories": menu_index.categories(),
+        "items": items,
+    }
+
+@app.get("/menu/search")
+def search_menu(q: str, limit: int = 10, category: str | None = None):
+    """Cari item menu (exact lalu fuzzy) berdasarkan nama"""
+    results = menu_index.search(q, limit=max(1, min(limit, 50)), category=category)
+    return {"query": q, "version": menu_index.version, "results": results}
+
+@app.get("/menu/items/{item_id}")
+def get_menu_item(item_id: str):
+    """Detail satu item menu"""
+    item = menu_index.get(item_id)
+    if item is None:
+        return JSONResponse(status_code=404, content={"error": "Item menu tidak ditemukan"})
+    return item
 
 @app.get("/list-pdfs")
 def list_pdfs():
@@ -102,6 +284,10 @@ def list_pdfs():
     
     return {"pdfs": pdf_files}
 
+@app.on_event("shutdown")
+def stop_ocr_pool():
+    ocr_engine.shutdown_pool()
+
 class SelectPdfRequest(BaseModel):
     pdf_id: str
 
@@ -114,22 +300,13 @@ async def select_pdf(request: SelectPdfRequest):
         return JSONResponse(status_code=404, content={"error": "PDF tidak ditemukan"})
     
     try:
-        # Ekstrak teks dari PDF yang dipilih
-        reader = PdfReader(pdf_path)
-        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+        # Ekstrak teks dari PDF yang dipilih (dari cache jika sudah pernah diproses)
+        pages = await pdf_extract_cache.extract(pdf_path)
+        text = "\n".join(page["text"] for page in pages)
         logger.info(f"PyPDF2 extracted: {len(text)} characters")
         
         # OCR untuk gambar di PDF (wajib jika text extraction gagal)
-        ocr_text = ""
-        try:
-            images = convert_from_path(pdf_path)
-            logger.info(f"Converting PDF to {len(images)} images for OCR")
-            for i, img in enumerate(images):
-                page_text = pytesseract.image_to_string(img, lang="eng")
-                ocr_text += f"Page {i+1}:\n{page_text}\n\n"
-                logger.info(f"OCR page {i+1}: {len(page_text)} characters")
-        except Exception as ocr_error:
-            logger.error(f"OCR failed: {ocr_error}")
+        ocr_text = "".join(f"Page {i+1}:\n{page['ocr'] or ''}\n\n" for i, page in enumerate(pages))
         
         # Gunakan OCR jika text extraction gagal
         if len(text.strip()) < 50 and len(ocr_text.strip()) > 0:
@@ -138,9 +315,8 @@ async def select_pdf(request: SelectPdfRequest):
         else:
             full_text = text + "\n" + ocr_text
         
-        # Simpan teks ke cache
-        with open(PDF_TEXT_PATH, "w", encoding="utf-8") as f:
-            f.write(full_text)
+        # Jadikan teks aktif
+        active_pdf_text.set(full_text, source=request.pdf_id)
         
         logger.info(f"Selected PDF: {request.pdf_id}, extracted {len(full_text)} characters")
         return {"success": True, "message": "PDF berhasil dipilih", "text_length": len(full_text)}
@@ -151,6 +327,192 @@ async def select_pdf(request: SelectPdfRequest):
 
 CALL_LOGS_DIR = "call_logs"
 os.makedirs(CALL_LOGS_DIR, exist_ok=True)
+call_log_store = CallLogStore(
+    CALL_LOGS_DIR,
+    fsync_interval=float(os.getenv("CALL_LOG_FSYNC_INTERVAL", "0.5")),
+)
+# Ringkasan session di memori, diperbarui setiap kali store menulis record
+session_index = SessionIndex()
+# Event push untuk dashboard (menggantikan polling)
+event_broker = EventBroker(buffer_size=int(os.getenv("EVENT_BUFFER_SIZE", "1000")))
+
+def publish_call_log_events(session_id, records):
+    """Terjemahkan record call log yang baru ditulis menjadi event dashboard"""
+    # Dipanggil sebelum session_index.apply, jadi summary masih state lama
+    summary = session_index.get(session_id)
+    position = summary.message_count if summary else 0
+    status = summary.status if summary else None
+    for record in records:
+        op = record.get("op")
+        if op == "header":
+            event_broker.publish("session_started", {"start_time": record["start_time"]}, session_id)
+        elif op == "message":
+            message = {k: v for k, v in record.items() if k != "op"}
+            event_broker.publish("message_appended", {"position": position, "message": message}, session_id)
+            position += 1
+        elif op == "edit":
+            event_broker.publish("message_edited", {k: v for k, v in record.items() if k != "op"}, session_id)
+        elif op == "set":
+            fields = record["fields"]
+            if "status" in fields and fields["status"] != status:
+                status = fields["status"]
+                event_broker.publish("status_changed", {"status": status}, session_id)
+                if status == "staff_requested":
+                    event_broker.publish("takeover_requested", {"message_count": position}, session_id)
+            if fields.get("order_status") == "confirmed":
+                event_broker.publish("order_confirmed", {"order_details": fields.get("order_details")}, session_id)
+
+# Kolom NumPy untuk GET /analytics, diperbarui dari record yang sama
+call_analytics = CallAnalytics()
+
+# Inverted index transcript untuk GET /search, disimpan berkala ke snapshot
+transcript_index = TranscriptIndex()
+TRANSCRIPT_INDEX_PATH = os.path.join(CALL_LOGS_DIR, "transcript_index.json.gz")
+
+call_log_store.add_listener(publish_call_log_events)
+call_log_store.add_listener(call_analytics.apply)
+call_log_store.add_listener(transcript_index.apply)
+call_log_store.add_listener(session_index.apply)
+
+# Session selesai yang lebih tua dari retensi dipindah ke call_logs/archive/ (gzip per hari)
+call_log_archive = CallLogArchive(os.path.join(CALL_LOGS_DIR, ARCHIVE_DIR))
+call_log_archiver = CallLogArchiver(
+    call_log_store,
+    session_index,
+    call_log_archive,
+    retention_days=float(os.getenv("CALL_LOG_RETENTION_DAYS", "30")),
+    interval=float(os.getenv("CALL_LOG_ARCHIVE_INTERVAL", "3600")),
+)
+
+@app.on_event("startup")
+def start_call_log_store():
+    # Konversi log lama (*.json) ke format append-only sebelum menerima request
+    call_log_store.migrate_legacy()
+    session_index.rebuild(call_log_store)
+    call_log_archive.load()
+    archived = session_index.load_archived(call_log_archive.summaries())
+    logger.info(f"Session index loaded: {len(session_index)} sessions ({archived} archived)")
+    call_analytics.rebuild(
+        (summary.session_id, (call_log_archive if summary.archived else call_log_store).iter_records(summary.session_id))
+        for summary in session_index.all()
+    )
+    call_log_store.start()
+
+@app.on_event("startup")
+def load_transcript_index():
+    loaded = transcript_index.load(TRANSCRIPT_INDEX_PATH)
+    stats = transcript_index.sync(session_index, call_log_store, call_log_archive)
+    logger.info(
+        f"Transcript index {'loaded from snapshot' if loaded else 'rebuilt'}: "
+        f"{len(transcript_index)} messages, {stats['replayed']} sessions replayed"
+    )
+    transcript_index.start_autosave(TRANSCRIPT_INDEX_PATH, float(os.getenv("TRANSCRIPT_INDEX_SAVE_INTERVAL", "300")))
+
+@app.on_event("shutdown")
+async def save_transcript_index():
+    await transcript_index.stop_autosave(TRANSCRIPT_INDEX_PATH)
+
+@app.on_event("startup")
+def start_call_log_archiver():
+    call_log_archiver.start()
+
+@app.on_event("shutdown")
+async def stop_call_log_archiver():
+    await call_log_archiver.stop()
+
+@app.on_event("shutdown")
+def stop_call_log_store():
+    call_log_store.close()
+
+# Pesanan disimpan di SQLite (WAL) dengan index status/waktu/telepon
+ORDERS_DB_PATH = os.getenv("ORDERS_DB_PATH", "orders.db")
+order_store = OrderStore(ORDERS_DB_PATH)
+
+# Notifikasi masuk outbox di orders.db lalu dikirim dispatcher di background
+smtp_pool = SmtpPool(
+    host=os.getenv("SMTP_HOST"),
+    port=int(os.getenv("SMTP_PORT", "587")),
+    user=os.getenv("SMTP_USER"),
+    password=os.getenv("SMTP_PASSWORD"),
+    starttls=os.getenv("SMTP_STARTTLS", "1") not in ("0", "false", "False"),
+    size=int(os.getenv("SMTP_POOL_SIZE", "2")),
+)
+
+def publish_notification_event(notification):
+    event_broker.publish("notification_updated", {
+        "id": notification["id"],
+        "order_id": notification["order_id"],
+        "channel": notification["channel"],
+        "status": notification["status"],
+        "attempts": notification["attempts"],
+        "last_error": notification["last_error"],
+    }, notification["session_id"])
+
+notification_outbox = NotificationOutbox(
+    order_store,
+    senders={
+        "email": email_sender(smtp_pool, os.getenv("SMTP_FROM") or os.getenv("SMTP_USER") or "noreply@localhost"),
+        "whatsapp": whatsapp_file_sender("whatsapp_messages.txt"),
+    },
+    concurrency=int(os.getenv("NOTIFY_CONCURRENCY", "4")),
+    max_attempts=int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6")),
+    on_update=publish_notification_event,
+)
+
+@app.on_event("startup")
+def import_orders_from_call_logs():
+    # Pesanan lama hanya ada sebagai order_details di call log
+    candidates = [
+        summary.session_id
+        for summary in session_index.all()
+        if summary.order_status != "none" and not summary.archived
+    ]
+    order_store.import_call_logs(call_log_store, candidates)
+
+@app.on_event("startup")
+def start_notification_outbox():
+    notification_outbox.start()
+
+@app.on_event("shutdown")
+async def stop_notification_outbox():
+    await notification_outbox.stop()
+    smtp_pool.close()
+
+@app.on_event("shutdown")
+def stop_order_store():
+    order_store.close()
+
+@app.get("/events")
+async def stream_events(
+    session_id: str | None = None,
+    last_event_id: str | None = None,
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """Server-Sent Events untuk dashboard; filter per session atau semua session.
+    
+    Event: session_started, message_appended, message_edited, status_changed,
+    takeover_requested, order_confirmed, order_updated, notification_updated.
+    Client yang reconnect mengirim header Last-Event-ID (otomatis oleh
+    EventSource) atau ?last_event_id=.
+    """
+    resume_from = parse_last_event_id(last_event_id_header or last_event_id)
+    return StreamingResponse(
+        event_broker.stream(session_id, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class TokenUsage(BaseModel):
+    input_tokens: int = 0
+    cached_tokens: int = 0  # Bagian input yang kena prompt cache
+    output_tokens: int = 0
+    prompt_version: str = None  # PromptPrefix.version
+    request_id: str = None
+    latency_ms: float = None
+    timestamp: str = None
+
+    def record(self):
+        return {k: v for k, v in self.model_dump().items() if v is not None}
 
 class CallLogRequest(BaseModel):
     session_id: str
@@ -159,134 +521,243 @@ class CallLogRequest(BaseModel):
     timestamp: str
     result: str = None  # Result/outcome of conversation
     status: str = "active"  # active, completed, staff_taken
+    usage: TokenUsage = None  # Pemakaian token untuk pesan agent
+    response_delay: float = None  # Delay respon terukur (detik); jika kosong dihitung dari timestamp
 
 class StaffTakeoverRequest(BaseModel):
     session_id: str
     staff_name: str
     message: str
 
+class ConversationEntry(BaseModel):
+    participant_type: str
+    message: str
+    timestamp: str
+    id: str = None  # Id dari client; entry yang id-nya sudah tercatat dilewati (retry aman)
+    result: str = None
+    status: str = None  # Hanya diubah jika diisi
+    response_delay: float = None  # Akhir ucapan penelepon sampai audio pertama agent (detik)
+
+class ConversationBatchRequest(BaseModel):
+    session_id: str
+    entries: list[ConversationEntry]
+    usage: list[TokenUsage] = None  # Pemakaian token per respon model realtime
+
+MAX_LOG_BATCH = 500
+
+def conversation_fields(text: str, result: str | None = None, status: str | None = None):
+    """Field dan keyword yang diubah oleh satu pesan percakapan"""
+    fields = {}
+    # Semua token kontrol dicari dalam satu kali lewat
+    tokens = find_tokens(text)
+    keywords = [token for token in (CLOSE_CALL_CONFIRMED, TRANSFER_TO_HUMAN) if token in tokens]
+    
+    # Detect order completion
+    if CLOSE_CALL_CONFIRMED in tokens:
+        fields["order_status"] = "completed"
+    
+    # Detect human transfer
+    if TRANSFER_TO_HUMAN in tokens:
+        fields["order_status"] = "transferred"
+    
+    # Update result and status if provided
+    if result:
+        fields["result"] = result
+    if status:
+        fields["status"] = status
+    return fields, keywords
+
+def last_message(session_id: str):
+    summary = session_index.get(session_id)
+    return summary.recent[-1][1] if summary and summary.recent else None
+
 @app.post("/log-conversation")
 async def log_conversation(request: CallLogRequest):
     """Log percakapan dengan order status dan session stats"""
-    log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-    
-    # Load existing log or create new
-    if os.path.exists(log_file):
-        with open(log_file, "r", encoding="utf-8") as f:
-            log_data = json.load(f)
-    else:
-        log_data = {
-            "session_id": request.session_id,
-            "start_time": request.timestamp,
-            "messages": [],
-            "order_status": "none",
-            "session_stats": {
-                "total_messages": 0,
-                "response_delays": [],
-                "keywords_detected": []
-            }
-        }
+    fields, keywords = conversation_fields(request.message, request.result, request.status)
     
-    # Add new message
-    log_data["messages"].append({
+    message = {
         "type": request.participant_type,
         "message": request.message,
         "timestamp": request.timestamp
-    })
+    }
+    if request.usage:
+        message["usage"] = request.usage.record()
+    # Delay respon: yang diukur client, atau jarak balasan agent pertama setelah pesan user
+    delay = request.response_delay
+    if delay is None:
+        delay = response_delay(last_message(request.session_id), message)
     
-    # Update session stats
-    log_data["session_stats"]["total_messages"] += 1
-    
-    # Detect order completion
-    if "CLOSE_CALL_CONFIRMED" in request.message:
-        log_data["order_status"] = "completed"
-        log_data["session_stats"]["keywords_detected"].append("CLOSE_CALL_CONFIRMED")
-    
-    # Detect human transfer
-    if "TRANSFER_TO_HUMAN" in request.message:
-        log_data["order_status"] = "transferred"
-        log_data["session_stats"]["keywords_detected"].append("TRANSFER_TO_HUMAN")
-    
-    # Update result and status if provided
-    if request.result:
-        log_data["result"] = request.result
-    if request.status:
-        log_data["status"] = request.status
-    
-    # Save log
-    with open(log_file, "w", encoding="utf-8") as f:
-        json.dump(log_data, f, ensure_ascii=False, indent=2)
+    # Append message (session baru dibuat otomatis)
+    call_log_store.append_message(
+        request.session_id,
+        message,
+        fields=fields,
+        keywords=keywords,
+        start_time=request.timestamp,
+        response_delay=delay,
+    )
     
     return {"success": True}
 
-@app.get("/call-logs")
-def get_call_logs():
-    """Mendapatkan daftar semua log panggilan"""
-    if not os.path.exists(CALL_LOGS_DIR):
-        return {"logs": []}
+@app.post("/log-conversation/batch")
+async def log_conversation_batch(request: ConversationBatchRequest):
+    """Log beberapa pesan satu session dalam satu penulisan (dipakai voice agent)"""
+    usage = request.usage or []
+    if len(request.entries) + len(usage) > MAX_LOG_BATCH:
+        return JSONResponse(status_code=400, content={"error": f"Maksimal {MAX_LOG_BATCH} entry per batch"})
+    if not request.entries and not usage:
+        return {"success": True, "written": 0, "duplicates": 0}
     
-    logs = []
-    for filename in os.listdir(CALL_LOGS_DIR):
-        if filename.endswith('.json'):
-            file_path = os.path.join(CALL_LOGS_DIR, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    log_data = json.load(f)
-                    logs.append({
-                        "session_id": log_data["session_id"],
-                        "start_time": log_data["start_time"],
-                        "message_count": len(log_data["messages"]),
-                        "last_message": log_data["messages"][-1]["timestamp"] if log_data["messages"] else log_data["start_time"],
-                        "status": log_data.get("status", "active"),
-                        "result": log_data.get("result", "")
-                    })
-            except Exception as e:
-                logger.error(f"Error reading log file {filename}: {e}")
+    previous = last_message(request.session_id)
+    records = []
+    seen = set()
+    duplicates = 0
+    for entry in request.entries:
+        if entry.id and (entry.id in seen or session_index.locate(entry.id) is not None):
+            duplicates += 1
+            continue
+        fields, keywords = conversation_fields(entry.message, entry.result, entry.status)
+        message = {
+            "type": entry.participant_type,
+            "message": entry.message,
+            "timestamp": entry.timestamp
+        }
+        if entry.id:
+            message["id"] = entry.id
+            seen.add(entry.id)
+        delay = entry.response_delay if entry.response_delay is not None else response_delay(previous, message)
+        records.extend(message_records(message, fields, keywords, delay))
+        previous = message
+    records.extend({"op": "usage", **item.record()} for item in usage)
     
-    # Sort by start time descending
-    logs.sort(key=lambda x: x["start_time"], reverse=True)
-    return {"logs": logs}
+    if records:
+        start_time = request.entries[0].timestamp if request.entries else usage[0].timestamp or datetime.now().isoformat()
+        call_log_store.append(request.session_id, records, start_time=start_time)
+    return {"success": True, "written": len(request.entries) - duplicates, "duplicates": duplicates, "usage": len(usage)}
+
+@app.get("/call-logs")
+def get_call_logs(
+    limit: int = 50,
+    cursor: str | None = None,
+    status: str | None = None,
+    order_status: str | None = None,
+    start_from: str | None = None,
+    start_to: str | None = None,
+    result: str | None = None,
+    order: str = "desc",
+):
+    """Mendapatkan daftar log panggilan per halaman, terurut start_time
+
+    Filter: status, order_status, start_from <= start_time < start_to (ISO),
+    result (teks di hasil panggilan). Halaman berikutnya diambil dengan
+    ?cursor=<next_cursor>; next_cursor null berarti sudah habis.
+    """
+    if order not in ("asc", "desc"):
+        return JSONResponse(status_code=400, content={"error": "order harus 'asc' atau 'desc'"})
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    summaries, next_key = session_index.page(
+        limit=max(1, min(limit, 500)),
+        cursor=after,
+        status=status,
+        order_status=order_status,
+        start_from=start_from,
+        start_to=start_to,
+        result_contains=result,
+        descending=order == "desc",
+    )
+    return {
+        "logs": [summary.to_log_entry() for summary in summaries],
+        "next_cursor": encode_cursor(next_key) if next_key else None,
+        "counts": session_index.status_counts(),
+    }
+
+@app.get("/search")
+def search_transcripts(q: str, limit: int = 20, offset: int = 0, session_id: str | None = None, type: str | None = None):
+    """Cari pesan di semua transcript
+
+    Kata biasa harus muncul semua, "kata kata" untuk frasa, kata* untuk awalan.
+    Hasil per pesan dengan snippet dan offset highlight; halaman via offset.
+    """
+    started = time.perf_counter()
+    result = transcript_index.search(
+        q, limit=max(1, min(limit, 100)), offset=max(offset, 0), session_id=session_id, participant_type=type
+    )
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+@app.get("/analytics")
+def get_analytics(start_from: str | None = None, start_to: str | None = None, bucket: str = "day"):
+    """Volume per bucket waktu, persentil delay respon dan konversi
+
+    Rentang start_from <= waktu < start_to (ISO); bucket: hour, day, week.
+    """
+    started = time.perf_counter()
+    try:
+        result = call_analytics.summary(start_from, start_to, bucket)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
 
 @app.get("/call-logs/{session_id}")
-def get_call_log_detail(session_id: str):
-    """Mendapatkan detail percakapan berdasarkan session ID"""
-    log_file = os.path.join(CALL_LOGS_DIR, f"{session_id}.json")
+def get_call_log_detail(session_id: str, after_seq: int | None = None, if_none_match: str | None = Header(None)):
+    """Mendapatkan detail percakapan berdasarkan session ID
     
-    if not os.path.exists(log_file):
+    Dengan ?after_seq=N hanya pesan dengan seq > N yang dikirim (seq dimulai
+    dari 1), plus status session dan next_seq untuk request berikutnya.
+    Response membawa ETag; If-None-Match yang cocok dibalas 304 tanpa body.
+    """
+    summary = session_index.get(session_id)
+    if summary is None:
         return JSONResponse(status_code=404, content={"error": "Log tidak ditemukan"})
     
+    etag = f'"{session_id}-{summary.version}"' if after_seq is None else f'"{session_id}-{summary.version}-{after_seq}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            log_data = json.load(f)
-        return log_data
+        if summary.archived:
+            log_data = call_log_archive.load_view(session_id)
+            if after_seq is None:
+                return JSONResponse(content=log_data, headers=headers)
+            after_seq = max(after_seq, 0)
+            log_data["message_count"] = len(log_data["messages"])
+            log_data["messages"] = log_data["messages"][after_seq:]
+        elif after_seq is None:
+            return JSONResponse(content=call_log_store.load(session_id), headers=headers)
+        else:
+            after_seq = max(after_seq, 0)
+            log_data = call_log_store.load_since(session_id, after_seq)
+        for seq, message in enumerate(log_data["messages"], after_seq + 1):
+            message.setdefault("seq", seq)
+        log_data["next_seq"] = log_data["message_count"]
+        return JSONResponse(content=log_data, headers=headers)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/staff-takeover")
 async def staff_takeover(request: StaffTakeoverRequest):
     """Staff mengambil alih percakapan"""
-    log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-    
-    if not os.path.exists(log_file):
+    if request.session_id not in session_index:
         return JSONResponse(status_code=404, content={"error": "Session tidak ditemukan"})
     
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            log_data = json.load(f)
-        
-        from datetime import datetime
-        log_data["messages"].append({
-            "type": "staff",
-            "message": f"Staff {request.staff_name} mengambil alih: {request.message}",
-            "timestamp": datetime.now().isoformat(),
-            "staff_name": request.staff_name
-        })
-        
-        log_data["status"] = "staff_taken"
-        log_data["staff_name"] = request.staff_name
-        
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        call_log_store.append_message(
+            request.session_id,
+            {
+                "type": "staff",
+                "message": f"Staff {request.staff_name} mengambil alih: {request.message}",
+                "timestamp": datetime.now().isoformat(),
+                "staff_name": request.staff_name
+            },
+            fields={"status": "staff_taken", "staff_name": request.staff_name},
+        )
         
         return {"success": True}
         
@@ -296,28 +767,62 @@ async def staff_takeover(request: StaffTakeoverRequest):
 @app.get("/active-sessions")
 def get_active_sessions():
     """Mendapatkan session yang sedang aktif"""
-    if not os.path.exists(CALL_LOGS_DIR):
-        return {"sessions": []}
-    
-    active_sessions = []
-    for filename in os.listdir(CALL_LOGS_DIR):
-        if filename.endswith('.json'):
-            file_path = os.path.join(CALL_LOGS_DIR, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    log_data = json.load(f)
-                    if log_data.get("status", "active") == "active":
-                        active_sessions.append({
-                            "session_id": log_data["session_id"],
-                            "start_time": log_data["start_time"],
-                            "message_count": len(log_data["messages"]),
-                            "last_activity": log_data["messages"][-1]["timestamp"] if log_data["messages"] else log_data["start_time"]
-                        })
-            except Exception:
-                pass
+    active_sessions = [
+        {
+            "session_id": summary.session_id,
+            "start_time": summary.start_time,
+            "message_count": summary.message_count,
+            "last_activity": summary.last_activity
+        }
+        for summary in session_index.with_status("active")
+    ]
     
     return {"sessions": active_sessions}
 
+# Slot session realtime voice agent untuk seluruh deployment (0 = tanpa batas)
+admission_queue = AdmissionQueue(
+    max_sessions=int(os.getenv("ADMISSION_MAX_SESSIONS", "50")),
+    max_per_worker=int(os.getenv("MAX_CALLS_PER_WORKER", "20")),
+    lease_ttl=float(os.getenv("ADMISSION_LEASE_TTL", "30")),
+    export_metrics=True,
+)
+ADMISSION_WHATSAPP_MESSAGE = (
+    "Maaf, semua agent kami sedang sibuk saat Anda menelepon. "
+    "Silakan lanjutkan pesanan Anda lewat chat WhatsApp ini, kami akan segera membalas."
+)
+
+class AdmissionRequest(BaseModel):
+    session_id: str
+    worker_id: str = None
+
+class AdmissionReleaseRequest(BaseModel):
+    session_id: str
+    routed_to: str = None  # "whatsapp" jika penelepon dialihkan karena antrian
+    caller_phone: str = None
+
+@app.post("/admission/acquire")
+def admission_acquire(request: AdmissionRequest):
+    """Minta/perpanjang slot session realtime; jika penuh, posisi antrian dan ETA"""
+    return admission_queue.acquire(request.session_id, request.worker_id)
+
+@app.post("/admission/release")
+def admission_release(request: AdmissionReleaseRequest):
+    """Lepas slot atau keluar dari antrian (opsional: alihkan penelepon ke WhatsApp)"""
+    routed = request.routed_to == "whatsapp"
+    released = admission_queue.release(request.session_id, routed=routed)
+    if routed and request.caller_phone:
+        with order_store.transaction() as conn:
+            notification_outbox.enqueue(
+                conn, "whatsapp", request.caller_phone, ADMISSION_WHATSAPP_MESSAGE, session_id=request.session_id
+            )
+        notification_outbox.wake()
+    return {"success": True, "released": released}
+
+@app.get("/admission")
+def get_admission():
+    """Metrik admission: session aktif, kedalaman antrian, waktu tunggu p50/p95/p99"""
+    return admission_queue.metrics()
+
 class StaffTakeoverRequestModel(BaseModel):
     session_id: str
     message: str
@@ -331,6 +836,13 @@ class EditTranscriptRequest(BaseModel):
     session_id: str
     item_id: str
     new_text: str
+    expected_revision: int = None
+    editor: str = None
+
+class UpdateOrderStatusRequest(BaseModel):
+    order_id: str
+    status: str
+    message: str = None
 
 class OrderConfirmationRequest(BaseModel):
     session_id: str
@@ -347,30 +859,17 @@ async def request_staff_takeover(request: StaffTakeoverRequestModel):
     """Request staff takeover for a session"""
     try:
         # Log the takeover request
-        log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-        
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                log_data = json.load(f)
-        else:
-            log_data = {
-                "session_id": request.session_id,
-                "start_time": datetime.now().isoformat(),
-                "messages": []
-            }
-        
-        # Add takeover request message
-        log_data["messages"].append({
-            "type": "system",
-            "message": f"Staff takeover requested: {request.message}",
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        log_data["status"] = "staff_requested"
-        
-        # Save log
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        now = datetime.now().isoformat()
+        call_log_store.append_message(
+            request.session_id,
+            {
+                "type": "system",
+                "message": f"Staff takeover requested: {request.message}",
+                "timestamp": now
+            },
+            fields={"status": "staff_requested"},
+            start_time=now,
+        )
         
         logger.info(f"Staff takeover requested for session {request.session_id}")
         return {"success": True, "message": "Staff takeover requested"}
@@ -384,28 +883,16 @@ async def send_chat_message(request: ChatMessageRequest):
     """Send chat message to session"""
     try:
         # Log the chat message
-        log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-        
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                log_data = json.load(f)
-        else:
-            log_data = {
-                "session_id": request.session_id,
-                "start_time": datetime.now().isoformat(),
-                "messages": []
-            }
-        
-        # Add chat message
-        log_data["messages"].append({
-            "type": f"chat_{request.sender}",
-            "message": request.message,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Save log
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        now = datetime.now().isoformat()
+        call_log_store.append_message(
+            request.session_id,
+            {
+                "type": f"chat_{request.sender}",
+                "message": request.message,
+                "timestamp": now
+            },
+            start_time=now,
+        )
         
         logger.info(f"Chat message sent to session {request.session_id}")
         return {"success": True, "message": "Chat message sent"}
@@ -417,25 +904,16 @@ async def send_chat_message(request: ChatMessageRequest):
 @app.get("/staff-takeover-requests")
 def get_staff_takeover_requests():
     """Get all pending staff takeover requests"""
-    if not os.path.exists(CALL_LOGS_DIR):
-        return {"requests": []}
-    
-    takeover_requests = []
-    for filename in os.listdir(CALL_LOGS_DIR):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(CALL_LOGS_DIR, filename), "r", encoding="utf-8") as f:
-                    log_data = json.load(f)
-                    if log_data.get("status") == "staff_requested":
-                        takeover_requests.append({
-                            "session_id": log_data["session_id"],
-                            "start_time": log_data["start_time"],
-                            "message_count": len(log_data["messages"]),
-                            "last_activity": log_data["messages"][-1]["timestamp"] if log_data["messages"] else log_data["start_time"],
-                            "messages": log_data["messages"][-5:]  # Last 5 messages for context
-                        })
-            except Exception:
-                pass
+    takeover_requests = [
+        {
+            "session_id": summary.session_id,
+            "start_time": summary.start_time,
+            "message_count": summary.message_count,
+            "last_activity": summary.last_activity,
+            "messages": summary.recent_messages()  # Last 5 messages for context
+        }
+        for summary in session_index.with_status("staff_requested")
+    ]
     
     takeover_requests.sort(key=lambda x: x["last_activity"], reverse=True)
     return {"requests": takeover_requests}
@@ -444,27 +922,20 @@ def get_staff_takeover_requests():
 async def close_call(request: CallLogRequest):
     """Close a call session"""
     try:
-        log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-        
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                log_data = json.load(f)
-        else:
+        if request.session_id not in session_index:
             return JSONResponse(status_code=404, content={"error": "Session not found"})
         
         # Add closing message
-        log_data["messages"].append({
-            "type": "system",
-            "message": "Call closed by agent",
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        log_data["status"] = "completed"
-        log_data["end_time"] = datetime.now().isoformat()
-        
-        # Save log
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        now = datetime.now().isoformat()
+        call_log_store.append_message(
+            request.session_id,
+            {
+                "type": "system",
+                "message": "Call closed by agent",
+                "timestamp": now
+            },
+            fields={"status": "completed", "end_time": now},
+        )
         
         logger.info(f"Call closed for session {request.session_id}")
         return {"success": True, "message": "Call closed"}
@@ -477,44 +948,67 @@ async def close_call(request: CallLogRequest):
 async def edit_transcript(request: EditTranscriptRequest):
     """Edit transcript message for typo correction"""
     try:
-        log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-        
-        if not os.path.exists(log_file):
+        summary = session_index.get(request.session_id)
+        if summary is None:
             return JSONResponse(status_code=404, content={"error": "Session not found"})
+        if summary.archived:
+            return JSONResponse(status_code=409, content={"error": "Session sudah diarsipkan"})
         
-        with open(log_file, "r", encoding="utf-8") as f:
-            log_data = json.load(f)
+        # Cari posisi pesan lewat index id; pesan lama tanpa id masih
+        # dikenali dari "<timestamp>-<type>"
+        located = session_index.locate(request.item_id)
+        if located and located[0] != request.session_id:
+            located = None
+        position = located[1] if located else None
+        if position is None:
+            log_data = call_log_store.load(request.session_id)
+            for i, message in enumerate(log_data["messages"]):
+                if f"{message['timestamp']}-{message['type']}" == request.item_id:
+                    position = i
+                    break
+        if position is None:
+            return JSONResponse(status_code=404, content={"error": "Message not found"})
         
-        # Find and update the message
-        for message in log_data["messages"]:
-            if message.get("id") == request.item_id or f"{message['timestamp']}-{message['type']}" == request.item_id:
-                message["message"] = request.new_text
-                message["edited"] = True
-                message["edited_at"] = datetime.now().isoformat()
-                break
+        edit = {
+            "op": "edit",
+            "position": position,
+            "message_id": request.item_id if located else None,
+            "message": request.new_text,
+            "edited_at": datetime.now().isoformat(),
+            "editor": request.editor,
+        }
+        
+        def check_revision(session_id):
+            # Dijalankan di dalam lock store, jadi dua edit tidak bisa saling menimpa
+            current = session_index.revision(session_id, position)
+            if request.expected_revision is not None and request.expected_revision != current:
+                raise StaleRevision(current)
+            edit["revision"] = current + 1
         
-        # Save updated log
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
+        try:
+            call_log_store.append(request.session_id, [edit], before_write=check_revision)
+        except StaleRevision as e:
+            return JSONResponse(
+                status_code=409,
+                content={"error": "Pesan sudah diubah oleh orang lain", "current_revision": e.current},
+            )
         
         logger.info(f"Transcript edited for session {request.session_id}")
-        return {"success": True, "message": "Transcript updated"}
+        return {"success": True, "message": "Transcript updated", "position": position, "revision": edit["revision"]}
         
     except Exception as e:
         logger.error(f"Error editing transcript: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-def send_email_notification(customer_email: str, customer_name: str, order_details: dict):
-    """Kirim email konfirmasi pesanan"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = "your-email@gmail.com"  # Ganti dengan email Anda
-        msg['To'] = customer_email
-        msg['Subject'] = f"Konfirmasi Pesanan - {order_details['session_id'][:8]}"
-        
-        items_text = "\n".join([f"- {item}" for item in order_details['order_items']])
-        
-        body = f"""
+def item_labels(items: list[dict]):
+    """Item hasil normalize_items sebagai teks ("2x Nasi Goreng")"""
+    return [f"{item['quantity']}x {item['name']}" if item["quantity"] != 1 else item["name"] for item in items]
+
+def format_email_notification(customer_name: str, order_details: dict, items: list[str]):
+    """Subject dan isi email konfirmasi pesanan"""
+    subject = f"Konfirmasi Pesanan - {order_details['session_id'][:8]}"
+    items_text = "\n".join([f"- {item}" for item in items])
+    body = f"""
 Halo {customer_name},
 
 Terima kasih atas pesanan Anda!
@@ -525,70 +1019,30 @@ Detail Pesanan:
 Total: Rp {order_details['total_amount']:,.0f}
 Alamat: {order_details['delivery_address']}
 Telepon: {order_details['customer_phone']}
-Catatan: {order_details.get('notes', 'Tidak ada')}
+Catatan: {order_details.get('notes') or 'Tidak ada'}
 
 Pesanan sedang diproses dan akan segera diantar.
 
 Salam,
 Tim Opetberjuang
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login("your-email@gmail.com", "your-app-password")  # Ganti dengan credentials
-        server.send_message(msg)
-        server.quit()
-        
-        logger.info(f"Email sent to {customer_email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error sending email: {e}")
-        return False
+    """
+    return subject, body
 
-def send_whatsapp_notification(customer_phone: str, customer_name: str, order_details: dict):
-    """Log WhatsApp message (implementasi manual diperlukan)"""
-    try:
-        items_text = ", ".join(order_details['order_items'])
-        
-        message = f"""
+def format_whatsapp_notification(customer_phone: str, customer_name: str, order_details: dict, items: list[str]):
+    """Isi pesan WhatsApp konfirmasi pesanan"""
+    items_text = ", ".join(items)
+    return f"""
 Konfirmasi Pesanan untuk {customer_name}
 Telepon: {customer_phone}
 Pesanan: {items_text}
 Total: Rp {order_details['total_amount']:,.0f}
 Alamat: {order_details['delivery_address']}
-        """
-        
-        # Simpan ke file log untuk manual WhatsApp
-        with open("whatsapp_messages.txt", "a", encoding="utf-8") as f:
-            f.write(f"\n{datetime.now().isoformat()}\n{message}\n{'='*50}\n")
-        
-        logger.info(f"WhatsApp message logged for {customer_phone}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error logging WhatsApp: {e}")
-        return False
+    """
 
 @app.post("/confirm-order")
 async def confirm_order(request: OrderConfirmationRequest):
     """Konfirmasi pesanan dan kirim notifikasi email/WhatsApp"""
     try:
-        # Simpan detail pesanan ke log
-        log_file = os.path.join(CALL_LOGS_DIR, f"{request.session_id}.json")
-        
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                log_data = json.load(f)
-        else:
-            log_data = {
-                "session_id": request.session_id,
-                "start_time": datetime.now().isoformat(),
-                "messages": []
-            }
-        
         # Tambahkan detail pesanan
         order_details = {
             "session_id": request.session_id,
@@ -602,53 +1056,144 @@ async def confirm_order(request: OrderConfirmationRequest):
             "order_time": datetime.now().isoformat()
         }
         
-        log_data["order_details"] = order_details
-        log_data["order_status"] = "confirmed"
-        
-        # Log konfirmasi pesanan
-        log_data["messages"].append({
-            "type": "system",
-            "message": f"Pesanan dikonfirmasi untuk {request.customer_name}",
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Simpan log
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(log_data, f, ensure_ascii=False, indent=2)
-        
-        # Kirim notifikasi
-        notifications_sent = {
-            "email": False,
-            "whatsapp": False
-        }
-        
-        # Kirim email jika ada email
-        if request.customer_email:
-            notifications_sent["email"] = send_email_notification(
-                request.customer_email, 
-                request.customer_name, 
-                order_details
-            )
+        # Simpan pesanan ke order store (harga item dilengkapi dari menu aktif)
+        items = normalize_items(request.order_items)
+        for item in items:
+            match = menu_index.search(item["name"], limit=1)
+            if match and match[0]["score"] >= 2.0:
+                item["price"] = float(match[0]["price"])
+        # Isi notifikasi disusun sebelum transaksi: gagal format tidak boleh membatalkan pesanan
+        messages = []
+        labels = item_labels(items)
+        try:
+            if request.customer_email:
+                subject, body = format_email_notification(request.customer_name, order_details, labels)
+                messages.append(("email", request.customer_email, body, subject))
+        except Exception:
+            logger.exception(f"Error formatting email notification for {request.session_id}")
+        try:
+            body = format_whatsapp_notification(request.customer_phone, request.customer_name, order_details, labels)
+            messages.append(("whatsapp", request.customer_phone, body, None))
+        except Exception:
+            logger.exception(f"Error formatting WhatsApp notification for {request.session_id}")
         
-        # Log WhatsApp message
-        notifications_sent["whatsapp"] = send_whatsapp_notification(
-            request.customer_phone,
-            request.customer_name,
-            order_details
+        # Notifikasi masuk outbox dalam transaksi yang sama dengan pesanan
+        notifications = []
+
+        def enqueue_notifications(conn, order_id):
+            for channel, recipient, body, subject in messages:
+                notifications.append((channel, notification_outbox.enqueue(
+                    conn, channel, recipient, body, subject=subject,
+                    order_id=order_id, session_id=request.session_id,
+                )))
+
+        order = order_store.upsert_from_session(
+            request.session_id,
+            {**order_details, "order_items": items},
+            before_commit=enqueue_notifications,
+        )
+        notification_outbox.wake()
+        event_broker.publish("order_updated", order, request.session_id)
+
+        # Simpan detail pesanan dan log konfirmasi pesanan
+        now = datetime.now().isoformat()
+        call_log_store.append_message(
+            request.session_id,
+            {
+                "type": "system",
+                "message": f"Pesanan dikonfirmasi untuk {request.customer_name}",
+                "timestamp": now
+            },
+            fields={"order_details": order_details, "order_status": "confirmed"},
+            start_time=now,
         )
         
         logger.info(f"Order confirmed for session {request.session_id}")
         return {
             "success": True, 
             "message": "Pesanan berhasil dikonfirmasi",
-            "notifications_sent": notifications_sent,
-            "order_id": request.session_id[:8]
+            "notifications": [
+                {"id": notification_id, "channel": channel, "status": "pending"}
+                for channel, notification_id in notifications
+            ],
+            "order_id": order["order_id"]
         }
         
     except Exception as e:
         logger.error(f"Error confirming order: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.get("/food-orders")
+def get_food_orders(status: str | None = None, phone: str | None = None, open: bool = False, limit: int = 100):
+    """Daftar pesanan; ?open=true untuk antrian dapur (terlama dulu)"""
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else []
+    if open and not statuses:
+        statuses = list(OPEN_STATUSES)
+    orders = order_store.list(statuses=statuses, phone=phone, limit=max(1, min(limit, 500)), oldest_first=open)
+    return {"orders": orders, "counts": order_store.counts_by_status()}
+
+@app.get("/food-orders/{order_id}")
+def get_food_order(order_id: str):
+    """Detail pesanan beserta riwayat status"""
+    order = order_store.get(order_id)
+    if order is None:
+        return JSONResponse(status_code=404, content={"error": "Pesanan tidak ditemukan"})
+    return {
+        **order,
+        "history": order_store.history(order_id),
+        "notifications": notification_outbox.list(order_id=order_id),
+    }
+
+@app.get("/notifications")
+def get_notifications(order_id: str | None = None, status: str | None = None, limit: int = 100):
+    """Status notifikasi di outbox (pending/sending/sent/failed)"""
+    return {
+        "notifications": notification_outbox.list(order_id=order_id, status=status, limit=max(1, min(limit, 500))),
+        "counts": notification_outbox.counts_by_status(),
+    }
+
+@app.post("/notifications/{notification_id}/retry")
+def retry_notification(notification_id: int):
+    """Kirim ulang notifikasi yang gagal"""
+    if not notification_outbox.retry(notification_id):
+        return JSONResponse(status_code=409, content={"error": "Hanya notifikasi dengan status failed yang bisa dikirim ulang"})
+    return {"success": True, "notification": notification_outbox.get(notification_id)}
+
+@app.post("/update-order-status")
+async def update_order_status(request: UpdateOrderStatusRequest):
+    """Ubah status pesanan sesuai alur dapur (pending -> ... -> completed)"""
+    def enqueue_status_notification(conn, order_id):
+        # Setiap update status dikirim ke pelanggan lewat WhatsApp
+        row = conn.execute("SELECT customer_phone, session_id FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        if row["customer_phone"]:
+            body = request.message or f"Status pesanan Anda: {request.status}"
+            notification_outbox.enqueue(conn, "whatsapp", row["customer_phone"], body, order_id=order_id, session_id=row["session_id"])
+
+    try:
+        order = order_store.update_status(
+            request.order_id, request.status, request.message, before_commit=enqueue_status_notification
+        )
+    except OrderNotFound:
+        return JSONResponse(status_code=404, content={"error": "Pesanan tidak ditemukan"})
+    except InvalidTransition as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+    notification_outbox.wake()
+    event_broker.publish("order_updated", order, order["session_id"])
+    if order["session_id"] and order["session_id"] in session_index:
+        call_log_store.append_message(
+            order["session_id"],
+            {
+                "type": "system",
+                "message": request.message or f"Status pesanan: {request.status}",
+                "timestamp": datetime.now().isoformat()
+            },
+            # Status dapur terpisah dari order_status (status panggilan: confirmed/completed/transferred)
+            fields={"kitchen_status": request.status},
+        )
+    logger.info(f"Order {request.order_id} status changed to {request.status}")
+    return {"success": True, "order": order}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8002)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""Cache hasil ekstraksi PDF yang dialamatkan oleh hash konten.
+
+Layout di ``pdf_extract_cache/`` (di samping ``uploaded_pdfs/``)::
+
+    docs/<sha256 file PDF>.json   -> {"pages": [hash halaman, ...]}
+    pages/<sha256 halaman>.json   -> {"text": teks PyPDF2, "ocr": teks OCR}
+
+Memilih ulang PDF yang sudah pernah diproses cukup membaca ``docs/`` dan
+``pages/``. Menu revisi yang sebagian besar halamannya sama dengan versi
+sebelumnya hanya meng-OCR halaman yang berubah.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
+
+import ocr_engine
+
+logger = logging.getLogger("pdf-cache")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stream_bytes(obj) -> bytes:
+    try:
+        return obj.get_data()
+    except (PyPdfError, NotImplementedError, ValueError, AttributeError):
+        # Filter stream tidak didukung atau objek bukan stream
+        return b""
+
+
+def page_fingerprint(page) -> str:
+    """Hash isi visual satu halaman: content stream, ukuran, font dan gambar."""
+    digest = hashlib.sha256()
+    digest.update(repr(list(page.mediabox)).encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(_stream_bytes(contents))
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    fonts = resources.get("/Font")
+    if fonts is not None:
+        fonts = fonts.get_object()
+        for name in sorted(fonts):
+            digest.update(name.encode())
+            digest.update(str(fonts[name].get_object().get("/BaseFont", "")).encode())
+    xobjects = resources.get("/XObject")
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode())
+            digest.update(_stream_bytes(xobjects[name].get_object()))
+    return digest.hexdigest()
+
+
+def read_pages(pdf_path: str) -> list[tuple[str, str]]:
+    """(hash halaman, teks PyPDF2) untuk setiap halaman. Blocking."""
+    reader = PdfReader(pdf_path)
+    return [(page_fingerprint(page), page.extract_text() or "") for page in reader.pages]
+
+
+class PdfTextCache:
+    """Penyimpanan teks per dokumen dan per halaman di disk."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.docs_dir = os.path.join(directory, "docs")
+        self.pages_dir = os.path.join(directory, "pages")
+        os.makedirs(self.docs_dir, exist_ok=True)
+        os.makedirs(self.pages_dir, exist_ok=True)
+        # (path, mtime, size) -> hash file, supaya select ulang tidak hash ulang
+        self._file_hashes: dict[tuple[str, float, int], str] = {}
+
+    @staticmethod
+    def _read_json(path: str) -> dict[str, Any] | None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _write_json(path: str, data: dict[str, Any]) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def document_hash(self, pdf_path: str) -> str:
+        stat = os.stat(pdf_path)
+        key = (os.path.abspath(pdf_path), stat.st_mtime, stat.st_size)
+        doc_hash = self._file_hashes.get(key)
+        if doc_hash is None:
+            doc_hash = file_sha256(pdf_path)
+            self._file_hashes[key] = doc_hash
+        return doc_hash
+
+    def remember_hash(self, pdf_path: str, doc_hash: str) -> None:
+        """Catat hash yang sudah dihitung saat upload agar tidak di-hash ulang."""
+        stat = os.stat(pdf_path)
+        self._file_hashes[(os.path.abspath(pdf_path), stat.st_mtime, stat.st_size)] = doc_hash
+
+    def get_page(self, page_hash: str) -> dict[str, Any] | None:
+        return self._read_json(os.path.join(self.pages_dir, f"{page_hash}.json"))
+
+    def put_page(self, page_hash: str, text: str, ocr: str) -> None:
+        self._write_json(os.path.join(self.pages_dir, f"{page_hash}.json"), {"text": text, "ocr": ocr})
+
+    def get_document(self, doc_hash: str) -> list[dict[str, Any]] | None:
+        """Semua halaman dokumen dari cache, atau None jika ada yang belum ada."""
+        doc = self._read_json(os.path.join(self.docs_dir, f"{doc_hash}.json"))
+        if doc is None:
+            return None
+        pages = []
+        for page_hash in doc["pages"]:
+            page = self.get_page(page_hash)
+            if page is None:
+                return None
+            pages.append({"hash": page_hash, **page})
+        return pages
+
+    def put_document(self, doc_hash: str, page_hashes: list[str]) -> None:
+        self._write_json(os.path.join(self.docs_dir, f"{doc_hash}.json"), {"pages": page_hashes})
+
+    def _lookup_pages(self, pdf_path: str) -> list[dict[str, Any]]:
+        pages = []
+        for page_hash, text in read_pages(pdf_path):
+            page = self.get_page(page_hash) or {"text": text, "ocr": None}
+            pages.append({"hash": page_hash, **page})
+        return pages
+
+    async def extract(self, pdf_path: str, progress: ocr_engine.ProgressCallback | None = None) -> list[dict[str, Any]]:
+        """Teks PyPDF2 + OCR per halaman, hanya OCR halaman yang belum di-cache.
+
+        Mengembalikan list ``{"hash", "text", "ocr"}`` berurutan per halaman;
+        ``ocr`` bernilai None untuk halaman yang OCR-nya gagal (tidak di-cache
+        sehingga dicoba lagi lain kali).
+        """
+        doc_hash = await asyncio.to_thread(self.document_hash, pdf_path)
+        cached = await asyncio.to_thread(self.get_document, doc_hash)
+        if cached is not None:
+            logger.info(f"PDF cache hit for {os.path.basename(pdf_path)} ({len(cached)} pages)")
+            return cached
+
+        pages = await asyncio.to_thread(self._lookup_pages, pdf_path)
+        missing = [number for number, page in enumerate(pages, 1) if page["ocr"] is None]
+        logger.info(f"PDF cache: {len(pages) - len(missing)}/{len(pages)} pages cached, OCR {len(missing)} pages")
+
+        if missing:
+            ocr_results = await ocr_engine.ocr_pdf(pdf_path, pages=missing, progress=progress)
+            for number, ocr_text in zip(missing, ocr_results):
+                page = pages[number - 1]
+                page["ocr"] = ocr_text
+                if ocr_text is not None:
+                    await asyncio.to_thread(self.put_page, page["hash"], page["text"], ocr_text)
+
+        if all(page["ocr"] is not None for page in pages):
+            await asyncio.to_thread(self.put_document, doc_hash, [page["hash"] for page in pages])
+        return pages
@@ -0,0 +1,136 @@
+"""Penyusunan prompt agent suara dan bot WhatsApp dengan prefix statis.
+
+OpenAI meng-cache awalan prompt yang persis sama antar request (mulai 1024
+token); token yang kena cache lebih murah dan lebih cepat diproses. Karena
+itu setiap prompt disusun sebagai::
+
+    [prefix statis: kebijakan + snapshot menu] [bagian dinamis per pesan/panggilan]
+
+Prefix hanya bergantung pada versi kebijakan dan versi menu, tidak pada
+pelanggan atau isi pesan, dan menu yang terlalu panjang selalu dipotong di
+batas baris yang sama. ``PromptPrefix.version`` dicatat bersama pemakaian
+token di call log sehingga cache hit rate bisa dibandingkan per versi.
+Ubah ``POLICY_VERSION`` setiap kali teks kebijakan diubah.
+"""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from typing import Any
+
+POLICY_VERSION = 1
+
+VOICE_POLICY = (
+    "Anda adalah Interactive Call Agent AI yang membantu pelanggan. Jangan menyebutkan nama bisnis kecuali diminta."
+    "\n\nFITUR PEMESANAN: Bantu pelanggan memesan makanan dari menu yang tersedia."
+    "\n\nKONFIRMASI PESANAN: Setelah pelanggan konfirmasi pesanan, tanyakan nama, nomor telepon, email (opsional), "
+    "dan alamat pengiriman. Lalu katakan 'ORDER_CONFIRMED' diikuti detail dalam format: "
+    "NAMA|TELEPON|EMAIL|ALAMAT|ITEM1,ITEM2|TOTAL|CATATAN| (diakhiri '|')"
+    "\n\nAUTO CALL CLOSURE: Katakan 'CLOSE_CALL_CONFIRMED' untuk menutup panggilan."
+    "\n\nHUMAN TAKEOVER: Katakan 'TRANSFER_TO_HUMAN' untuk transfer ke staff."
+)
+
+WHATSAPP_POLICY = (
+    "Anda adalah Interactive Call Agent AI untuk Warteg OPET yang berkomunikasi melalui WhatsApp.\n"
+    "Selalu merespons dalam bahasa Indonesia dengan ramah dan informatif.\n\n"
+    "FITUR PEMESANAN MAKANAN:\n"
+    "Jika pelanggan ingin memesan makanan, bantu mereka dengan menanyakan:\n"
+    "1. Nama lengkap\n"
+    "2. Email\n"
+    "3. Nomor telepon (sudah ada dari WhatsApp)\n"
+    "4. Item yang dipesan (nama, jumlah, harga)\n"
+    "5. Waktu pengiriman yang diinginkan\n"
+    "6. Alamat pengiriman\n"
+    "7. Catatan khusus\n\n"
+    "Setelah mendapat semua informasi, konfirmasi pesanan dan buat pesanan melalui sistem.\n\n"
+    "Gunakan informasi menu di bawah untuk membantu pelanggan memilih makanan dan menghitung total harga pesanan."
+)
+
+MENU_TOOL_NOTE = (
+    "MENU MAKANAN: Gunakan fungsi cari_menu untuk mencari item, harga dan deskripsi menu "
+    "sebelum menjawab pertanyaan tentang menu."
+)
+MENU_TRUNCATED_NOTE = "[Menu lengkap lebih panjang; bagian yang relevan diberikan bersama pesan pelanggan.]"
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    name: str
+    text: str
+    version: str
+    # True jika seluruh menu ada di prefix (konteks menu per pesan tidak perlu)
+    menu_complete: bool
+
+
+def menu_snapshot(text: str, max_chars: int) -> str:
+    """Menu utuh, atau dipotong di baris terakhir yang muat dalam ``max_chars``."""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut <= 0:
+        cut = text.rfind(" ", 0, max_chars)
+    return text[: cut if cut > 0 else max_chars].rstrip()
+
+
+def build_prefix(name: str, policy: str, menu_text: str = "", menu_version: int | None = None, menu_chars: int = 0, menu_heading: str = "MENU MAKANAN:", tool_note: str | None = None) -> PromptPrefix:
+    """Prefix statis: kebijakan lalu snapshot menu (atau petunjuk tool jika menu terlalu panjang).
+
+    Jika ``tool_note`` diisi, menu yang lebih panjang dari ``menu_chars``
+    tidak ditempel sama sekali dan diganti petunjuk tersebut.
+    """
+    sections = [policy]
+    menu_text = (menu_text or "").strip()
+    complete = not menu_text
+    if menu_text:
+        if len(menu_text) <= menu_chars:
+            sections.append(f"{menu_heading}\n{menu_text}")
+            complete = True
+        elif tool_note:
+            sections.append(tool_note)
+        else:
+            sections.append(f"{menu_heading}\n{menu_snapshot(menu_text, menu_chars)}\n{MENU_TRUNCATED_NOTE}")
+    text = "\n\n".join(sections)
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+    version = f"{name}-p{POLICY_VERSION}-m{menu_version if menu_version is not None else 0}-{digest}"
+    return PromptPrefix(name, text, version, complete)
+
+
+def assemble(prefix: PromptPrefix, *dynamic: str | None) -> list[str]:
+    """Isi system message: prefix statis, lalu bagian dinamis (yang kosong dilewati) dalam satu message."""
+    parts = [part for part in dynamic if part]
+    return [prefix.text, "\n\n".join(parts)] if parts else [prefix.text]
+
+
+def _get(obj: Any, name: str, default: Any = None) -> Any:
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def usage_from_chat(usage: Any, prompt_version: str | None = None, latency_ms: float | None = None) -> dict[str, Any] | None:
+    """Token input/cached/output dari ``usage`` Chat Completions; latency diukur pemanggil."""
+    if usage is None:
+        return None
+    return {
+        "input_tokens": _get(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": _get(_get(usage, "prompt_tokens_details"), "cached_tokens", 0) or 0,
+        "output_tokens": _get(usage, "completion_tokens", 0) or 0,
+        "prompt_version": prompt_version,
+        "latency_ms": latency_ms,
+    }
+
+
+def usage_from_realtime(metrics: Any, prompt_version: str | None = None) -> dict[str, Any]:
+    """Token input/cached/output dari ``RealtimeModelMetrics`` LiveKit; latency = waktu ke audio pertama."""
+    ttft = _get(metrics, "ttft", -1)
+    return {
+        "input_tokens": _get(metrics, "input_tokens", 0) or 0,
+        "cached_tokens": _get(_get(metrics, "input_token_details"), "cached_tokens", 0) or 0,
+        "output_tokens": _get(metrics, "output_tokens", 0) or 0,
+        "prompt_version": prompt_version,
+        "request_id": _get(metrics, "request_id"),
+        "latency_ms": round(ttft * 1000) if ttft is not None and ttft >= 0 else None,
+    }
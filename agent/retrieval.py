@@ -0,0 +1,175 @@
+"""Retrieval BM25 atas potongan (chunk) teks menu/dokumen aktif.
+
+Teks aktif dipecah menjadi chunk beberapa baris, lalu di-index dalam
+inverted index di memori. ``GET /retrieve?q=&k=`` mengembalikan k chunk
+paling relevan sehingga prompt cukup berisi bagian dokumen yang
+ditanyakan, bukan potongan N karakter pertama.
+
+Chunk dialamatkan oleh hash isinya: saat PDF lain dipilih atau menu
+direvisi, hanya chunk yang berubah yang di-index ulang.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any
+
+CHUNK_MAX_CHARS = 600
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Kata fungsi Bahasa Indonesia (dan sedikit Inggris, karena deskripsi menu
+# sering berbahasa Inggris) yang tidak membantu membedakan chunk
+STOPWORDS = {
+    "yang", "dan", "di", "ke", "dari", "ini", "itu", "dengan", "untuk", "pada", "dalam",
+    "atau", "juga", "ada", "adalah", "akan", "bisa", "dapat", "sudah", "belum", "tidak",
+    "ya", "apa", "apakah", "berapa", "saya", "aku", "kami", "kita", "anda", "kamu", "mau",
+    "ingin", "minta", "tolong", "dong", "deh", "sih", "kak", "mas", "mbak", "pak", "bu",
+    "nya", "para", "oleh", "karena", "jadi", "kalau", "jika", "seperti", "lagi", "saja",
+    "the", "and", "with", "of", "a", "an", "in", "on", "to", "for", "served", "our",
+}
+# Partikel/klitik yang menempel di akhir kata: "ayamnya" -> "ayam", "adakah" -> "ada"
+SUFFIXES = ("nya", "lah", "kah", "pun", "ku", "mu")
+
+
+def stem(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        token = stem(token)
+        if token and token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> list[str]:
+    """Gabungkan baris berurutan menjadi chunk <= ``max_chars``.
+
+    Batas chunk diutamakan di baris kosong; baris terakhir chunk sebelumnya
+    diulang di awal chunk berikutnya supaya nama item tidak terpisah dari
+    harga/deskripsinya.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            if size >= max_chars // 2:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            continue
+        if current and size + len(line) > max_chars:
+            chunks.append("\n".join(current))
+            current = current[-1:] if len(current[-1]) < max_chars // 4 else []
+            size = sum(len(text) for text in current)
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class _Chunk:
+    __slots__ = ("id", "length", "terms", "text")
+
+    def __init__(self, chunk_id: str, text: str):
+        self.id = chunk_id
+        self.text = text
+        self.terms = Counter(tokenize(text))
+        self.length = sum(self.terms.values())
+
+
+class BM25Index:
+    """Inverted index BM25 yang bisa di-update per chunk."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_chunk_chars: int = CHUNK_MAX_CHARS):
+        self.k1 = k1
+        self.b = b
+        self.max_chunk_chars = max_chunk_chars
+        self.version = 0
+        self._lock = threading.Lock()
+        self._chunks: dict[str, _Chunk] = {}
+        self._order: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def update(self, text: str, version: int = 0) -> dict[str, int]:
+        """Sinkronkan index dengan teks baru; hanya chunk baru/berubah yang di-index."""
+        texts = chunk_text(text, self.max_chunk_chars)
+        order = []
+        new_chunks: dict[str, str] = {}
+        for chunk in texts:
+            chunk_id = hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
+            if chunk_id not in new_chunks:
+                new_chunks[chunk_id] = chunk
+                order.append(chunk_id)
+
+        with self._lock:
+            removed = [chunk_id for chunk_id in self._chunks if chunk_id not in new_chunks]
+            added = [chunk_id for chunk_id in order if chunk_id not in self._chunks]
+            for chunk_id in removed:
+                chunk = self._chunks.pop(chunk_id)
+                self._total_length -= chunk.length
+                for term in chunk.terms:
+                    postings = self._postings[term]
+                    del postings[chunk_id]
+                    if not postings:
+                        del self._postings[term]
+            for chunk_id in added:
+                chunk = _Chunk(chunk_id, new_chunks[chunk_id])
+                self._chunks[chunk_id] = chunk
+                self._total_length += chunk.length
+                for term, freq in chunk.terms.items():
+                    self._postings.setdefault(term, {})[chunk_id] = freq
+            self._order = order
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(order)}
+            self.version = version
+        return {"chunks": len(order), "added": len(added), "removed": len(removed)}
+
+    def search(self, query: str, k: int = 5) -> list[dict[str, Any]]:
+        terms = tokenize(query)
+        with self._lock:
+            total = len(self._chunks)
+            if not terms or not total:
+                return []
+            avg_length = self._total_length / total or 1.0
+            scores: dict[str, float] = {}
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings.items():
+                    length = self._chunks[chunk_id].length
+                    norm = freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * length / avg_length))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+            top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+            return [
+                {
+                    "id": chunk_id,
+                    "position": self._positions[chunk_id],
+                    "score": round(score, 4),
+                    "text": self._chunks[chunk_id].text,
+                }
+                for chunk_id, score in top
+            ]
+
+    def get(self, chunk_id: str) -> str | None:
+        chunk = self._chunks.get(chunk_id)
+        return chunk.text if chunk else None
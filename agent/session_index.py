@@ -0,0 +1,324 @@
+"""Index ringkasan session di memori untuk endpoint listing call log.
+
+Index dibangun sekali saat startup dari ``CallLogStore`` lalu diperbarui
+dari listener store setiap kali endpoint menulis record, sehingga
+``/call-logs``, ``/active-sessions`` dan ``/staff-takeover-requests`` tidak
+perlu membaca file log sama sekali.
+
+Selain itu index menyimpan kunci ``(start_time, session_id)`` yang terurut,
+total dan per status, sehingga ``GET /call-logs`` bisa dipaginasi dengan
+keyset (cursor) dalam O(ukuran halaman) tanpa mengurutkan semua session.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from collections.abc import Iterable
+from typing import Any
+
+RECENT_MESSAGES = 5
+# Batas session yang diperiksa per halaman saat filter non-index (order_status,
+# teks result) jarang cocok; halaman bisa lebih pendek tapi tetap punya cursor
+MAX_PAGE_SCAN = 5000
+
+SortKey = tuple[str, str]
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Kebalikan ``encode_cursor``; ValueError jika cursor tidak valid."""
+    try:
+        start_time, session_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Cursor tidak valid: {cursor}") from e
+    return str(start_time), str(session_id)
+
+
+class SessionSummary:
+    """Ringkasan kecil satu session; cukup untuk semua endpoint listing."""
+
+    __slots__ = (
+        "archived",
+        "last_activity",
+        "message_count",
+        "order_status",
+        "recent",
+        "result",
+        "session_id",
+        "start_time",
+        "status",
+        "version",
+    )
+
+    def __init__(self, session_id: str, start_time: str):
+        self.session_id = session_id
+        self.start_time = start_time
+        self.last_activity = start_time
+        self.message_count = 0
+        self.status = "active"
+        self.result = ""
+        self.order_status = "none"
+        # Jumlah record yang sudah diterapkan; naik setiap kali session berubah
+        self.version = 0
+        # (posisi pesan, pesan) untuk beberapa pesan terakhir
+        self.recent: deque[tuple[int, dict[str, Any]]] = deque(maxlen=RECENT_MESSAGES)
+        # True jika log session sudah dipindahkan ke call_logs/archive/
+        self.archived = False
+
+    def recent_messages(self) -> list[dict[str, Any]]:
+        return [message for _, message in self.recent]
+
+    @property
+    def sort_key(self) -> SortKey:
+        return (self.start_time, self.session_id)
+
+    def to_log_entry(self) -> dict[str, Any]:
+        """Format item pada ``GET /call-logs``."""
+        return {
+            "session_id": self.session_id,
+            "start_time": self.start_time,
+            "message_count": self.message_count,
+            "last_message": self.last_activity,
+            "status": self.status,
+            "result": self.result,
+            "archived": self.archived,
+        }
+
+    def to_archive_entry(self) -> dict[str, Any]:
+        """Ringkasan yang disimpan di index arsip (lihat ``load_archived``)."""
+        return {
+            "session_id": self.session_id,
+            "start_time": self.start_time,
+            "last_activity": self.last_activity,
+            "message_count": self.message_count,
+            "status": self.status,
+            "result": self.result,
+            "order_status": self.order_status,
+            "version": self.version,
+        }
+
+
+class SessionIndex:
+    """Ringkasan semua session plus index session_id per status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: dict[str, SessionSummary] = {}
+        self._by_status: dict[str, set[str]] = {}
+        # Kunci terurut (start_time, session_id): semua session dan per status
+        self._ordered: list[SortKey] = []
+        self._ordered_by_status: dict[str, list[SortKey]] = {}
+        self._bulk_loading = False
+        # id pesan -> (session_id, posisi) dan revisi pesan yang pernah diedit
+        self._message_ids: dict[str, tuple[str, int]] = {}
+        self._revisions: dict[tuple[str, int], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> SessionSummary | None:
+        return self._sessions.get(session_id)
+
+    def all(self) -> list[SessionSummary]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def with_status(self, status: str) -> list[SessionSummary]:
+        """Session dengan status tertentu, O(jumlah hasil)."""
+        with self._lock:
+            return [self._sessions[sid] for sid in self._by_status.get(status, ())]
+
+    def locate(self, message_id: str) -> tuple[str, int] | None:
+        """(session_id, posisi) pesan berdasarkan id-nya, O(1)."""
+        return self._message_ids.get(message_id)
+
+    def revision(self, session_id: str, position: int) -> int:
+        """Revisi pesan saat ini (0 jika belum pernah diedit)."""
+        return self._revisions.get((session_id, position), 0)
+
+    def status_counts(self) -> dict[str, int]:
+        with self._lock:
+            return {status: len(keys) for status, keys in self._ordered_by_status.items() if keys}
+
+    def page(
+        self,
+        limit: int = 50,
+        cursor: SortKey | None = None,
+        status: str | None = None,
+        order_status: str | None = None,
+        start_from: str | None = None,
+        start_to: str | None = None,
+        result_contains: str | None = None,
+        descending: bool = True,
+        max_scan: int = MAX_PAGE_SCAN,
+    ) -> tuple[list[SessionSummary], SortKey | None]:
+        """Satu halaman session terurut ``start_time`` dengan filter.
+
+        ``cursor`` adalah kunci terakhir halaman sebelumnya (eksklusif);
+        rentang waktu ``start_from <= start_time < start_to``. Filter status
+        memakai list per status; ``order_status`` dan ``result_contains``
+        diperiksa per session dalam rentang tersebut, paling banyak
+        ``max_scan`` session per halaman. Mengembalikan (session, cursor
+        berikutnya atau None jika sudah habis).
+        """
+        needle = result_contains.lower() if result_contains else None
+        with self._lock:
+            keys = self._ordered_by_status.get(status, []) if status else self._ordered
+            lo = bisect_left(keys, (start_from, "")) if start_from else 0
+            hi = bisect_left(keys, (start_to, "")) if start_to else len(keys)
+            if descending:
+                if cursor is not None:
+                    hi = min(hi, bisect_left(keys, cursor))
+                indices = range(hi - 1, lo - 1, -1)
+            else:
+                if cursor is not None:
+                    lo = max(lo, bisect_right(keys, cursor))
+                indices = range(lo, hi)
+
+            results: list[SessionSummary] = []
+            for scanned, i in enumerate(indices, 1):
+                key = keys[i]
+                summary = self._sessions[key[1]]
+                if (order_status is None or summary.order_status == order_status) and (
+                    needle is None or needle in (summary.result or "").lower()
+                ):
+                    if len(results) == limit:
+                        return results, results[-1].sort_key
+                    results.append(summary)
+                if scanned >= max_scan and len(results) < limit:
+                    # Batas scan tercapai: lanjutkan dari kunci ini di request berikutnya
+                    more = i > lo if descending else i < hi - 1
+                    return results, key if more else None
+            return results, None
+
+    # ---------------------------------------------------------------- updates
+
+    def rebuild(self, store) -> None:
+        """Bangun ulang index dari semua log di store."""
+        with self._lock:
+            self._sessions.clear()
+            self._by_status.clear()
+            self._ordered.clear()
+            self._ordered_by_status.clear()
+            self._message_ids.clear()
+            self._revisions.clear()
+            self._bulk_loading = True
+        try:
+            for session_id in store.session_ids():
+                self.apply(session_id, store.iter_records(session_id))
+        finally:
+            with self._lock:
+                # Saat bulk load kunci hanya di-append; urutkan sekali di akhir
+                self._bulk_loading = False
+                self._ordered.sort()
+                for keys in self._ordered_by_status.values():
+                    keys.sort()
+
+    def load_archived(self, entries: Iterable[dict[str, Any]]) -> int:
+        """Tambahkan ringkasan session arsip; session yang masih aktif diutamakan."""
+        loaded = 0
+        with self._lock:
+            for entry in entries:
+                if entry["session_id"] in self._sessions:
+                    continue
+                summary = SessionSummary(entry["session_id"], entry["start_time"])
+                summary.last_activity = entry["last_activity"]
+                summary.message_count = entry["message_count"]
+                summary.status = entry["status"]
+                summary.result = entry["result"]
+                summary.order_status = entry["order_status"]
+                summary.version = entry["version"]
+                summary.archived = True
+                self._add(summary)
+                loaded += 1
+            self._ordered.sort()
+            for keys in self._ordered_by_status.values():
+                keys.sort()
+        return loaded
+
+    def mark_archived(self, session_id: str) -> None:
+        summary = self._sessions.get(session_id)
+        if summary is not None:
+            summary.archived = True
+            summary.recent.clear()
+
+    def apply(self, session_id: str, records: Iterable[dict[str, Any]]) -> None:
+        """Listener ``CallLogStore``: terapkan record baru ke ringkasan."""
+        with self._lock:
+            for record in records:
+                self._apply_record(session_id, record)
+
+    def _insert_key(self, keys: list[SortKey], key: SortKey) -> None:
+        if self._bulk_loading:
+            keys.append(key)
+        else:
+            insort(keys, key)
+
+    def _remove_key(self, keys: list[SortKey], key: SortKey) -> None:
+        if self._bulk_loading:
+            keys.remove(key)
+            return
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def _add(self, summary: SessionSummary) -> None:
+        self._sessions[summary.session_id] = summary
+        self._by_status.setdefault(summary.status, set()).add(summary.session_id)
+        self._insert_key(self._ordered, summary.sort_key)
+        self._insert_key(self._ordered_by_status.setdefault(summary.status, []), summary.sort_key)
+
+    def _set_status(self, summary: SessionSummary, status: str) -> None:
+        self._by_status.get(summary.status, set()).discard(summary.session_id)
+        self._remove_key(self._ordered_by_status.setdefault(summary.status, []), summary.sort_key)
+        summary.status = status
+        self._by_status.setdefault(status, set()).add(summary.session_id)
+        self._insert_key(self._ordered_by_status.setdefault(status, []), summary.sort_key)
+
+    def _apply_record(self, session_id: str, record: dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "header":
+            previous = self._sessions.get(session_id)
+            if previous is not None:
+                # Session arsip yang ditulis lagi mendapat log aktif baru
+                self._by_status.get(previous.status, set()).discard(session_id)
+                self._remove_key(self._ordered, previous.sort_key)
+                self._remove_key(self._ordered_by_status.setdefault(previous.status, []), previous.sort_key)
+            self._add(SessionSummary(session_id, record["start_time"]))
+        summary = self._sessions.get(session_id)
+        if summary is None:
+            return
+        summary.version += 1
+        if op == "message":
+            message = {k: v for k, v in record.items() if k != "op"}
+            if "id" in message:
+                self._message_ids[message["id"]] = (session_id, summary.message_count)
+            summary.recent.append((summary.message_count, message))
+            summary.message_count += 1
+            summary.last_activity = message.get("timestamp", summary.last_activity)
+        elif op == "set":
+            fields = record["fields"]
+            if "status" in fields and fields["status"] != summary.status:
+                self._set_status(summary, fields["status"])
+            if "result" in fields:
+                summary.result = fields["result"]
+            if "order_status" in fields:
+                summary.order_status = fields["order_status"]
+        elif op == "edit":
+            key = (session_id, record["position"])
+            self._revisions[key] = record.get("revision", self._revisions.get(key, 0) + 1)
+            for position, message in summary.recent:
+                if position == record["position"]:
+                    message["message"] = record["message"]
+                    message["revision"] = self._revisions[key]
+                    message["edited"] = True
+                    message["edited_at"] = record["edited_at"]
@@ -0,0 +1,117 @@
+"""Histogram latency Prometheus untuk pdf_api, bot WhatsApp dan voice agent.
+
+Setiap service mengekspos metriknya sendiri di ``GET /metrics``: pdf_api dan
+bot WhatsApp lewat ``instrument(app, service)`` (middleware latency handler
+HTTP + route ``/metrics``), voice agent lewat ``prometheus_port`` LiveKit.
+Job voice agent berjalan di proses anak, jadi worker memakai mode
+multiprocess prometheus_client (``PROMETHEUS_MULTIPROC_DIR``); ``render()``
+mengikuti mode yang sama jika API dijalankan dengan beberapa worker uvicorn.
+
+Semua durasi dalam detik.
+"""
+from __future__ import annotations
+
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TURN_BUCKETS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0)
+OCR_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+WAIT_BUCKETS = (0.0, 1.0, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency handler HTTP sampai response mulai dikirim",
+    ("service", "method", "route", "status"),
+    buckets=HTTP_BUCKETS,
+)
+VOICE_RESPONSE_SECONDS = Histogram(
+    "voice_response_latency_seconds",
+    "Akhir ucapan penelepon sampai audio pertama agent",
+    buckets=TURN_BUCKETS,
+)
+WHATSAPP_REPLY_SECONDS = Histogram(
+    "whatsapp_reply_latency_seconds",
+    "Webhook diterima sampai balasan WhatsApp terkirim",
+    ("outcome",),
+    buckets=TURN_BUCKETS,
+)
+OCR_PAGE_SECONDS = Histogram(
+    "ocr_page_duration_seconds",
+    "Rasterisasi dan OCR satu halaman PDF (tanpa waktu antri di pool)",
+    buckets=OCR_BUCKETS,
+)
+CALL_LOG_APPEND_SECONDS = Histogram(
+    "call_log_append_seconds",
+    "Menulis record ke call log (CallLogStore.append, termasuk listener)",
+    buckets=HTTP_BUCKETS,
+)
+CONVERSATION_LOG_SEND_SECONDS = Histogram(
+    "conversation_log_send_seconds",
+    "Pengiriman satu batch log voice agent ke API, termasuk retry",
+    ("outcome",),
+    buckets=HTTP_BUCKETS,
+)
+ADMISSION_ACTIVE_SESSIONS = Gauge(
+    "admission_active_sessions",
+    "Session realtime yang memegang slot admission",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Penelepon yang antri menunggu slot admission",
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds",
+    "Lama antri sampai mendapat slot admission",
+    buckets=WAIT_BUCKETS,
+)
+ADMISSION_EVENTS = Counter(
+    "admission_events",
+    "Kejadian admission (admitted, queued, abandoned, expired, routed)",
+    ("event",),
+)
+
+
+def render() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def instrument(app: FastAPI, service: str) -> None:
+    """Catat latency setiap handler dan tambahkan ``GET /metrics``."""
+
+    @app.middleware("http")
+    async def record_latency(request: Request, call_next):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Template route (mis. /call-logs/{session_id}) supaya label tidak meledak
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                service, request.method, getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(render(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modul agent diimpor sebagai modul top-level (seperti saat dijalankan dari agent/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,98 @@
+"""AdmissionQueue: urutan FIFO, lease yang kedaluwarsa, worker penuh, metrik Prometheus."""
+from prometheus_client import REGISTRY
+
+from admission import AdmissionQueue, simulate_burst
+
+
+def test_waiting_callers_are_admitted_in_fifo_order():
+    queue = AdmissionQueue(max_sessions=2, lease_ttl=60, wait_ttl=60)
+    assert queue.acquire("a", now=0)["admitted"]
+    assert queue.acquire("b", now=0)["admitted"]
+
+    positions = [queue.acquire(sid, now=t)["position"] for t, sid in enumerate(["c", "d", "e"], start=1)]
+    assert positions == [1, 2, 3]
+
+    assert queue.release("a", now=10) == "active"
+    # Slot langsung dipegang penelepon terdepan, bahkan sebelum poll berikutnya
+    waiting = queue.acquire("d", now=11)
+    assert (waiting["admitted"], waiting["position"], waiting["queue_depth"]) == (False, 1, 2)
+    assert queue.acquire("c", now=11)["admitted"]
+
+    assert queue.release("b", now=12) == "active"
+    assert queue.acquire("e", now=13)["position"] == 1
+    assert queue.acquire("d", now=13)["admitted"]
+    # Waktu tunggu dihitung sampai slot dipegang (saat release), bukan sampai poll
+    waits = queue.metrics(now=13)["wait_seconds"]
+    assert (waits["count"], waits["p99"]) == (4, 10)
+
+
+def test_expired_lease_frees_slot_for_next_caller():
+    queue = AdmissionQueue(max_sessions=1, lease_ttl=30, wait_ttl=60)
+    assert queue.acquire("a", now=0)["admitted"]
+    assert queue.acquire("b", now=1)["position"] == 1
+
+    # Renewal memperpanjang lease, jadi a masih aktif di t=40
+    assert queue.acquire("a", now=20)["admitted"]
+    assert not queue.acquire("b", now=40)["admitted"]
+
+    # Worker a mati tanpa release: lease habis di t=50 dan b naik
+    assert queue.acquire("b", now=50)["admitted"]
+    assert queue.counters["expired"] == 1
+    assert queue.release("a", now=51) is None
+
+
+def test_caller_that_stops_polling_is_dropped():
+    queue = AdmissionQueue(max_sessions=1, lease_ttl=60, wait_ttl=15)
+    queue.acquire("a", now=0)
+    queue.acquire("b", now=1)
+    assert queue.acquire("c", now=2)["position"] == 2
+    assert queue.acquire("c", now=12)["position"] == 2
+
+    # b tidak polling lagi sejak t=1, c tetap polling
+    assert queue.acquire("c", now=20)["position"] == 1
+    assert queue.counters["abandoned"] == 1
+
+
+def test_full_worker_is_skipped_without_losing_position():
+    queue = AdmissionQueue(max_sessions=3, max_per_worker=1, lease_ttl=60, wait_ttl=60)
+    assert queue.acquire("a", worker_id="w1", now=0)["admitted"]
+    assert queue.acquire("b", worker_id="w1", now=1)["position"] == 1
+
+    # w1 penuh, jadi c (w2) dilewatkan ke depan b
+    assert queue.acquire("c", worker_id="w2", now=2)["admitted"]
+    assert queue.acquire("b", worker_id="w1", now=3)["position"] == 1
+
+    queue.release("a", now=4)
+    assert queue.acquire("b", worker_id="w1", now=5)["admitted"]
+    assert queue.metrics(now=5)["per_worker"] == {"w1": 1, "w2": 1}
+
+
+def test_exports_queue_depth_and_wait_to_prometheus():
+    def sample(name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    waits_before = sample("admission_wait_seconds_count")
+    expired_before = sample("admission_events_total", {"event": "expired"})
+
+    queue = AdmissionQueue(max_sessions=1, lease_ttl=30, wait_ttl=60, export_metrics=True)
+    queue.acquire("a", now=0)
+    queue.acquire("b", now=1)
+    queue.acquire("c", now=2)
+    assert sample("admission_active_sessions") == 1
+    assert sample("admission_queue_depth") == 2
+
+    queue.acquire("b", now=31)
+    assert sample("admission_queue_depth") == 1
+    assert sample("admission_wait_seconds_count") == waits_before + 2
+    assert sample("admission_events_total", {"event": "expired"}) == expired_before + 1
+
+
+def test_admission_keeps_model_below_rate_limit_during_burst():
+    unlimited = simulate_burst(0, burst_minutes=15)
+    limited = simulate_burst(25, burst_minutes=15)
+
+    assert unlimited["peak_sessions"] > 30 and unlimited["rate_limited_turns"] > 0
+    assert limited["peak_sessions"] <= 25
+    assert limited["rate_limited_turns"] == 0
+    assert limited["turn_p99"] < unlimited["turn_p99"] / 5
+    assert limited["wait_p99"] <= 120
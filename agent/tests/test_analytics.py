@@ -0,0 +1,114 @@
+"""CallAnalytics: volume per bucket, delay respon, outcome, pesanan dan token."""
+import math
+
+import pytest
+
+from analytics import CallAnalytics, parse_time
+
+
+def header(start):
+    return {"op": "header", "start_time": start}
+
+
+def msg(kind, timestamp, **extra):
+    return {"op": "message", "type": kind, "message": "...", "timestamp": timestamp, **extra}
+
+
+@pytest.fixture
+def analytics():
+    analytics = CallAnalytics()
+    # Hari 1: pesanan 45.000, delay dari timestamp 2 detik lalu diganti delay terukur 1.5
+    analytics.apply(
+        "s1",
+        [
+            header("2024-05-01T10:00:00"),
+            msg("user", "2024-05-01T10:00:00"),
+            msg("agent", "2024-05-01T10:00:02"),
+            {"op": "delay", "seconds": 1.5},
+            msg("user", "2024-05-01T10:01:00"),
+            msg("agent", "2024-05-01T10:01:03"),
+            {"op": "set", "fields": {"order_details": {"total_amount": 45000}, "order_status": "confirmed"}},
+            {"op": "keyword", "keyword": "CLOSE_CALL_CONFIRMED"},
+            {"op": "usage", "timestamp": "2024-05-01T10:01:03", "input_tokens": 1000, "cached_tokens": 800, "output_tokens": 50, "latency_ms": 400},
+        ],
+    )
+    # Hari 1: ditransfer ke staff, tanpa pesanan
+    analytics.apply(
+        "s2",
+        [
+            header("2024-05-01T12:00:00"),
+            msg("user", "2024-05-01T12:00:00"),
+            msg("agent", "2024-05-01T12:00:04", usage={"input_tokens": 1000, "cached_tokens": 0, "output_tokens": 30, "latency_ms": 900}),
+            {"op": "keyword", "keyword": "TRANSFER_TO_HUMAN"},
+        ],
+    )
+    # Hari 3: pesanan 15.000 (hari 2 kosong tetap muncul sebagai bucket)
+    analytics.apply(
+        "s3",
+        [
+            header("2024-05-03T09:00:00"),
+            msg("user", "2024-05-03T09:00:00"),
+            msg("staff", "2024-05-03T09:00:30"),
+            {"op": "set", "fields": {"order_details": {"total_amount": 15000}}},
+        ],
+    )
+    return analytics
+
+
+def test_daily_volume_and_orders(analytics):
+    summary = analytics.summary()
+    assert [(b["start"], b["calls"], b["messages"], b["orders"], b["revenue"]) for b in summary["volume"]] == [
+        ("2024-05-01T00:00:00", 2, 6, 1, 45000.0),
+        ("2024-05-02T00:00:00", 0, 0, 0, 0.0),
+        ("2024-05-03T00:00:00", 1, 2, 1, 15000.0),
+    ]
+    assert summary["messages_by_type"] == {"user": 4, "agent": 3, "staff": 1, "system": 0}
+    assert summary["orders"] == {"count": 2, "revenue": 60000.0, "average": 30000.0}
+
+
+def test_outcomes_and_response_delays(analytics):
+    summary = analytics.summary()
+    assert summary["outcomes"] == {
+        "calls": 3,
+        "ordered": 2,
+        "transferred": 1,
+        "closed": 1,
+        "ordered_rate": round(2 / 3, 4),
+        "transferred_rate": round(1 / 3, 4),
+        "closed_rate": round(1 / 3, 4),
+    }
+    # Hanya balasan agent pertama setelah pesan user; staff tidak dihitung
+    delays = summary["response_delay"]
+    assert delays["count"] == 3
+    assert delays["p50"] == 3.0
+    assert delays["mean"] == round((1.5 + 3 + 4) / 3, 3)
+
+
+def test_token_usage_and_cache_latency(analytics):
+    tokens = analytics.summary()["tokens"]
+    assert (tokens["responses"], tokens["input_tokens"], tokens["cached_tokens"], tokens["output_tokens"]) == (2, 2000, 800, 80)
+    assert tokens["cache_hit_rate"] == 0.4
+    assert tokens["latency_ms"]["cache_hit"]["p50"] == 400
+    assert tokens["latency_ms"]["cache_miss"]["p50"] == 900
+
+
+def test_range_filter_and_bucket_validation(analytics):
+    summary = analytics.summary(start_from="2024-05-02T00:00:00", bucket="hour")
+    assert summary["outcomes"]["calls"] == 1
+    assert [b["calls"] for b in summary["volume"]] == [1]
+    with pytest.raises(ValueError):
+        analytics.summary(bucket="month")
+    with pytest.raises(ValueError):
+        analytics.summary(start_from="kemarin")
+
+
+def test_rebuild_replaces_columns(analytics):
+    analytics.rebuild([("s9", [header("2024-06-01T08:00:00"), msg("user", "2024-06-01T08:00:01")])])
+    assert len(analytics) == 1
+    assert analytics.summary()["outcomes"]["calls"] == 1
+
+
+def test_parse_time():
+    assert parse_time("2024-05-01T00:00:00") - parse_time("2024-04-30T00:00:00") == 86400
+    assert math.isnan(parse_time("bukan waktu"))
+    assert math.isnan(parse_time(None))
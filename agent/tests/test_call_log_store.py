@@ -0,0 +1,55 @@
+"""Migrasi call log JSON lama ke CallLogStore (.jsonl)."""
+import json
+
+from call_log_store import CallLogStore
+
+LEGACY_LOG = {
+    "session_id": "legacy-1",
+    "start_time": "2024-05-01T10:00:00",
+    "messages": [
+        {"type": "user", "message": "Halo", "timestamp": "2024-05-01T10:00:01"},
+        {"type": "agent", "message": "Selamat siang", "timestamp": "2024-05-01T10:00:02"},
+        {"type": "user", "message": "Pesan nasi goreng", "timestamp": "2024-05-01T10:00:05"},
+    ],
+    "order_status": "confirmed",
+    "session_stats": {
+        "total_messages": 3,
+        "response_delays": [0.8, 1.4],
+        "keywords_detected": ["pesan"],
+    },
+}
+
+
+def migrated_store(tmp_path):
+    (tmp_path / "legacy-1.json").write_text(json.dumps(LEGACY_LOG), encoding="utf-8")
+    store = CallLogStore(str(tmp_path))
+    assert store.migrate_legacy() == 1
+    return store
+
+
+def test_migrated_messages_get_seq_and_id(tmp_path):
+    store = migrated_store(tmp_path)
+    messages = store.load("legacy-1")["messages"]
+    assert [m["seq"] for m in messages] == [1, 2, 3]
+    assert len({m["id"] for m in messages}) == 3
+
+    # Pesan baru melanjutkan seq, dan after_seq hanya mengembalikan pesan baru
+    written = store.append_message("legacy-1", {"type": "agent", "message": "Baik", "timestamp": "2024-05-01T10:00:07"})
+    assert written[0]["seq"] == 4
+    since = store.load_since("legacy-1", 3)
+    assert [m["message"] for m in since["messages"]] == ["Baik"]
+    store.close()
+
+
+def test_migration_keeps_session_stats(tmp_path):
+    store = migrated_store(tmp_path)
+    view = store.load("legacy-1")
+    assert view["order_status"] == "confirmed"
+    assert view["session_stats"]["response_delays"] == [0.8, 1.4]
+    assert view["session_stats"]["keywords_detected"] == ["pesan"]
+    assert view["session_stats"]["total_messages"] == 3
+
+    store.append("legacy-1", [{"op": "delay", "seconds": 0.5}])
+    assert store.load("legacy-1")["session_stats"]["response_delays"] == [0.8, 1.4, 0.5]
+    assert (tmp_path / "legacy" / "legacy-1.json").exists()
+    store.close()
@@ -0,0 +1,88 @@
+"""Parser token kontrol: total pesanan, payload ORDER_CONFIRMED dan detector streaming."""
+import pytest
+
+from control_tokens import (
+    CLOSE_CALL_CONFIRMED,
+    ORDER_CONFIRMED,
+    ControlTokenStream,
+    find_tokens,
+    parse_amount,
+    parse_order_payload,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Rp. 45.000", 45000.0),
+        ("Rp 45.000", 45000.0),
+        ("45,000", 45000.0),
+        ("45000", 45000.0),
+        ("rp45.000", 45000.0),
+        ("Rp 1.250.000", 1250000.0),
+        ("Rp 45.000,50", 45000.5),
+        ("Rp 45.000.", 45000.0),
+        ("45000 tiba dalam 30 menit", None),
+        ("gratis", None),
+        ("", None),
+    ],
+)
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == expected
+
+
+def test_order_payload_fields():
+    order = parse_order_payload(": Budi Santoso|0812|| Jl. Melati No. 12 |2x Mie Ayam, Es Teh|Rp. 45.000|Tanpa sambal|")
+    assert order == {
+        "customer_name": "Budi Santoso",
+        "customer_phone": "0812",
+        "customer_email": None,
+        "delivery_address": "Jl. Melati No. 12",
+        "order_items": ["2x Mie Ayam", "Es Teh"],
+        "total_amount": 45000.0,
+        "notes": "Tanpa sambal",
+    }
+    assert parse_order_payload("Budi|0812||Jl. Melati") is None
+    assert parse_order_payload("Budi|0812||Jl. Melati|Es Teh|sekitar 45 sampai 50 ribu") is None
+
+
+def test_find_tokens_in_order_without_duplicates():
+    text = f"Baik. {CLOSE_CALL_CONFIRMED} lalu {ORDER_CONFIRMED} lagi {CLOSE_CALL_CONFIRMED}"
+    assert find_tokens(text) == [CLOSE_CALL_CONFIRMED, ORDER_CONFIRMED]
+
+
+def run_stream(message, chunk):
+    stream = ControlTokenStream()
+    shown, events = [], []
+    for i in range(0, len(message), chunk):
+        text, found = stream.feed(message[i : i + chunk])
+        shown.append(text)
+        events.extend(found)
+    text, found = stream.finish()
+    return "".join(shown) + text, events + found
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 7, 1000])
+@pytest.mark.parametrize(
+    "payload, after",
+    [
+        ("Budi|0812||Jl. Melati|2x Mie Ayam|Rp 45.000|Tanpa sambal|", " Terima kasih!"),
+        ("Budi|0812||Jl. Melati|2x Mie Ayam|Rp 45.000|Tanpa sambal.", " Terima kasih!"),
+        ("Budi|0812||Jl. Melati|2x Mie Ayam|Rp 45.000||", " Terima kasih!"),
+        ("Budi|0812||Jl. Melati|2x Mie Ayam|Rp 45.000", " Terima kasih!"),
+    ],
+)
+def test_stream_hides_payload_and_keeps_following_speech(chunk, payload, after):
+    shown, events = run_stream(f"Pesanan dicatat. {ORDER_CONFIRMED}: {payload}{after}", chunk)
+    assert shown.split() == ["Pesanan", "dicatat.", "Terima", "kasih!"]
+    assert [event.token for event in events] == [ORDER_CONFIRMED]
+    order = events[0].payload
+    assert order["customer_name"] == "Budi"
+    assert order["total_amount"] == 45000.0
+
+
+@pytest.mark.parametrize("chunk", [1, 4, 1000])
+def test_stream_emits_simple_tokens_and_releases_partial_matches(chunk):
+    shown, events = run_stream(f"CLOSE sebentar ya. {CLOSE_CALL_CONFIRMED} Sampai jumpa", chunk)
+    assert shown.split() == ["CLOSE", "sebentar", "ya.", "Sampai", "jumpa"]
+    assert [event.token for event in events] == [CLOSE_CALL_CONFIRMED]
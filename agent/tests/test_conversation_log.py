@@ -0,0 +1,133 @@
+"""ConversationLogger terhadap server aiohttp lokal: batch, retry, backpressure dan flush saat stop."""
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import conversation_log
+from conversation_log import ConversationLogger
+
+
+class BatchEndpoint:
+    """``POST /log-conversation/batch``; ``statuses`` di-pop untuk request berikutnya."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.batches = []
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.requests.append(payload)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            self.batches.append(payload)
+        return web.json_response({"success": status == 200}, status=status)
+
+
+def run(endpoint, scenario):
+    async def main():
+        app = web.Application()
+        app.router.add_post("/log-conversation/batch", endpoint.handle)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await scenario(str(server.make_url("")))
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def messages(batches):
+    return [entry["message"] for batch in batches for entry in batch["entries"]]
+
+
+def test_entries_are_batched_and_flushed_on_stop():
+    endpoint = BatchEndpoint()
+
+    async def scenario(url):
+        log = ConversationLogger(url, "s1", batch_size=3, flush_interval=60)
+        log.start()
+        for i in range(7):
+            log.log("user", f"pesan {i}")
+        await asyncio.sleep(0.2)
+        # Dua batch penuh langsung terkirim; sisa satu menunggu flush_interval
+        assert [len(batch["entries"]) for batch in endpoint.batches] == [3, 3]
+        log.log_usage({"input_tokens": 10, "cached_tokens": None})
+        await log.stop()
+        return log
+
+    log = run(endpoint, scenario)
+    assert messages(endpoint.batches) == [f"pesan {i}" for i in range(7)]
+    assert endpoint.batches[-1]["usage"][0]["input_tokens"] == 10
+    assert "cached_tokens" not in endpoint.batches[-1]["usage"][0]
+    assert (log.sent, log.dropped) == (8, 0)
+
+
+def test_flush_interval_sends_partial_batch():
+    endpoint = BatchEndpoint()
+
+    async def scenario(url):
+        log = ConversationLogger(url, "s1", batch_size=20, flush_interval=0.05)
+        log.start()
+        log.log("agent", "halo", response_delay=0.81234)
+        await asyncio.sleep(0.3)
+        sent = list(endpoint.batches)
+        await log.stop()
+        return sent
+
+    sent = run(endpoint, scenario)
+    assert messages(sent) == ["halo"]
+    assert sent[0]["entries"][0]["response_delay"] == 0.812
+
+
+def test_server_errors_are_retried_with_the_same_ids(monkeypatch):
+    monkeypatch.setattr(conversation_log, "RETRY_BACKOFF", 0.01)
+    endpoint = BatchEndpoint(statuses=[503, 500])
+
+    async def scenario(url):
+        log = ConversationLogger(url, "s1", flush_interval=0.01)
+        log.start()
+        log.log("user", "pesan")
+        await log.flush()
+        await log.stop()
+        return log
+
+    log = run(endpoint, scenario)
+    assert len(endpoint.requests) == 3
+    assert len({request["entries"][0]["id"] for request in endpoint.requests}) == 1
+    assert (log.sent, log.dropped) == (1, 0)
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(conversation_log, "RETRY_BACKOFF", 0.01)
+    endpoint = BatchEndpoint(statuses=[422])
+
+    async def scenario(url):
+        log = ConversationLogger(url, "s1", flush_interval=0.01)
+        log.start()
+        log.log("user", "pesan")
+        await log.stop()
+        return log
+
+    log = run(endpoint, scenario)
+    assert len(endpoint.requests) == 1
+    assert (log.sent, log.dropped) == (0, 1)
+
+
+def test_full_queue_drops_oldest_entries():
+    endpoint = BatchEndpoint()
+
+    async def scenario(url):
+        # Belum start: log() tidak pernah menunggu, antrian dibatasi max_pending
+        log = ConversationLogger(url, "s1", max_pending=3)
+        for i in range(5):
+            log.log("user", f"pesan {i}")
+        log.start()
+        await log.stop()
+        return log
+
+    log = run(endpoint, scenario)
+    assert messages(endpoint.batches) == ["pesan 2", "pesan 3", "pesan 4"]
+    assert (log.sent, log.dropped) == (3, 2)
@@ -0,0 +1,92 @@
+"""Parser menu dan MenuIndex: pola baris, format harga, varian, kategori dan pencarian."""
+import pytest
+
+from menu_index import PRICE_RE, MenuIndex, parse_menu, parse_price, split_variants
+
+MENU = """https://resto.example/menu
+MAKANAN
+• Mie Ayam: IDR 29,000
+Nasi Uduk Rp. 11.000
+Fish & Chips (Nasi/French Fries) Rp 45.000
+Es Jeruk Small Rp 10.000 / Large Rp 15.000
+Sate Ayam
+Tusuk ayam bakar dengan bumbu kacang
+dan lontong Rp. 38.000
+Minuman
+Es Teh 8k
+Kopi Susu Rp15rb
+9/2/25, 8:54 PM
+"""
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Rp 25.000", 25000),
+        ("Rp. 7.000,-", 7000),
+        ("IDR 32,000", 32000),
+        ("Rp25rb", 25000),
+        ("25k", 25000),
+        ("2,5 ribu", 2500),
+        ("Rp 15", 15),
+    ],
+)
+def test_parse_price(text, expected):
+    assert parse_price(PRICE_RE.search(text)) == expected
+
+
+def test_split_variants():
+    assert split_variants("Fish & Chips (Nasi/French Fries)") == ("Fish & Chips", ["Nasi", "French Fries"])
+    assert split_variants("Teh Panas/Dingin") == ("Teh", ["Panas", "Dingin"])
+    assert split_variants("Nasi Goreng (Spesial)") == ("Nasi Goreng (Spesial)", [])
+
+
+def test_parse_single_line_and_multi_line_items():
+    items = {item["name"]: item for item in parse_menu(MENU)}
+    assert [(name, item["category"], item["price"]) for name, item in items.items()] == [
+        ("Mie Ayam", "MAKANAN", 29000),
+        ("Nasi Uduk", "MAKANAN", 11000),
+        ("Fish & Chips", "MAKANAN", 45000),
+        ("Es Jeruk Small", "MAKANAN", 10000),
+        ("Sate Ayam", "MAKANAN", 38000),
+        ("Es Teh", "Minuman", 8000),
+        ("Kopi Susu", "Minuman", 15000),
+    ]
+    # Nama di satu baris, deskripsi dan harga di baris berikutnya
+    assert items["Sate Ayam"]["description"] == "Tusuk ayam bakar dengan bumbu kacang dan lontong"
+    assert items["Mie Ayam"]["price_text"] == "IDR 29,000"
+    assert [v["name"] for v in items["Fish & Chips"]["variants"]] == ["Nasi", "French Fries"]
+    # Beberapa harga dalam satu baris: satu varian per harga, harga item = termurah
+    assert [v["price"] for v in items["Es Jeruk Small"]["variants"]] == [10000, 15000]
+    assert items["Es Jeruk Small"]["variants"][1]["name"] == "Large"
+
+
+def test_index_lookup_and_categories():
+    index = MenuIndex()
+    index.rebuild(MENU, version=3)
+    assert index.version == 3
+    assert index.categories() == [{"name": "MAKANAN", "item_count": 5}, {"name": "Minuman", "item_count": 2}]
+    item = index.items[0]
+    assert index.get(item["id"]) is item
+    assert index.get("tidak-ada") is None
+
+
+def test_search_exact_fuzzy_and_category_filter():
+    index = MenuIndex()
+    index.rebuild(MENU)
+    exact = index.search("mie ayam")
+    assert exact[0]["name"] == "Mie Ayam" and exact[0]["score"] == 2.0
+    assert [item["name"] for item in index.search("ayam")] == ["Mie Ayam", "Sate Ayam"]
+    # Salah ketik dan awalan kata
+    assert index.search("miee")[0]["name"] == "Mie Ayam"
+    assert index.search("kop")[0]["name"] == "Kopi Susu"
+    assert [item["name"] for item in index.search("es", category="minuman")] == ["Es Teh"]
+    assert index.search("ayam", limit=1)[0]["name"] == "Mie Ayam"
+    assert index.search("  ") == []
+
+
+def test_duplicate_names_get_unique_ids():
+    index = MenuIndex()
+    index.rebuild("Es Teh Rp 5.000\nEs Teh Rp 6.000")
+    ids = [item["id"] for item in index.items]
+    assert len(set(ids)) == 2 and ids[1] == f"{ids[0]}-2"
@@ -0,0 +1,161 @@
+"""SmtpPool dan NotificationOutbox terhadap server SMTP lokal (aiosmtpd)."""
+import asyncio
+import socket
+import time
+
+import pytest
+
+from notification_outbox import FAILED, SENT, NotificationOutbox, SmtpPool, email_sender
+from order_store import OrderStore
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class RecordingHandler:
+    """Catat setiap DATA (session, waktu); ``responses`` di-pop untuk DATA berikutnya."""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.attempts = []
+        self.delivered = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts.append((id(session), time.monotonic()))
+        if self.responses:
+            return self.responses.pop(0)
+        self.delivered.append((id(session), envelope.rcpt_tos))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(responses=()):
+        handler = RecordingHandler(responses)
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        servers.append(controller)
+        return handler, SmtpPool("127.0.0.1", controller.port, starttls=False, size=1, timeout=5)
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def make_outbox(tmp_path, pool, **kwargs):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    senders = {"email": email_sender(pool, "warteg@example.com")}
+    return store, NotificationOutbox(store, senders, poll_interval=0.05, **kwargs)
+
+
+def enqueue(store, recipient="budi@example.com"):
+    with store.transaction() as conn:
+        return NotificationOutbox.enqueue(conn, "email", recipient, "Pesanan diterima", subject="Konfirmasi")
+
+
+async def wait_for_status(outbox, notification_id, statuses, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        notification = outbox.get(notification_id)
+        if notification["status"] in statuses:
+            return notification
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"notification {notification_id} stuck in {outbox.get(notification_id)['status']}")
+
+
+def test_pool_reuses_one_connection_for_several_messages(smtp_server, tmp_path):
+    handler, pool = smtp_server()
+    _, outbox = make_outbox(tmp_path, pool)
+
+    async def run():
+        outbox.start()
+        ids = [enqueue(outbox.store, f"pelanggan{i}@example.com") for i in range(5)]
+        outbox.wake()
+        results = [await wait_for_status(outbox, i, {SENT, FAILED}) for i in ids]
+        await outbox.stop()
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.close()
+    assert [r["status"] for r in results] == [SENT] * 5
+    assert len(handler.delivered) == 5
+    # Semua email lewat satu session SMTP (satu connect/EHLO)
+    assert len({session for session, _ in handler.delivered}) == 1
+
+
+def test_temporary_failure_is_retried_with_backoff(smtp_server, tmp_path):
+    handler, pool = smtp_server(responses=["451 Coba lagi nanti", "451 Coba lagi nanti"])
+    _, outbox = make_outbox(tmp_path, pool, base_delay=0.2, max_delay=1.0)
+
+    async def run():
+        outbox.start()
+        notification_id = enqueue(outbox.store)
+        outbox.wake()
+        result = await wait_for_status(outbox, notification_id, {SENT, FAILED})
+        await outbox.stop()
+        return result
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        pool.close()
+    assert result["status"] == SENT
+    assert result["attempts"] == 3
+    assert len(handler.attempts) == 3
+    gaps = [b[1] - a[1] for a, b in zip(handler.attempts, handler.attempts[1:])]
+    # Backoff eksponensial dengan jitter 0.5-1.0: >= 0.1 s lalu >= 0.2 s
+    assert gaps[0] >= 0.2 * 0.5
+    assert gaps[1] >= 0.4 * 0.5
+
+
+def test_permanent_failure_is_not_retried(smtp_server, tmp_path):
+    handler, pool = smtp_server(responses=["550 Mailbox tidak ada"])
+    _, outbox = make_outbox(tmp_path, pool, base_delay=0.05)
+
+    async def run():
+        outbox.start()
+        notification_id = enqueue(outbox.store)
+        outbox.wake()
+        result = await wait_for_status(outbox, notification_id, {SENT, FAILED})
+        await asyncio.sleep(0.2)
+        await outbox.stop()
+        return result
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        pool.close()
+    assert result["status"] == FAILED
+    assert result["attempts"] == 1
+    assert len(handler.attempts) == 1
+    assert "550" in result["last_error"]
+
+
+def test_gives_up_after_max_attempts(smtp_server, tmp_path):
+    handler, pool = smtp_server(responses=["451 Sibuk"] * 10)
+    _, outbox = make_outbox(tmp_path, pool, base_delay=0.02, max_delay=0.05, max_attempts=3)
+
+    async def run():
+        outbox.start()
+        notification_id = enqueue(outbox.store)
+        outbox.wake()
+        result = await wait_for_status(outbox, notification_id, {SENT, FAILED})
+        await outbox.stop()
+        return result
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        pool.close()
+    assert result["status"] == FAILED
+    assert result["attempts"] == 3
+    assert len(handler.attempts) == 3
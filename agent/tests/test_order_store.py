@@ -0,0 +1,42 @@
+"""Impor pesanan dari log panggilan ke OrderStore."""
+import pytest
+
+from call_log_store import CallLogStore
+from order_store import OrderStore
+
+DETAILS = {
+    "customer_name": "Budi",
+    "customer_phone": "0812",
+    "delivery_address": "Jl. Melati",
+    "order_items": ["2x Mie Ayam"],
+    "total_amount": 45000,
+}
+
+
+@pytest.fixture
+def stores(tmp_path):
+    calls = CallLogStore(str(tmp_path / "call_logs"))
+    orders = OrderStore(str(tmp_path / "orders.db"))
+    yield calls, orders
+    calls.close()
+    orders.close()
+
+
+@pytest.mark.parametrize(
+    "fields, expected",
+    [
+        # order_status lama "completed" = panggilan ditutup, bukan pesanan selesai
+        ({"order_status": "completed"}, "confirmed"),
+        ({"order_status": "transferred"}, "confirmed"),
+        ({"order_status": "preparing"}, "preparing"),
+        ({"order_status": "cancelled"}, "cancelled"),
+        ({"order_status": "completed", "kitchen_status": "delivering"}, "delivering"),
+        ({"order_status": "confirmed", "kitchen_status": "completed"}, "completed"),
+    ],
+)
+def test_import_maps_legacy_order_status(stores, fields, expected):
+    calls, orders = stores
+    calls.set_fields("s1", {"order_details": DETAILS, **fields}, start_time="2024-05-01T10:00:00")
+    assert orders.import_call_logs(calls) == 1
+    assert orders.get_by_session("s1")["status"] == expected
+    assert orders.import_call_logs(calls) == 0
@@ -0,0 +1,68 @@
+"""BM25Index: tokenisasi, pemecahan chunk, ranking dan update inkremental."""
+from retrieval import BM25Index, chunk_text, stem, tokenize
+
+MENU = """MAKANAN
+Sate Ayam
+Sate ayam bumbu kacang Rp 38.000
+
+Mie Ayam Rp 29.000
+Bakso Sapi Rp 25.000
+
+MINUMAN
+Es Teh Manis Rp 8.000
+Jus Alpukat Rp 18.000
+"""
+
+
+def test_tokenize_drops_stopwords_and_particles():
+    assert stem("ayamnya") == "ayam"
+    assert stem("adakah") == "ada"
+    assert stem("mu") == "mu"  # sisa kata terlalu pendek
+    assert tokenize("Apakah ada sate ayamnya, kak?") == ["sate", "ayam"]
+
+
+def test_chunks_break_on_blank_lines_and_repeat_last_line():
+    assert chunk_text(MENU, max_chars=60) == [
+        "MAKANAN\nSate Ayam\nSate ayam bumbu kacang Rp 38.000",
+        "Mie Ayam Rp 29.000\nBakso Sapi Rp 25.000",
+        "MINUMAN\nEs Teh Manis Rp 8.000\nJus Alpukat Rp 18.000",
+    ]
+    # Tanpa baris kosong: nama item di akhir chunk diulang bersama deskripsi+harganya
+    text = "Deskripsi panjang item pertama yang lengkap\nSate Ayam\nTusuk ayam bakar dengan bumbu kacang Rp 38.000"
+    assert chunk_text(text, max_chars=60) == [
+        "Deskripsi panjang item pertama yang lengkap\nSate Ayam",
+        "Sate Ayam\nTusuk ayam bakar dengan bumbu kacang Rp 38.000",
+    ]
+
+
+def test_search_ranks_matching_chunks():
+    index = BM25Index(max_chunk_chars=60)
+    assert index.update(MENU, version=1) == {"chunks": 3, "added": 3, "removed": 0}
+
+    results = index.search("berapa harga satenya?")
+    assert [result["position"] for result in results] == [0]
+    assert results[0]["text"].startswith("MAKANAN")
+    assert index.get(results[0]["id"]) == results[0]["text"]
+
+    # "ayam" ada di dua chunk; chunk pertama menyebutnya dua kali
+    assert [result["position"] for result in index.search("ayam")] == [0, 1]
+    assert [result["position"] for result in index.search("ayam", k=1)] == [0]
+    assert index.search("rendang") == []
+    assert index.search("yang dan") == []
+
+
+def test_update_reindexes_only_changed_chunks():
+    index = BM25Index(max_chunk_chars=60)
+    index.update(MENU, version=1)
+    unchanged = {result["id"] for result in index.search("sate bakso", k=5)}
+
+    revised = MENU.replace("Jus Alpukat Rp 18.000", "Jus Mangga Rp 20.000")
+    assert index.update(revised, version=2) == {"chunks": 3, "added": 1, "removed": 1}
+    assert (len(index), index.version) == (3, 2)
+    assert index.search("alpukat") == []
+    assert [result["position"] for result in index.search("mangga")] == [2]
+    assert {result["id"] for result in index.search("sate bakso", k=5)} == unchanged
+
+    assert index.update(revised, version=3) == {"chunks": 3, "added": 0, "removed": 0}
+    assert index.update("", version=4) == {"chunks": 0, "added": 0, "removed": 3}
+    assert index.search("sate") == []
@@ -0,0 +1,96 @@
+"""TranscriptIndex: query kata/awalan/frasa, edit, snapshot dan replay setelah watermark."""
+import pytest
+
+from call_log_archive import CallLogArchive
+from call_log_store import CallLogStore
+from session_index import SessionIndex
+from transcript_search import TranscriptIndex, parse_query
+
+
+def message(kind, text, timestamp="2024-05-01T10:00:00"):
+    return {"type": kind, "message": text, "timestamp": timestamp}
+
+
+@pytest.fixture
+def setup(tmp_path):
+    store = CallLogStore(str(tmp_path / "call_logs"), fsync_interval=0)
+    sessions = SessionIndex()
+    transcripts = TranscriptIndex()
+    store.add_listener(transcripts.apply)
+    store.add_listener(sessions.apply)
+    archive = CallLogArchive(str(tmp_path / "call_logs" / "archive"))
+    yield store, sessions, transcripts, archive
+    store.close()
+
+
+def add(store, session_id, *messages):
+    for i, (kind, text) in enumerate(messages):
+        store.append_message(session_id, message(kind, text, f"2024-05-01T10:00:0{i}"), start_time="2024-05-01T10:00:00")
+
+
+def hits(transcripts, query, **filters):
+    return [(hit["session_id"], hit["seq"]) for hit in transcripts.search(query, **filters)["results"]]
+
+
+def test_parse_query_clauses():
+    assert parse_query('sate* "jalan melati" 0812-3456') == [
+        ("prefix", "sate"),
+        ("phrase", ["jalan", "melati"]),
+        ("term", "08123456"),
+    ]
+
+
+def test_terms_prefixes_phrases_and_numbers(setup):
+    store, _, transcripts, _ = setup
+    add(store, "s1", ("user", "Saya mau sate ayam dua porsi"), ("agent", "Dikirim ke Jalan Melati nomor 12"))
+    add(store, "s2", ("user", "Melati jalan kaki saja, total 25.000"), ("user", "nomor saya 0812-3456-7890"))
+
+    assert hits(transcripts, "sate") == [("s1", 1)]
+    assert hits(transcripts, "sat*") == [("s1", 1)]
+    assert sorted(hits(transcripts, "melati")) == [("s1", 2), ("s2", 1)]
+    assert hits(transcripts, '"jalan melati"') == [("s1", 2)]
+    assert hits(transcripts, "25000") == [("s2", 1)]
+    assert hits(transcripts, "081234567890") == [("s2", 2)]
+    assert hits(transcripts, "melati", session_id="s2") == [("s2", 1)]
+    assert hits(transcripts, "melati", participant_type="agent") == [("s1", 2)]
+
+    result = transcripts.search('"jalan melati"')["results"][0]
+    start, end = result["highlights"][0]
+    assert result["snippet"][start:end] == "Jalan"
+
+
+def test_edit_replaces_indexed_text(setup):
+    store, _, transcripts, _ = setup
+    add(store, "s1", ("user", "pesan soto betawi"))
+    store.append("s1", [{"op": "edit", "position": 0, "message": "pesan rawon", "edited_at": "2024-05-01T10:01:00"}])
+    assert hits(transcripts, "soto") == []
+    assert hits(transcripts, "rawon") == [("s1", 1)]
+
+
+def test_snapshot_replays_only_records_after_watermark(setup, tmp_path):
+    store, sessions, transcripts, archive = setup
+    path = str(tmp_path / "index.json.gz")
+    add(store, "s1", ("user", "pesan sate"))
+    add(store, "s2", ("user", "pesan bakso"))
+    assert transcripts.save(path)
+    assert not transcripts.save(path)  # tidak ada perubahan
+
+    # Record yang ditulis setelah snapshot, dan session yang hilang dari log
+    add(store, "s1", ("agent", "sate segera dikirim"))
+    store.remove("s2")
+    sessions.rebuild(store)
+
+    restored = TranscriptIndex()
+    assert restored.load(path)
+    assert sorted(hits(restored, "sate")) == [("s1", 1)]
+    assert restored.sync(sessions, store, archive) == {"replayed": 1, "removed": 1}
+    assert sorted(hits(restored, "sate")) == [("s1", 1), ("s1", 2)]
+    assert hits(restored, "bakso") == []
+    # Sudah sinkron: tidak ada yang diputar ulang
+    assert restored.sync(sessions, store, archive) == {"replayed": 0, "removed": 0}
+
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "index.json.gz"
+    path.write_bytes(b"not gzip")
+    assert not TranscriptIndex().load(str(path))
@@ -0,0 +1,427 @@
+"""Pencarian full-text atas transcript percakapan.
+
+Setiap pesan yang ditulis ke ``CallLogStore`` (log_conversation,
+send-chat-message, staff-takeover, ...) masuk ke inverted index posisional
+lewat listener store, sehingga ``GET /search`` bisa mencari kata, awalan
+(``sate*``) dan frasa (``"jalan melati"``) tanpa membuka file log.
+
+Angka yang dipisah ``-`` atau ``.`` disatukan menjadi satu token, jadi
+"0812-3456-7890" ditemukan dengan "081234567890" dan "25.000" dengan
+"25000".
+
+Index disimpan sebagai snapshot gzip JSON beserta watermark per session
+(jumlah record yang sudah di-index). Saat start hanya record setelah
+watermark yang diputar ulang.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+from itertools import islice
+from typing import Any
+
+logger = logging.getLogger("transcript-search")
+
+SNAPSHOT_FORMAT = 1
+TOKEN_RE = re.compile(r"\d+(?:[.\-]\d+)*|[^\W_]+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+SNIPPET_CHARS = 160
+MAX_PREFIX_TERMS = 200
+
+
+def _token(raw: str) -> str:
+    return raw.lower().replace("-", "").replace(".", "")
+
+
+def tokenize(text: str) -> list[str]:
+    return [_token(match.group()) for match in TOKEN_RE.finditer(text or "")]
+
+
+def parse_query(query: str) -> list[tuple[str, Any]]:
+    """Pecah query menjadi klausa ("term", t), ("prefix", p) atau ("phrase", [t...])."""
+    clauses: list[tuple[str, Any]] = []
+    for match in QUERY_RE.finditer(query or ""):
+        phrase, word = match.groups()
+        if phrase is not None:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                clauses.append(("phrase", tokens))
+            elif tokens:
+                clauses.append(("term", tokens[0]))
+        elif word.endswith("*") and tokenize(word[:-1]):
+            tokens = tokenize(word[:-1])
+            clauses.extend(("term", token) for token in tokens[:-1])
+            clauses.append(("prefix", tokens[-1]))
+        else:
+            clauses.extend(("term", token) for token in tokenize(word))
+    return clauses
+
+
+class _Doc:
+    __slots__ = ("position", "session_id", "text", "timestamp", "type")
+
+    def __init__(self, session_id: str, position: int, type: str, timestamp: str, text: str):
+        self.session_id = session_id
+        self.position = position
+        self.type = type
+        self.timestamp = timestamp
+        self.text = text
+
+
+class TranscriptIndex:
+    """Inverted index posisional: term -> {doc_id: [posisi token]}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: dict[int, _Doc] = {}
+        self._next_doc = 0
+        # session_id -> {posisi pesan: doc_id}
+        self._session_docs: dict[str, dict[int, int]] = {}
+        self._postings: dict[str, dict[int, list[int]]] = {}
+        self._vocab: list[str] = []
+        # session_id -> jumlah record yang sudah diterapkan
+        self._watermarks: dict[str, int] = {}
+        self._dirty = False
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ---------------------------------------------------------------- updates
+
+    def apply(self, session_id: str, records: Iterable[dict[str, Any]]) -> None:
+        """Listener ``CallLogStore``."""
+        with self._lock:
+            for record in records:
+                self._apply_record(session_id, record)
+            self._dirty = True
+
+    def _apply_record(self, session_id: str, record: dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "header":
+            self._drop_session(session_id)
+            self._session_docs[session_id] = {}
+            self._watermarks[session_id] = 1
+            return
+        if session_id not in self._watermarks:
+            return
+        self._watermarks[session_id] += 1
+        if op == "message":
+            positions = self._session_docs[session_id]
+            self._add_doc(
+                _Doc(session_id, len(positions), record.get("type", ""), record.get("timestamp", ""), record.get("message") or "")
+            )
+        elif op == "edit":
+            doc_id = self._session_docs[session_id].get(record["position"])
+            if doc_id is not None:
+                doc = self._docs[doc_id]
+                self._remove_doc(doc_id)
+                doc.text = record["message"]
+                self._add_doc(doc, doc_id)
+
+    def _add_doc(self, doc: _Doc, doc_id: int | None = None) -> None:
+        if doc_id is None:
+            doc_id = self._next_doc
+            self._next_doc += 1
+        self._docs[doc_id] = doc
+        self._session_docs[doc.session_id][doc.position] = doc_id
+        for position, term in enumerate(tokenize(doc.text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocab, term)
+            postings.setdefault(doc_id, []).append(position)
+
+    def _remove_doc(self, doc_id: int) -> None:
+        doc = self._docs.pop(doc_id)
+        self._session_docs.get(doc.session_id, {}).pop(doc.position, None)
+        for term in set(tokenize(doc.text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                i = bisect_left(self._vocab, term)
+                if i < len(self._vocab) and self._vocab[i] == term:
+                    del self._vocab[i]
+
+    def _drop_session(self, session_id: str) -> None:
+        for doc_id in list(self._session_docs.pop(session_id, {}).values()):
+            self._remove_doc(doc_id)
+        self._watermarks.pop(session_id, None)
+
+    def sync(self, index, store, archive) -> dict[str, int]:
+        """Samakan index dengan ``SessionIndex`` setelah snapshot dimuat.
+
+        Session aktif hanya memutar ulang record setelah watermark; session
+        arsip (record-nya sudah dipadatkan) di-index ulang penuh bila
+        watermark-nya tidak cocok.
+        """
+        replayed = removed = 0
+        known: set[str] = set()
+        for summary in index.all():
+            session_id = summary.session_id
+            known.add(session_id)
+            with self._lock:
+                watermark = self._watermarks.get(session_id, 0)
+            if watermark == summary.version:
+                continue
+            if summary.archived or watermark > summary.version:
+                with self._lock:
+                    self._drop_session(session_id)
+                watermark = 0
+            source = archive if summary.archived else store
+            self.apply(session_id, islice(source.iter_records(session_id), watermark, None))
+            if summary.archived:
+                with self._lock:
+                    # Arsip berisi record yang dipadatkan; simpan versi asli session
+                    if session_id in self._watermarks:
+                        self._watermarks[session_id] = summary.version
+            replayed += 1
+        with self._lock:
+            for session_id in [sid for sid in self._watermarks if sid not in known]:
+                self._drop_session(session_id)
+                removed += 1
+            if removed:
+                self._dirty = True
+        return {"replayed": replayed, "removed": removed}
+
+    # ---------------------------------------------------------------- queries
+
+    def _matches(self, clause: tuple[str, Any]) -> tuple[dict[int, int], set[str]]:
+        """{doc_id: jumlah kecocokan} dan term yang perlu di-highlight."""
+        kind, value = clause
+        if kind == "term":
+            postings = self._postings.get(value, {})
+            return {doc_id: len(positions) for doc_id, positions in postings.items()}, {value}
+        if kind == "prefix":
+            counts: dict[int, int] = {}
+            terms: set[str] = set()
+            i = bisect_left(self._vocab, value)
+            while i < len(self._vocab) and self._vocab[i].startswith(value) and len(terms) < MAX_PREFIX_TERMS:
+                term = self._vocab[i]
+                terms.add(term)
+                for doc_id, positions in self._postings[term].items():
+                    counts[doc_id] = counts.get(doc_id, 0) + len(positions)
+                i += 1
+            return counts, terms
+        # Frasa: posisi token ke-i harus tepat posisi awal + i
+        all_postings = [self._postings.get(token) for token in value]
+        if not all(all_postings):
+            return {}, set(value)
+        smallest = min(all_postings, key=len)
+        counts = {}
+        for doc_id in smallest:
+            if not all(doc_id in postings for postings in all_postings):
+                continue
+            following = [set(postings[doc_id]) for postings in all_postings[1:]]
+            hits = sum(
+                1
+                for start in all_postings[0][doc_id]
+                if all(start + offset in positions for offset, positions in enumerate(following, 1))
+            )
+            if hits:
+                counts[doc_id] = hits
+        return counts, set(value)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session_id: str | None = None,
+        participant_type: str | None = None,
+    ) -> dict[str, Any]:
+        """Pesan yang cocok dengan semua klausa query, skor tertinggi lalu terbaru."""
+        clauses = parse_query(query)
+        if not clauses:
+            return {"total": 0, "results": []}
+        with self._lock:
+            scores: dict[int, int] | None = None
+            highlight: set[str] = set()
+            prefixes: list[str] = []
+            for clause in clauses:
+                counts, terms = self._matches(clause)
+                highlight |= terms
+                if clause[0] == "prefix":
+                    prefixes.append(clause[1])
+                if scores is None:
+                    scores = counts
+                else:
+                    scores = {doc_id: score + counts[doc_id] for doc_id, score in scores.items() if doc_id in counts}
+                if not scores:
+                    break
+            hits = [
+                (score, self._docs[doc_id])
+                for doc_id, score in (scores or {}).items()
+                if (session_id is None or self._docs[doc_id].session_id == session_id)
+                and (participant_type is None or self._docs[doc_id].type == participant_type)
+            ]
+        hits.sort(key=lambda hit: (hit[0], hit[1].timestamp), reverse=True)
+        results = []
+        for score, doc in hits[offset : offset + limit]:
+            snippet, spans = make_snippet(doc.text, highlight, prefixes)
+            results.append(
+                {
+                    "session_id": doc.session_id,
+                    "position": doc.position,
+                    "seq": doc.position + 1,
+                    "type": doc.type,
+                    "timestamp": doc.timestamp,
+                    "score": score,
+                    "snippet": snippet,
+                    "highlights": spans,
+                }
+            )
+        return {"total": len(hits), "results": results}
+
+    # ------------------------------------------------------------ persistence
+
+    def load(self, path: str) -> bool:
+        """Muat snapshot; False jika tidak ada atau tidak bisa dibaca."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError(f"format snapshot {data.get('format')} tidak dikenal")
+        except (OSError, EOFError, ValueError, AttributeError) as e:
+            # Gzip rusak/terpotong, JSON tidak valid atau bukan objek
+            logger.warning(f"Ignoring transcript index snapshot {path}: {e}")
+            return False
+        docs = {}
+        session_docs: dict[str, dict[int, int]] = {sid: {} for sid in data["watermarks"]}
+        for doc_id, session_id, position, kind, timestamp, text in data["docs"]:
+            docs[doc_id] = _Doc(session_id, position, kind, timestamp, text)
+            session_docs.setdefault(session_id, {})[position] = doc_id
+        postings: dict[str, dict[int, list[int]]] = {}
+        for term, flat in data["postings"].items():
+            # Format datar: doc_id, n, posisi_1..posisi_n, doc_id, n, ...
+            entries: dict[int, list[int]] = {}
+            i = 0
+            while i < len(flat):
+                n = flat[i + 1]
+                entries[flat[i]] = flat[i + 2 : i + 2 + n]
+                i += 2 + n
+            postings[term] = entries
+        with self._lock:
+            self._docs = docs
+            self._session_docs = session_docs
+            self._postings = postings
+            self._vocab = sorted(postings)
+            self._watermarks = data["watermarks"]
+            self._next_doc = data["next_doc"]
+            self._dirty = False
+        return True
+
+    def save(self, path: str) -> bool:
+        """Tulis snapshot secara atomik jika ada perubahan sejak simpan terakhir."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            postings = {}
+            for term, entries in self._postings.items():
+                flat: list[int] = []
+                for doc_id, positions in entries.items():
+                    flat.append(doc_id)
+                    flat.append(len(positions))
+                    flat.extend(positions)
+                postings[term] = flat
+            payload = json.dumps(
+                {
+                    "format": SNAPSHOT_FORMAT,
+                    "next_doc": self._next_doc,
+                    "watermarks": dict(self._watermarks),
+                    "docs": [
+                        [doc_id, doc.session_id, doc.position, doc.type, doc.timestamp, doc.text]
+                        for doc_id, doc in self._docs.items()
+                    ],
+                    "postings": postings,
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+            self._dirty = False
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return True
+
+    def start_autosave(self, path: str, interval: float) -> None:
+        self._task = asyncio.create_task(self._autosave(path, interval))
+
+    async def _autosave(self, path: str, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.save, path)
+            except Exception:
+                logger.exception("Failed to save transcript index")
+
+    async def stop_autosave(self, path: str) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.save(path)
+
+
+def make_snippet(text: str, terms: set[str], prefixes: list[str]) -> tuple[str, list[list[int]]]:
+    """Potongan teks di sekitar kecocokan pertama plus offset highlight [awal, akhir)."""
+    spans = [
+        (match.start(), match.end())
+        for match in TOKEN_RE.finditer(text)
+        if _token(match.group()) in terms or any(_token(match.group()).startswith(p) for p in prefixes)
+    ]
+    if len(text) <= SNIPPET_CHARS:
+        start, end = 0, len(text)
+    else:
+        first = spans[0][0] if spans else 0
+        start = max(0, min(first - SNIPPET_CHARS // 3, len(text) - SNIPPET_CHARS))
+        end = start + SNIPPET_CHARS
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    shift = len(prefix) - start
+    highlights = [[s + shift, e + shift] for s, e in spans if s >= start and e <= end]
+    return prefix + text[start:end] + suffix, highlights
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from call_log_archive import ARCHIVE_DIR, CallLogArchive
+    from call_log_store import CallLogStore
+    from session_index import SessionIndex
+
+    parser = argparse.ArgumentParser(description="Cari transcript di call_logs/")
+    parser.add_argument("query")
+    parser.add_argument("--call-logs", default="call_logs")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    store = CallLogStore(args.call_logs, fsync_interval=0)
+    archive = CallLogArchive(os.path.join(args.call_logs, ARCHIVE_DIR))
+    archive.load()
+    sessions = SessionIndex()
+    sessions.rebuild(store)
+    sessions.load_archived(archive.summaries())
+    transcripts = TranscriptIndex()
+    began = time.perf_counter()
+    transcripts.sync(sessions, store, archive)
+    indexed = time.perf_counter()
+    result = transcripts.search(args.query, limit=args.limit)
+    for hit in result["results"]:
+        print(f"{hit['session_id']}#{hit['seq']} [{hit['type']}] {hit['timestamp']}: {hit['snippet']}")
+    print(f"{result['total']} hits, {len(transcripts)} messages, index {indexed - began:.2f}s, query {(time.perf_counter() - indexed) * 1000:.2f}ms")
+    store.close()
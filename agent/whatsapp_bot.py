@@ -2,12 +2,15 @@ import os
 import json
 import logging
 import asyncio
+import time
 from datetime import datetime
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
 import requests
 import openai
 from dotenv import load_dotenv
+from prompts import WHATSAPP_POLICY, assemble, build_prefix, usage_from_chat
+from telemetry import WHATSAPP_REPLY_SECONDS, instrument
 
 load_dotenv(".env.local")
 
@@ -16,12 +19,16 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("whatsapp-bot")
 
 app = FastAPI()
+# Latency handler HTTP dan GET /metrics (Prometheus)
+instrument(app, "whatsapp_bot")
 
 # WhatsApp Configuration
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN", "")
 WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID", "")
 VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "your_verify_token")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# pdf_api (teks menu, retrieval, pesanan, call log); port 8001 hanya config_api
+PDF_API_URL = os.getenv("PDF_API_URL", "http://127.0.0.1:8002").rstrip("/")
 
 # OpenAI Client
 openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
@@ -31,59 +38,98 @@ class WhatsAppMessage(BaseModel):
     message_text: str
     message_id: str
 
-async def get_pdf_context():
-    """Ambil konteks PDF dari backend"""
+# Salinan lokal teks PDF; divalidasi ulang dengan ETag (304 jika tidak berubah).
+# prefix = system prompt statis (kebijakan + snapshot menu), dibangun ulang hanya saat menu berubah
+pdf_text_cache = {"etag": None, "text": "", "version": None, "prefix": build_prefix("whatsapp", WHATSAPP_POLICY)}
+# Jumlah chunk menu yang diambil per pesan jika menu tidak muat di prefix
+RETRIEVE_TOP_K = int(os.getenv("RETRIEVE_TOP_K", "6"))
+# Panjang maksimal menu di system prompt; menu yang lebih panjang dipotong di batas baris
+WHATSAPP_MENU_CHARS = int(os.getenv("WHATSAPP_MENU_CHARS", "6000"))
+MENU_HEADING = "Sumber data dari PDF (MENU MAKANAN):"
+
+async def get_menu_text():
+    """Ambil teks PDF aktif dari backend"""
     try:
-        response = requests.get("http://127.0.0.1:8001/pdf-text")
+        headers = {"If-None-Match": pdf_text_cache["etag"]} if pdf_text_cache["etag"] else {}
+        # requests blocking: jalankan di thread agar event loop webhook tidak tertahan
+        response = await asyncio.to_thread(requests.get, f"{PDF_API_URL}/pdf-text", headers=headers, timeout=10)
         if response.status_code == 200:
             pdf_data = response.json()
-            return pdf_data.get("text", "")[:10000]  # Ambil 10k karakter
+            pdf_text_cache["etag"] = response.headers.get("ETag")
+            pdf_text_cache["text"] = pdf_data.get("text", "")
+            pdf_text_cache["version"] = pdf_data.get("version")
+            pdf_text_cache["prefix"] = build_prefix(
+                "whatsapp",
+                WHATSAPP_POLICY,
+                pdf_text_cache["text"],
+                menu_version=pdf_text_cache["version"],
+                menu_chars=WHATSAPP_MENU_CHARS,
+                menu_heading=MENU_HEADING,
+            )
+        if response.status_code in (200, 304):
+            return pdf_text_cache["text"]
     except Exception as e:
+        logger.error(f"Error fetching PDF text: {e}")
+    return ""
+
+async def get_pdf_context(query: str):
+    """Ambil potongan PDF yang relevan dengan pesan pelanggan"""
+    try:
+        response = await asyncio.to_thread(
+            requests.get, f"{PDF_API_URL}/retrieve", params={"q": query, "k": RETRIEVE_TOP_K}, timeout=10
+        )
+        if response.status_code == 200:
+            chunks = response.json().get("chunks", [])
+            if chunks:
+                # Susun sesuai urutan di dokumen agar konteks tetap runtut
+                return "\n...\n".join(chunk["text"] for chunk in sorted(chunks, key=lambda c: c["position"]))
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Error fetching PDF context: {e}")
+    # Tidak ada yang cocok (mis. salam pembuka): snapshot menu di system prompt sudah cukup
     return ""
 
 async def generate_ai_response(user_message: str, user_phone: str):
-    """Generate response menggunakan OpenAI dengan konteks PDF"""
+    """Generate response menggunakan OpenAI dengan konteks PDF; (teks, pemakaian token)
+
+    System prompt pertama selalu sama persis untuk versi menu yang sama
+    (prefix yang bisa di-cache); data per pesan dikirim di system prompt kedua.
+    """
     try:
-        # Ambil konteks PDF
-        pdf_context = await get_pdf_context()
-        
-        # System prompt untuk WhatsApp bot
-        system_prompt = """Anda adalah Interactive Call Agent AI untuk Warteg OPET yang berkomunikasi melalui WhatsApp. 
-        Selalu merespons dalam bahasa Indonesia dengan ramah dan informatif.
-        
-        FITUR PEMESANAN MAKANAN:
-        Jika pelanggan ingin memesan makanan, bantu mereka dengan menanyakan:
-        1. Nama lengkap
-        2. Email  
-        3. Nomor telepon (sudah ada dari WhatsApp)
-        4. Item yang dipesan (nama, jumlah, harga)
-        5. Waktu pengiriman yang diinginkan
-        6. Alamat pengiriman
-        7. Catatan khusus
+        await get_menu_text()
+        prefix = pdf_text_cache["prefix"]
         
-        Setelah mendapat semua informasi, konfirmasi pesanan dan buat pesanan melalui sistem.
-        """
-        
-        if pdf_context:
-            system_prompt += f"\n\nSumber data dari PDF (MENU MAKANAN):\n{pdf_context}\n\nGunakan informasi menu ini untuk membantu pelanggan memilih makanan dan menghitung total harga pesanan."
+        # Potongan menu yang relevan hanya perlu jika menu tidak muat utuh di prefix
+        pdf_context = None if prefix.menu_complete else await get_pdf_context(user_message)
+        system_prompts = assemble(
+            prefix,
+            f"Bagian menu yang relevan dengan pesan ini:\n{pdf_context}" if pdf_context else None,
+            f"Nomor WhatsApp pelanggan: {user_phone}",
+        )
         
         # Generate response
+        started = time.perf_counter()
         response = openai_client.chat.completions.create(
             model="gpt-4",
             messages=[
-                {"role": "system", "content": system_prompt},
+                *({"role": "system", "content": content} for content in system_prompts),
                 {"role": "user", "content": user_message}
             ],
             max_tokens=500,
             temperature=0.8
         )
+        latency_ms = round((time.perf_counter() - started) * 1000)
+        usage = usage_from_chat(response.usage, prefix.version, latency_ms)
+        if usage:
+            logger.info(
+                f"OpenAI usage for {user_phone}: input={usage['input_tokens']} cached={usage['cached_tokens']} "
+                f"output={usage['output_tokens']} ({latency_ms} ms, prompt {prefix.version})"
+            )
         
-        return response.choices[0].message.content
+        return response.choices[0].message.content, usage
         
     except Exception as e:
         logger.error(f"Error generating AI response: {e}")
-        return "Maaf, saya sedang mengalami gangguan. Silakan coba lagi nanti."
+        return "Maaf, saya sedang mengalami gangguan. Silakan coba lagi nanti.", None
 
 async def send_whatsapp_message(to_number: str, message: str):
     """Kirim pesan WhatsApp"""
@@ -155,6 +201,7 @@ async def verify_webhook(request: Request):
 # Webhook untuk menerima pesan
 @app.post("/webhook")
 async def handle_webhook(request: Request):
+    received = time.perf_counter()
     try:
         body = await request.json()
         logger.info(f"Received webhook: {json.dumps(body, indent=2)}")
@@ -180,27 +227,40 @@ async def handle_webhook(request: Request):
                                         logger.info(f"Received message from {from_number}: {message_text}")
                                         
                                         # Generate AI response
-                                        ai_response = await generate_ai_response(message_text, from_number)
+                                        ai_response, usage = await generate_ai_response(message_text, from_number)
                                         
                                         # Send response
-                                        await send_whatsapp_message(from_number, ai_response)
+                                        sent = await send_whatsapp_message(from_number, ai_response)
+                                        reply_delay = time.perf_counter() - received
+                                        WHATSAPP_REPLY_SECONDS.labels("sent" if sent else "failed").observe(reply_delay)
                                         
                                         # Log conversation
                                         try:
-                                            requests.post("http://127.0.0.1:8001/log-conversation", json={
+                                            user_log = {
                                                 "session_id": f"whatsapp_{from_number}",
                                                 "participant_type": "user",
                                                 "message": message_text,
                                                 "timestamp": datetime.now().isoformat()
-                                            })
+                                            }
+                                            await asyncio.to_thread(
+                                                requests.post, f"{PDF_API_URL}/log-conversation", json=user_log, timeout=10
+                                            )
                                             
-                                            requests.post("http://127.0.0.1:8001/log-conversation", json={
+                                            agent_log = {
                                                 "session_id": f"whatsapp_{from_number}",
                                                 "participant_type": "agent",
                                                 "message": ai_response,
                                                 "timestamp": datetime.now().isoformat()
-                                            })
-                                        except Exception as e:
+                                            }
+                                            if usage:
+                                                agent_log["usage"] = usage
+                                            if sent:
+                                                # Webhook diterima sampai balasan terkirim
+                                                agent_log["response_delay"] = round(reply_delay, 3)
+                                            await asyncio.to_thread(
+                                                requests.post, f"{PDF_API_URL}/log-conversation", json=agent_log, timeout=10
+                                            )
+                                        except requests.RequestException as e:
                                             logger.error(f"Error logging conversation: {e}")
         
         return {"status": "success"}
@@ -0,0 +1,57 @@
+"""Load worker yang dilaporkan ke dispatcher LiveKit.
+
+Load bawaan LiveKit hanya rata-rata CPU. Audio panggilan realtime diproses
+model di server OpenAI, jadi CPU worker bisa tetap rendah padahal jumlah
+session sudah di batas koneksi dan rate limit; sebaliknya job yang
+menumpuk di satu worker tidak terlihat. Load di sini adalah nilai terbesar
+dari ``session aktif / max_sessions`` dan ``CPU / cpu_limit``. Dengan
+``load_threshold=1.0`` worker dianggap penuh tepat saat salah satu habis,
+dan dispatcher mengirim job baru ke worker lain.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+
+from livekit.agents.utils.hw import get_cpu_monitor
+
+logger = logging.getLogger("worker-load")
+
+
+class WorkerLoad:
+    """``load_fnc`` untuk ``WorkerOptions``; CPU diukur di thread terpisah."""
+
+    def __init__(self, max_sessions: int, cpu_limit: float = 0.8, window: int = 5, interval: float = 0.5):
+        self.max_sessions = max(1, max_sessions)
+        self.cpu_limit = cpu_limit
+        self.interval = interval
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_reported = None
+
+    def _sample_cpu(self) -> None:
+        monitor = get_cpu_monitor()
+        while True:
+            value = monitor.cpu_percent(interval=self.interval)
+            with self._lock:
+                self._samples.append(value)
+
+    def cpu(self) -> float:
+        # load_fnc dipanggil dari thread executor; thread sampler dibuat sekali
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_cpu, daemon=True, name="worker_load_cpu")
+                self._thread.start()
+            return sum(self._samples) / len(self._samples) if self._samples else 0.0
+
+    def __call__(self, server) -> float:
+        sessions = len(server.active_jobs)
+        cpu = self.cpu()
+        load = min(1.0, max(sessions / self.max_sessions, cpu / self.cpu_limit))
+        reported = (sessions, round(load, 1))
+        if reported != self._last_reported:
+            logger.info(f"Worker load {load:.2f} (sessions {sessions}/{self.max_sessions}, cpu {cpu:.0%})")
+            self._last_reported = reported
+        return load
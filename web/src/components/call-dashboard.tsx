@@ -41,12 +41,17 @@ export function CallDashboard() {
   const [staffName, setStaffName] = useState("");
   const [takeoverMessage, setTakeoverMessage] = useState("");
   const [isLoaded, setIsLoaded] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
 
-  const fetchLogs = async () => {
+  // Tanpa cursor: muat ulang halaman pertama; dengan cursor: tambahkan halaman berikutnya
+  const fetchLogs = async (cursor?: string) => {
     try {
-      const response = await fetch("http://127.0.0.1:8001/call-logs");
+      const params = new URLSearchParams({ limit: "50" });
+      if (cursor) params.set("cursor", cursor);
+      const response = await fetch(`http://127.0.0.1:8002/call-logs?${params}`);
       const data = await response.json();
-      setLogs(data.logs || []);
+      setLogs((prev) => (cursor ? [...prev, ...(data.logs || [])] : data.logs || []));
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error("Error fetching logs:", error);
     }
@@ -54,7 +59,7 @@ export function CallDashboard() {
 
   const fetchActiveSessions = async () => {
     try {
-      const response = await fetch("http://127.0.0.1:8001/active-sessions");
+      const response = await fetch("http://127.0.0.1:8002/active-sessions");
       const data = await response.json();
       setActiveSessions(data.sessions || []);
     } catch (error) {
@@ -69,7 +74,7 @@ export function CallDashboard() {
     }
     
     try {
-      const response = await fetch("http://127.0.0.1:8001/staff-takeover", {
+      const response = await fetch("http://127.0.0.1:8002/staff-takeover", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -91,7 +96,7 @@ export function CallDashboard() {
 
   const fetchLogDetail = async (sessionId: string) => {
     try {
-      const response = await fetch(`http://127.0.0.1:8001/call-logs/${sessionId}`);
+      const response = await fetch(`http://127.0.0.1:8002/call-logs/${sessionId}`);
       const data = await response.json();
       setSelectedLog(data);
       setIsDetailOpen(true);
@@ -220,6 +225,11 @@ export function CallDashboard() {
                       </div>
                     </div>
                   ))}
+                  {nextCursor && (
+                    <Button variant="outline" size="sm" className="w-full" onClick={() => fetchLogs(nextCursor)}>
+                      Muat lebih banyak
+                    </Button>
+                  )}
                 </div>
               )}
           </TabsContent>
@@ -30,7 +30,7 @@ export function FoodOrderManager() {
 
   const fetchOrders = async () => {
     try {
-      const response = await fetch("http://127.0.0.1:8001/food-orders");
+      const response = await fetch("http://127.0.0.1:8002/food-orders");
       if (response.ok) {
         const data = await response.json();
         setOrders(data.orders);
@@ -44,8 +44,12 @@ export function FoodOrderManager() {
 
   useEffect(() => {
     fetchOrders();
-    const interval = setInterval(fetchOrders, 30000); // Refresh every 30 seconds
-    return () => clearInterval(interval);
+    // Refresh only when the backend pushes an order change
+    const events = new EventSource("http://127.0.0.1:8002/events");
+    ["order_updated", "reset"].forEach((type) =>
+      events.addEventListener(type, fetchOrders)
+    );
+    return () => events.close();
   }, []);
 
   const formatDateTime = (isoString: string) => {
@@ -61,7 +65,7 @@ export function FoodOrderManager() {
 
   const updateOrderStatus = async (orderId: string, status: string, message: string = "") => {
     try {
-      const response = await fetch("http://127.0.0.1:8001/update-order-status", {
+      const response = await fetch("http://127.0.0.1:8002/update-order-status", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -75,8 +75,25 @@ export function PdfUploader({ onPdfSelected }: { onPdfSelected?: () => void } =
         });
         const data = await res.json();
         if (res.ok && data.success) {
-          setUploadStatus("✅ Upload & OCR berhasil!");
-          setSelectedFile(null);
+          // OCR runs as a background job; follow it until it finishes
+          let job = data;
+          while (job.status === "queued" || job.status === "running") {
+            setUploadStatus(
+              job.pages_total
+                ? `⏳ Memproses OCR... ${job.pages_done}/${job.pages_total} halaman`
+                : "⏳ Memproses PDF..."
+            );
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+            const jobRes = await fetch(`${backendUrl}/ingest-jobs/${data.job_id}`);
+            if (!jobRes.ok) break;
+            job = await jobRes.json();
+          }
+          if (job.status === "completed") {
+            setUploadStatus("✅ Upload & OCR berhasil!");
+            setSelectedFile(null);
+          } else {
+            setUploadStatus(`❌ Upload atau OCR gagal: ${job.error || "Unknown error"}`);
+          }
           fetchPdfs(); // Refresh list
         } else {
           setUploadStatus(`❌ Upload atau OCR gagal: ${data.error || "Unknown error"}`);
@@ -30,15 +30,35 @@ export function RealtimeChat({ sessionId, isVisible, onToggle }: RealtimeChatPro
     scrollToBottom();
   }, [messages]);
 
-  // Poll for new messages
+  // Load messages, then follow pushed updates
   useEffect(() => {
     if (!sessionId || !isVisible) return;
 
+    // Only fetch messages after the last seq we have seen. One fetch runs at a
+    // time; events that arrive meanwhile trigger a single follow-up fetch, so
+    // the same range is never appended twice.
+    let nextSeq = 0;
+    let inFlight = false;
+    let pending = false;
+    let resetPending = false;
     const pollMessages = async () => {
+      if (inFlight) {
+        pending = true;
+        return;
+      }
+      inFlight = true;
       try {
-        const response = await fetch(`http://127.0.0.1:8002/call-logs/${sessionId}`);
-        if (response.ok) {
+        do {
+          pending = false;
+          if (resetPending) {
+            resetPending = false;
+            nextSeq = 0;
+          }
+          const afterSeq = nextSeq;
+          const response = await fetch(`http://127.0.0.1:8002/call-logs/${sessionId}?after_seq=${afterSeq}`);
+          if (!response.ok) break;
           const data = await response.json();
+          nextSeq = data.next_seq;
           const chatMessages = data.messages
             .filter((msg: any) => msg.type.startsWith("chat_"))
             .map((msg: any) => ({
@@ -47,17 +67,26 @@ export function RealtimeChat({ sessionId, isVisible, onToggle }: RealtimeChatPro
               message: msg.message,
               timestamp: msg.timestamp,
             }));
-          setMessages(chatMessages);
-        }
+          setMessages((prev) => (afterSeq === 0 ? chatMessages : [...prev, ...chatMessages]));
+        } while (pending);
       } catch (error) {
         console.error("Error polling messages:", error);
+      } finally {
+        inFlight = false;
       }
     };
 
-    const interval = setInterval(pollMessages, 2000); // Poll every 2 seconds
+    const reload = () => {
+      resetPending = true;
+      pollMessages();
+    };
+
     pollMessages(); // Initial load
+    const events = new EventSource(`http://127.0.0.1:8002/events?session_id=${encodeURIComponent(sessionId)}`);
+    events.addEventListener("message_appended", pollMessages);
+    ["message_edited", "reset"].forEach((type) => events.addEventListener(type, reload));
 
-    return () => clearInterval(interval);
+    return () => events.close();
   }, [sessionId, isVisible]);
 
   const sendMessage = async () => {
@@ -33,8 +33,12 @@ export function StaffTakeover() {
 
   useEffect(() => {
     fetchRequests();
-    const interval = setInterval(fetchRequests, 5000);
-    return () => clearInterval(interval);
+    // Refresh only when the backend pushes a relevant change
+    const events = new EventSource("http://127.0.0.1:8002/events");
+    ["takeover_requested", "status_changed", "reset"].forEach((type) =>
+      events.addEventListener(type, fetchRequests)
+    );
+    return () => events.close();
   }, []);
 
   const handleTakeover = async (request: TakeoverRequest) => {
@@ -28,8 +28,12 @@ export function SystemStatus() {
     };
 
     fetchStats();
-    const interval = setInterval(fetchStats, 5000);
-    return () => clearInterval(interval);
+    // Refresh only when a session starts or changes status
+    const events = new EventSource("http://127.0.0.1:8002/events");
+    ["session_started", "status_changed", "reset"].forEach((type) =>
+      events.addEventListener(type, fetchStats)
+    );
+    return () => events.close();
   }, []);
 
   return (
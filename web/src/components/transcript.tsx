@@ -35,6 +35,8 @@ export function Transcript({
       if (response.ok) {
         // Refresh transcript data
         window.location.reload();
+      } else if (response.status === 409) {
+        alert("Pesan sudah diubah oleh orang lain, muat ulang untuk melihat versi terbaru");
       } else {
         alert("Failed to save edit");
       }
@@ -69,12 +71,31 @@ export function Transcript({
   useEffect(() => {
     if (!sessionId) return;
 
+    // Only fetch messages after the last seq we have seen; one fetch at a
+    // time, with events during a fetch collapsed into a single follow-up
+    let nextSeq = 0;
+    let inFlight = false;
+    let pending = false;
+    let resetPending = false;
     const pollChatMessages = async () => {
+      if (inFlight) {
+        pending = true;
+        return;
+      }
+      inFlight = true;
       try {
         const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8002';
-        const response = await fetch(`${backendUrl}/call-logs/${sessionId}`);
-        if (response.ok) {
+        do {
+          pending = false;
+          if (resetPending) {
+            resetPending = false;
+            nextSeq = 0;
+          }
+          const afterSeq = nextSeq;
+          const response = await fetch(`${backendUrl}/call-logs/${sessionId}?after_seq=${afterSeq}`);
+          if (!response.ok) break;
           const data = await response.json();
+          nextSeq = data.next_seq;
           const messages = data.messages
             .filter((msg: any) => msg.type.startsWith("chat_"))
             .map((msg: any) => ({
@@ -84,16 +105,26 @@ export function Transcript({
               timestamp: msg.timestamp,
               isChat: true
             }));
-          setChatMessages(messages);
-        }
+          setChatMessages((prev) => (afterSeq === 0 ? messages : [...prev, ...messages]));
+        } while (pending);
       } catch (error) {
         console.error("Error polling chat messages:", error);
+      } finally {
+        inFlight = false;
       }
     };
 
-    const interval = setInterval(pollChatMessages, 2000);
+    const reload = () => {
+      resetPending = true;
+      pollChatMessages();
+    };
+
     pollChatMessages();
-    return () => clearInterval(interval);
+    const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8002';
+    const events = new EventSource(`${backendUrl}/events?session_id=${encodeURIComponent(sessionId)}`);
+    events.addEventListener("message_appended", pollChatMessages);
+    ["message_edited", "reset"].forEach((type) => events.addEventListener(type, reload));
+    return () => events.close();
   }, [sessionId]);
 
   useEffect(() => {